@@ -0,0 +1,102 @@
+#! /usr/bin/python3
+"""
+Benchmark of loading a large fleet.
+Generates a synthetic configuration of many devices (containers included),
+loads all of them and reports the time, the memory used and the attribute access cost.
+
+Usage: python benchmarks/bench_fleet.py [number of devices]
+"""
+from __future__ import annotations  # python -3.9 compatibility
+
+import json
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+from pathlib import Path
+
+DEVICE_COUNT: int = 10_000
+NETWORKS: list[dict] = [
+    {"name": "home", "ip_start": "10.1."},
+    {"name": "vpn", "ip_start": "10.2.", "interface": "wg0", "vpn": True},
+    {"name": "public", "public": True},
+]
+
+
+def generate_config(config_dir: Path, count: int):
+    """
+    Write a synthetic configuration
+    :param config_dir: The configuration directory
+    :param count: The number of devices
+    """
+    devices_dir = config_dir / "devices"
+    networks_dir = config_dir / "networks"
+    devices_dir.mkdir(parents=True)
+    networks_dir.mkdir(parents=True)
+    (networks_dir / "networks.json").write_text(json.dumps(NETWORKS), encoding="utf-8")
+
+    for index in range(count):
+        host = f"{index // 250}.{index % 250 + 1}"
+        device_config = {
+            "hostname": f"host{index}",
+            "sync": "limited" if index % 10 == 0 else False,
+            "container_hostnames": [f"host{index}-container"],
+            "interfaces": [{"name": "eth0", "mac": f"02:00:00:00:{host}"}],
+            "connections": [
+                {"network": "home", "ip_address": f"10.1.{host}"},
+                {"network": "vpn", "ip_address": f"10.2.{host}"},
+                {"network": "public", "ip_address": f"host{index}.example.com"},
+            ],
+        }
+        (devices_dir / f"device{index}.json").write_text(
+            json.dumps(device_config), encoding="utf-8"
+        )
+
+
+def main(count: int):
+    """Run the benchmark"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_dir = Path(tmp_dir) / "config"
+        generate_config(config_dir, count)
+
+        # The configuration directory has to be set before the other modules are imported
+        import sshtools.tools  # pylint: disable=import-outside-toplevel
+
+        sshtools.tools.CONFIG_DIR = config_dir
+        sshtools.tools.CACHE_DIR = Path(tmp_dir) / "cache"
+        import sshtools.device  # pylint: disable=import-outside-toplevel
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        devices = sshtools.device.DeviceConfig.get_devices()
+        load_time = time.perf_counter() - start
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        addresses = [
+            ip_address
+            for device in devices
+            for ip_address in device.ip_address_list_all.list
+        ]
+
+        def access():
+            for device in devices:
+                _ = device.name, device.hostname, device.config.sync
+            for ip_address in addresses:
+                _ = ip_address.ip_address, ip_address.config.network
+
+        access_time = min(timeit.repeat(access, number=1, repeat=5))
+        configs = {id(ip_address.config) for ip_address in addresses}
+
+    print(f"devices:           {len(devices)}")
+    print(f"ip addresses:      {len(addresses)}")
+    print(f"distinct configs:  {len(configs)}")
+    print(f"load time:         {load_time * 1000:.0f} ms")
+    print(f"memory:            {memory / 1024 ** 2:.1f} MiB")
+    print(f"memory per device: {memory / len(devices):.0f} B")
+    print(f"attribute access:  {access_time / len(addresses) * 1e9:.0f} ns per address")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEVICE_COUNT)
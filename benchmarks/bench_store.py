@@ -0,0 +1,99 @@
+#! /usr/bin/python3
+"""
+Benchmark of the configuration backends.
+Compares looking up a single device and loading the whole fleet
+from the directories with a file per device and from the configuration database.
+Every measurement runs in a fresh interpreter, like a command line tool would.
+
+Usage: python benchmarks/bench_store.py [number of devices]
+"""
+from __future__ import annotations  # python -3.9 compatibility
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from bench_fleet import DEVICE_COUNT, generate_config
+
+REPEAT: int = 3
+MEASURE = """
+import json, sys, time
+from pathlib import Path
+import sshtools.tools
+sshtools.tools.CONFIG_DIR = Path(sys.argv[1])
+sshtools.tools.CACHE_DIR = Path(sys.argv[2])
+import sshtools.device
+start = time.perf_counter()
+if sys.argv[3] == "single":
+    sshtools.device.DeviceConfig.get_device(sys.argv[4])
+else:
+    sshtools.device.DeviceConfig.get_devices()
+print(json.dumps(time.perf_counter() - start))
+"""
+
+
+def measure(  # pylint: disable=too-many-arguments
+    config_dir: Path, cache_dir: Path, mode: str, hostname: str, cold: bool
+) -> float:
+    """
+    Returns the fastest time of a lookup in a fresh interpreter
+    :param mode: 'single' to look up one device, 'all' to load the whole fleet
+    :param cold: Remove the cache (and thus the configuration snapshot) before every run
+    """
+    env = dict(os.environ, SSHTOOLS_NO_DAEMON="1")
+    times = []
+    for _ in range(REPEAT):
+        if cold:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        result = subprocess.run(
+            [sys.executable, "-c", MEASURE, str(config_dir), str(cache_dir)]
+            + [mode, hostname],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        times.append(json.loads(result.stdout.splitlines()[-1]))
+    return min(times)
+
+
+def main(count: int):
+    """Run the benchmark"""
+    import sshtools.store  # pylint: disable=import-outside-toplevel
+
+    hostname = f"host{count // 2}"
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dirs_config = Path(tmp_dir) / "dirs"
+        generate_config(dirs_config, count)
+        store_config = Path(tmp_dir) / "store"
+        store_config.mkdir()
+        sshtools.store.import_directories(
+            store_config / sshtools.store.STORE_NAME,
+            dirs_config / "devices",
+            dirs_config / "networks",
+        )
+        cache_dir = Path(tmp_dir) / "cache"
+
+        print(f"{count} devices, times in ms (fastest of {REPEAT})")
+        print(f"{'backend':<22} {'single':>8} {'all':>8}")
+        for backend, config_dir, warm in [
+            ("directories (cold)", dirs_config, False),
+            ("directories (warm)", dirs_config, True),
+            ("database", store_config, False),
+        ]:
+            # A warm run first stores the snapshot of the whole fleet
+            if warm:
+                measure(config_dir, cache_dir, "all", hostname, cold=True)
+            results = [
+                measure(config_dir, cache_dir, mode, hostname, cold=not warm) * 1000
+                for mode in ["single", "all"]
+            ]
+            print(f"{backend:<22} {results[0]:8.0f} {results[1]:8.0f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEVICE_COUNT)
@@ -1,9 +1,15 @@
 """Package for connecting to and interacting with devices over the network"""
 from __future__ import annotations
 
-import platform
+import sys
 
-import timtools.log
+# Imported first, so the import time of everything else can be measured
+import sshtools.profiling
+
+if sshtools.profiling.is_requested():
+    sshtools.profiling.enable()
+
+import timtools.log  # noqa: E402 pylint: disable=wrong-import-position,wrong-import-order
 
 logger = timtools.log.get_logger(__name__)
-logger.debug("Python version: %s", platform.python_version())
+logger.debug("Python version: %s", sys.version.split(maxsplit=1)[0])
@@ -0,0 +1,87 @@
+"""Module for remembering which addresses keep failing to answer"""
+from __future__ import annotations  # python -3.9 compatibility
+
+import functools
+import time
+
+import timtools.log
+
+import sshtools.cache
+
+logger = timtools.log.get_logger("sshtools.backoff")
+
+FAILURE_CACHE_NAME: str = "failures"
+FAILURE_LIFETIME: float = 30 * 24 * 60 * 60
+# Number of consecutive failures after which an address is backed off
+FAILURE_THRESHOLD: int = 3
+BACKOFF_BASE: float = 60
+BACKOFF_MAX: float = 24 * 60 * 60
+
+
+class FailureHistory:
+    """
+    Keeps track of consecutive probe failures per address.
+    Addresses that fail repeatedly are backed off exponentially,
+    so they can be skipped in the foreground and only be probed opportunistically.
+    """
+
+    _cache: sshtools.cache.ProbeCache
+
+    def __init__(self, cache: sshtools.cache.ProbeCache):
+        self._cache = cache
+
+    def get_failures(self, address: str) -> tuple[int, float]:
+        """
+        Returns the number of consecutive failures of an address
+        and the time of the last one
+        :param address: The ip address or hostname
+        """
+        entry = self._cache.get(address, max_age=FAILURE_LIFETIME)
+        if entry is None:
+            return 0, 0
+        return entry["failures"], entry["last"]
+
+    def record_failure(self, address: str):
+        """
+        Remember that an address did not answer
+        :param address: The ip address or hostname
+        """
+        failures, _ = self.get_failures(address)
+        self._cache.put(address, {"failures": failures + 1, "last": time.time()})
+        if failures + 1 == FAILURE_THRESHOLD:
+            logger.debug("%s failed %d times, backing off", address, failures + 1)
+
+    def record_success(self, address: str):
+        """
+        Remember that an address answered
+        :param address: The ip address or hostname
+        """
+        failures, _ = self.get_failures(address)
+        if failures > 0:
+            self._cache.put(address, {"failures": 0, "last": 0})
+
+    @staticmethod
+    def get_backoff(failures: int) -> float:
+        """
+        Returns the number of seconds an address is backed off after a number of failures
+        :param failures: The number of consecutive failures
+        """
+        if failures < FAILURE_THRESHOLD:
+            return 0
+        return min(BACKOFF_BASE * 2 ** (failures - FAILURE_THRESHOLD), BACKOFF_MAX)
+
+    def is_backed_off(self, address: str) -> bool:
+        """
+        Should probing an address be avoided in the foreground?
+        :param address: The ip address or hostname
+        """
+        failures, last_failure = self.get_failures(address)
+        return time.time() - last_failure < self.get_backoff(failures)
+
+
+@functools.lru_cache(maxsize=None)
+def get_history() -> FailureHistory:
+    """Returns the failure history of this machine"""
+    return FailureHistory(
+        sshtools.cache.get_cache(FAILURE_CACHE_NAME, lifetime=FAILURE_LIFETIME)
+    )
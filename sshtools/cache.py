@@ -0,0 +1,226 @@
+"""Module for caching probe results across invocations"""
+from __future__ import annotations  # python -3.9 compatibility
+
+import atexit
+import fcntl
+import functools
+import json
+import os
+import threading
+import time
+import typing
+from pathlib import Path
+
+import cachetools
+import timtools.log
+
+import sshtools.tools
+
+logger = timtools.log.get_logger("sshtools.cache")
+
+PROBE_CACHE_NAME: str = "probes"
+CACHE_ENTRY_LIFETIME: float = 24 * 60 * 60
+
+
+class ProbeCache:
+    """
+    A cache for probe results. Results are kept in memory for IP_CACHE_TIMEOUT seconds
+    and are stored on disk, so other processes can use them when they accept their age.
+    Results are written to disk in batches by flush (at the end of a probe cycle and at exit).
+    """
+
+    path: Path
+    lifetime: float
+    _memory: cachetools.TTLCache
+    _pending: dict[str, dict]
+    _disk: tuple[typing.Optional[tuple[int, int, int]], dict[str, dict]]
+    _lock: threading.Lock
+
+    def __init__(self, path: Path, lifetime: float = CACHE_ENTRY_LIFETIME):
+        self.path = path
+        self.lifetime = lifetime
+        self._memory = cachetools.TTLCache(
+            maxsize=4096, ttl=sshtools.tools.IP_CACHE_TIMEOUT
+        )
+        self._pending = {}
+        self._disk = (None, {})
+        self._lock = threading.Lock()
+
+    @property
+    def _lock_path(self) -> Path:
+        return self.path.with_suffix(".lock")
+
+    def get(self, key: str, max_age: float = None) -> typing.Any:
+        """
+        Get a cached value
+        :param key: The key of the value
+        :param max_age:
+            The maximum age in seconds of a value stored by another process
+            (defaults to sshtools.tools.PROBE_MAX_AGE)
+        :return: The cached value or None if there is no (recent enough) value
+        """
+        with self._lock:
+            if key in self._memory:
+                return self._memory[key]
+
+        if max_age is None:
+            max_age = sshtools.tools.PROBE_MAX_AGE
+        if max_age <= 0:
+            return None
+
+        with self._lock:
+            entry = self._pending.get(key)
+        if entry is None:
+            entry = self._read().get(key)
+        if entry is None or time.time() - entry["time"] > max_age:
+            return None
+
+        logger.debug("Using cached value for %s from disk", key)
+        with self._lock:
+            self._memory[key] = entry["value"]
+        return entry["value"]
+
+    def put(self, key: str, value: typing.Any, persist: bool = True):
+        """
+        Store a value in the cache
+        :param key: The key of the value
+        :param value: A JSON serializable value
+        :param persist: Also store the value on disk for other processes
+        """
+        self.put_many({key: value}, persist=persist)
+
+    def put_many(self, values: dict[str, typing.Any], persist: bool = True):
+        """
+        Store values in the cache
+        :param values: JSON serializable values by their key
+        :param persist: Also store the values on disk (when the cache is flushed)
+        """
+        with self._lock:
+            self._memory.update(values)
+            if persist:
+                self._pending.update(
+                    {key: self._entry(value) for key, value in values.items()}
+                )
+
+    def flush(self):
+        """Write the values that were stored since the last flush to disk"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if pending:
+            self._update(lambda entries: entries.update(pending))
+
+    def invalidate(self, prefix: str = ""):
+        """
+        Remove values from the cache
+        :param prefix: Only remove the values whose key starts with this prefix
+        """
+        with self._lock:
+            for key in [key for key in self._memory if key.startswith(prefix)]:
+                del self._memory[key]
+            for key in [key for key in self._pending if key.startswith(prefix)]:
+                del self._pending[key]
+
+        def remove_keys(entries: dict):
+            for key in [key for key in entries if key.startswith(prefix)]:
+                del entries[key]
+
+        self._update(remove_keys)
+
+    def remove(self, keys: typing.Iterable[str]):
+        """
+        Remove values from the cache
+        :param keys: The keys of the values
+        """
+        keys = set(keys)
+        with self._lock:
+            for key in keys & set(self._memory):
+                del self._memory[key]
+            for key in keys & set(self._pending):
+                del self._pending[key]
+
+        def remove_keys(entries: dict):
+            for key in keys & set(entries):
+                del entries[key]
+
+        self._update(remove_keys)
+
+    @staticmethod
+    def _entry(value: typing.Any) -> dict:
+        return {"time": time.time(), "value": value}
+
+    def _read(self) -> dict[str, dict]:
+        """
+        Read the entries stored on disk (the file is only parsed again after it was replaced)
+        :return: The entries, which should not be modified
+        """
+        try:
+            stat = self.path.stat()
+            signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            with self._lock:
+                if self._disk[0] == signature:
+                    return self._disk[1]
+            with open(self.path, "r", encoding="utf-8") as cache_file:
+                entries = json.load(cache_file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as error:
+            logger.debug("Could not read the probe cache %s: %s", self.path, error)
+            return {}
+
+        with self._lock:
+            self._disk = (signature, entries)
+        return entries
+
+    def _update(self, update: typing.Callable[[dict], None]):
+        """
+        Update the entries stored on disk while holding an exclusive lock,
+        so concurrent processes do not overwrite each other's results
+        :param update: A function that modifies the entries in place
+        """
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self._lock_path, "a", encoding="utf-8") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                entries = dict(self._read())
+                update(entries)
+
+                now = time.time()
+                entries = {
+                    key: entry
+                    for key, entry in entries.items()
+                    if now - entry["time"] < self.lifetime
+                }
+
+                # Replace the file atomically, so readers never see a partial file
+                tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+                with open(tmp_path, "w", encoding="utf-8") as tmp_file:
+                    json.dump(entries, tmp_file)
+                os.replace(tmp_path, self.path)
+        except OSError as error:
+            logger.debug("Could not update the probe cache %s: %s", self.path, error)
+
+
+_caches: list[ProbeCache] = []
+
+
+@functools.lru_cache(maxsize=None)
+def get_cache(
+    name: str = PROBE_CACHE_NAME, lifetime: float = CACHE_ENTRY_LIFETIME
+) -> ProbeCache:
+    """
+    Returns a cache of this process
+    :param name: The name of the cache (and its file in the cache directory)
+    :param lifetime: The number of seconds after which entries are removed from disk
+    """
+    cache = ProbeCache(sshtools.tools.CACHE_DIR / f"{name}.json", lifetime=lifetime)
+    _caches.append(cache)
+    return cache
+
+
+def flush_all():
+    """Write the pending values of every cache of this process to disk"""
+    for cache in list(_caches):
+        cache.flush()
+
+
+atexit.register(flush_all)
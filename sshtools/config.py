@@ -2,16 +2,19 @@
 from __future__ import annotations
 
 import dataclasses
+import threading
 import typing
 
 if typing.TYPE_CHECKING:
     import sshtools.connection
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(frozen=True)
 class ConnectionConfig:
     """Configuration of a Connection"""
 
+    __slots__ = ("sync", "ssh", "ssh_port", "mosh", "user", "priority")
+
     sync: typing.Union[bool, str]
     ssh: bool
     ssh_port: int
@@ -20,9 +23,41 @@ class ConnectionConfig:
     priority: int
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(frozen=True)
+class FleetEntry:
+    """The fields of a device needed to filter the fleet, known without constructing it"""
+
+    __slots__ = ("name", "is_main_device", "is_super", "sync", "ssh", "networks")
+
+    name: str
+    is_main_device: bool
+    is_super: bool
+    sync: typing.Union[bool, str]
+    ssh: bool
+    networks: frozenset[str]
+
+
+@dataclasses.dataclass(frozen=True)
 class IPConnectionConfig(ConnectionConfig):
     """Configuration of an IPConnectionConfig"""
 
+    __slots__ = ("network", "check_online")
+
     network: "sshtools.connection.Network"
     check_online: bool
+
+
+ConfigT = typing.TypeVar("ConfigT", ConnectionConfig, IPConnectionConfig)
+# Held while the configuration of a running process is changed,
+# readers that hold it never see a partially applied change
+CONFIG_LOCK: threading.RLock = threading.RLock()
+_shared_configs: dict[ConnectionConfig, ConnectionConfig] = {}
+
+
+def get_shared(config: ConfigT) -> ConfigT:
+    """
+    Returns a shared instance of an (immutable) configuration,
+    so the many connections with the same configuration use a single object
+    :param config: The configuration
+    """
+    return _shared_configs.setdefault(config, config)
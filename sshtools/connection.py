@@ -1,16 +1,22 @@
 """Module for handling networks"""
 from __future__ import annotations  # python -3.9 compatibility
 
-import json
+import ipaddress
+import re
+import threading
 import typing
 from pathlib import Path
 
-import psutil
 import timtools.log
 
+import sshtools.cache
+import sshtools.config
 import sshtools.errors
 import sshtools.interface
 import sshtools.ip
+import sshtools.netstate
+import sshtools.snapshot
+import sshtools.store
 import sshtools.tools
 
 if typing.TYPE_CHECKING:
@@ -19,19 +25,179 @@ if typing.TYPE_CHECKING:
 logger = timtools.log.get_logger("sshtools.connection")
 
 NETWORK_DIR: Path = sshtools.tools.CONFIG_DIR / "networks"
+RTT_CACHE_NAME: str = "rtt"
+RTT_LIFETIME: float = 30 * 24 * 60 * 60
+
+IPNetwork = typing.Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+def parse_prefix(net_config: dict) -> typing.Optional[IPNetwork]:
+    """
+    Returns the prefix of a network
+    :param net_config:
+        The configuration of the network, with a 'prefix' (e.g. 1.1.1.0/24 or fd00::/64)
+        or an 'ip_start' consisting of whole octets (e.g. 1.1.1.)
+    :raises ConfigError: When the prefix or ip_start is not a valid network
+    :return: The prefix or None if the network has no prefix that can be expressed in CIDR
+    """
+    if net_config.get("prefix") is not None:
+        prefix = net_config["prefix"]
+    else:
+        ip_start = net_config.get("ip_start")
+        if ip_start is None or not re.match(r"^(\d{1,3}\.){1,3}$", ip_start):
+            return None
+        octets = ip_start.split(".")[:-1]
+        address = ".".join(octets + ["0"] * (4 - len(octets)))
+        prefix = f"{address}/{8 * len(octets)}"
+
+    try:
+        # Host bits are allowed, so 1.1.1.1/24 is the same network as 1.1.1.0/24
+        return ipaddress.ip_network(prefix, strict=False)
+    except ValueError as error:
+        logger.error(
+            "Invalid prefix %s of network %s: %s", prefix, net_config.get("name"), error
+        )
+        raise sshtools.errors.ConfigError(
+            net_config.get("name"), kind="Network"
+        ) from error
+
+
+class PrefixIndex:
+    """Finds the longest prefix that contains an ip address (a binary radix tree per IP version)"""
+
+    # Every node is a list of the child for a 0 bit, the child for a 1 bit and the value
+    _roots: dict[int, list]
+
+    def __init__(self):
+        self._roots = {4: [None, None, None], 6: [None, None, None]}
 
+    def insert(self, prefix: IPNetwork, value: typing.Any):
+        """
+        Add a prefix to the index (the first value of a prefix is kept)
+        :param prefix: The prefix
+        :param value: The value to return for the addresses in the prefix
+        """
+        node = self._roots[prefix.version]
+        bits = int(prefix.network_address)
+        for position in range(prefix.prefixlen):
+            bit = (bits >> (prefix.max_prefixlen - 1 - position)) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, None]
+            node = node[bit]
+        if node[2] is None:
+            node[2] = value
+
+    def lookup(
+        self, address: typing.Union[ipaddress.IPv4Address, ipaddress.IPv6Address]
+    ) -> typing.Any:
+        """
+        Returns the value of the longest prefix that contains an ip address
+        :param address: The ip address
+        :return: The value or None if no prefix contains the ip address
+        """
+        node = self._roots[address.version]
+        value = node[2]
+        bits = int(address)
+        for position in range(address.max_prefixlen):
+            node = node[(bits >> (address.max_prefixlen - 1 - position)) & 1]
+            if node is None:
+                break
+            if node[2] is not None:
+                value = node[2]
+        return value
+
+
+class RttEstimator:
+    """Estimates the round trip time of a network from observed samples (RFC 6298)"""
+
+    __slots__ = ("srtt", "rttvar", "samples", "_lock")
+
+    alpha: float = 1 / 8
+    beta: float = 1 / 4
+
+    srtt: typing.Optional[float]
+    rttvar: typing.Optional[float]
+    samples: int
+    _lock: threading.Lock
+
+    def __init__(
+        self,
+        srtt: typing.Optional[float] = None,
+        rttvar: typing.Optional[float] = None,
+        samples: int = 0,
+    ):
+        self.srtt = srtt
+        self.rttvar = rttvar
+        self.samples = samples
+        self._lock = threading.Lock()
+
+    def add_sample(self, rtt: float):
+        """
+        Update the estimation with an observed round trip time (probes report concurrently)
+        :param rtt: The round trip time in seconds
+        """
+        with self._lock:
+            if self.srtt is None or self.rttvar is None:
+                self.srtt = rtt
+                self.rttvar = rtt / 2
+            else:
+                self.rttvar = (1 - self.beta) * self.rttvar + self.beta * abs(
+                    self.srtt - rtt
+                )
+                self.srtt = (1 - self.alpha) * self.srtt + self.alpha * rtt
+            self.samples += 1
 
-class Network:
+    @property
+    def timeout(self) -> typing.Optional[float]:
+        """
+        The time in seconds after which a reply is no longer expected
+        (None if not enough samples have been observed)
+        """
+        with self._lock:
+            if self.samples < sshtools.tools.RTT_MIN_SAMPLES or self.srtt is None:
+                return None
+            return self.srtt + 4 * self.rttvar
+
+    def to_dict(self) -> dict:
+        """Returns a JSON serializable representation"""
+        with self._lock:
+            return {"srtt": self.srtt, "rttvar": self.rttvar, "samples": self.samples}
+
+
+class Network:  # pylint:disable=too-many-instance-attributes
     """A network"""
 
+    __slots__ = (
+        "name",
+        "is_vpn",
+        "is_public",
+        "ip_start",
+        "prefix",
+        "interface",
+        "priority",
+        "_ping_timeout",
+        "_ssh_timeout",
+    )
+
     __instances: dict[str, Network] = {}
     __config_all: dict[str, dict] = {}
+    __rtt_estimators: dict[str, RttEstimator] = {}
+    __rtt_lock = threading.Lock()
+    # The index is rebuilt when the configuration it was built from is replaced
+    __prefix_index: tuple[typing.Optional[dict], PrefixIndex, list[Network]] = (
+        None,
+        PrefixIndex(),
+        [],
+    )
     name: str
     is_vpn: bool
     is_public: bool
     ip_start: str
+    prefix: typing.Optional[IPNetwork]
     interface: str
     priority: int
+    _ping_timeout: typing.Optional[float]
+    _ssh_timeout: typing.Optional[float]
 
     def __init__(self, name: str):
         self.name = name
@@ -43,7 +209,10 @@ class Network:
         self.is_vpn = net_config.get("vpn", False)
         self.is_public = net_config.get("public", False)
         self.ip_start = net_config.get("ip_start", None)
+        self.prefix = parse_prefix(net_config)
         self.interface = net_config.get("interface", None)
+        self._ping_timeout = net_config.get("ping_timeout", None)
+        self._ssh_timeout = net_config.get("ssh_timeout", None)
 
         default_priority = 80
         if self.is_public:
@@ -69,13 +238,45 @@ class Network:
         TODO: use @property when python >=3.9 can be ensured
         """
         if not cls.__config_all:
-            cls.__config_all = {}
-            for net_list_file in NETWORK_DIR.iterdir():
-                net_list_config = json.load(net_list_file.open("r"))
-                for net_config in net_list_config:
-                    cls.__config_all[net_config["name"]] = net_config
+            store = sshtools.store.get_store()
+            if store is not None:
+                cls.__config_all = store.get_networks()
+            else:
+                cls.__config_all = sshtools.snapshot.get_snapshot().networks
         return cls.__config_all
 
+    @classmethod
+    def get_configs(cls) -> dict[str, dict]:
+        """Return the config of every network"""
+        return cls._get_config_all()
+
+    @classmethod
+    def update_configs(cls, changes: dict[str, typing.Optional[dict]]):
+        """
+        Apply changes to the configuration and rebuild the changed networks
+        :param changes: The new configuration of every changed network (None if removed)
+        """
+        with sshtools.config.CONFIG_LOCK:
+            config_all = dict(cls._get_config_all())
+            for name, config in changes.items():
+                if config is None:
+                    config_all.pop(name, None)
+                    cls.__instances.pop(name, None)
+                else:
+                    config_all[name] = config
+            cls.__config_all = config_all
+            if sshtools.store.get_store() is None:
+                sshtools.snapshot.get_snapshot().update(networks=config_all)
+
+            # Creating an existing network initializes the same instance again
+            for name, config in changes.items():
+                if config is not None and name in cls.__instances:
+                    try:
+                        Network(name)
+                    except sshtools.errors.ErrorHandler as error:
+                        logger.warning("Could not rebuild network %s: %s", name, error)
+                        cls.__instances.pop(name, None)
+
     @property
     def is_connected(self) -> bool:
         """Is this device connected to this device?"""
@@ -83,17 +284,70 @@ class Network:
         if self.name == "public":
             return True
 
-        if self.ip_start is not None:
+        if self.ip_start is not None or self.prefix is not None:
             if any(self.has_ip_address(ip_address) for ip_address in ip_list):
                 return True
 
-        interfaces = psutil.net_if_addrs().keys()
+        interfaces = sshtools.netstate.get_state().interfaces
         if self.interface is not None:
             if self.interface in interfaces:
                 return True
 
         return False
 
+    @property
+    def rtt(self) -> RttEstimator:
+        """The estimation of the round trip time in this network"""
+        with self.__rtt_lock:
+            if self.name not in self.__rtt_estimators:
+                stored = sshtools.cache.get_cache(
+                    RTT_CACHE_NAME, lifetime=RTT_LIFETIME
+                ).get(self.name, max_age=RTT_LIFETIME)
+                self.__rtt_estimators[self.name] = RttEstimator(**(stored or {}))
+            return self.__rtt_estimators[self.name]
+
+    def record_rtt(self, latency: float):
+        """
+        Learn from the round trip time of a probe in this network.
+        The estimation is written to disk when the cache is flushed
+        (once per probe cycle and at exit), not for every sample.
+        :param latency: The round trip time in milliseconds
+        """
+        rtt = self.rtt
+        rtt.add_sample(latency / 1000)
+        sshtools.cache.get_cache(RTT_CACHE_NAME, lifetime=RTT_LIFETIME).put(
+            self.name, rtt.to_dict()
+        )
+
+    @property
+    def ping_timeout(self) -> float:
+        """The number of seconds to wait for a ping reply in this network"""
+        if self._ping_timeout is not None:
+            return self._ping_timeout
+
+        learned_timeout = self.rtt.timeout
+        if learned_timeout is None:
+            return sshtools.tools.IP_PING_TIMEOUT
+        return min(
+            max(learned_timeout, sshtools.tools.IP_PING_TIMEOUT_MIN),
+            sshtools.tools.IP_PING_TIMEOUT,
+        )
+
+    @property
+    def ssh_timeout(self) -> float:
+        """The number of seconds to wait for an SSH server in this network"""
+        if self._ssh_timeout is not None:
+            return self._ssh_timeout
+
+        learned_timeout = self.rtt.timeout
+        if learned_timeout is None:
+            return sshtools.tools.IP_SSH_TIMEOUT
+        # Connecting and receiving the banner takes a few round trips
+        return min(
+            max(4 * learned_timeout, sshtools.tools.IP_SSH_TIMEOUT_MIN),
+            sshtools.tools.IP_SSH_TIMEOUT,
+        )
+
     def get_interface(
         self, device: "sshtools.device.Device"
     ) -> typing.Optional[sshtools.interface.Interface]:
@@ -108,6 +362,10 @@ class Network:
 
     def has_ip_address(self, ip_address: sshtools.ip.IPAddress) -> bool:
         """Is an ip address part of this network"""
+        if self.prefix is not None:
+            ip_object = ip_address.ip_object
+            return ip_object is not None and ip_object in self.prefix
+
         if isinstance(self.ip_start, str):
             return str(ip_address).startswith(self.ip_start)
 
@@ -122,9 +380,9 @@ class Network:
             raise AttributeError(
                 f"Device {device} must have a not-None ip_id attribute"
             )
-        if self.ip_start is None:
+        if self.ip_start is None and self.prefix is None:
             raise AttributeError(
-                f"Network {self} must have a not-None ip_start attribute"
+                f"Network {self} must have a not-None ip_start or prefix attribute"
             )
 
         interface = self.get_interface(device)
@@ -138,7 +396,45 @@ class Network:
         else:
             ip_id = device.ip_id
 
-        return sshtools.ip.IPAddress(self.ip_start + str(ip_id))
+        if self.ip_start is not None:
+            return sshtools.ip.IPAddress(self.ip_start + str(ip_id))
+
+        ip_object = self.prefix.network_address + ip_id
+        if ip_object not in self.prefix:
+            raise ValueError(f"The ip_id of {device} does not fit in {self.prefix}")
+        return sshtools.ip.IPAddress(str(ip_object))
+
+    @classmethod
+    def get_network_of(
+        cls, ip_address: sshtools.ip.IPAddress
+    ) -> typing.Optional[Network]:
+        """
+        Returns the network an ip address is part of
+        :param ip_address: The ip address
+        :return: The network with the longest prefix containing the ip address or None
+        """
+        config_all = cls._get_config_all()
+        source, index, unindexed = cls.__prefix_index
+        if source is not config_all:
+            index, unindexed = PrefixIndex(), []
+            for network in cls.get_networks():
+                if network.prefix is not None:
+                    index.insert(network.prefix, network)
+                elif network.ip_start is not None:
+                    unindexed.append(network)
+            cls.__prefix_index = (config_all, index, unindexed)
+
+        ip_object = ip_address.ip_object
+        if ip_object is not None:
+            network = index.lookup(ip_object)
+            if network is not None:
+                return network
+
+        # Networks whose ip_start cannot be expressed as a prefix
+        for network in unindexed:
+            if network.has_ip_address(ip_address):
+                return network
+        return None
 
     @classmethod
     def get_networks(cls) -> list[Network]:
@@ -158,5 +454,12 @@ class Network:
         """Get the IPs that the networks the current machine has access to"""
         return list(filter(lambda n: n.is_connected, cls.get_networks()))
 
+    @classmethod
+    def get_network_context(cls) -> str:
+        """Returns an identifier for the combination of networks this machine is connected to"""
+        return ",".join(
+            sorted(network.name for network in cls.get_connected_networks())
+        )
+
     def __repr__(self) -> str:
         return f"<sshtools.connection.Network '{self.name}'>"
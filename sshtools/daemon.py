@@ -0,0 +1,316 @@
+#! /usr/bin/python3
+"""Daemon that keeps the reachability of all devices up to date and serves it over a Unix socket"""
+from __future__ import annotations  # python -3.9 compatibility
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+import typing
+from pathlib import Path
+
+import timtools.log
+
+import sshtools.cache
+import sshtools.config
+import sshtools.device
+import sshtools.errors
+import sshtools.ip
+import sshtools.ip_address
+import sshtools.tools
+
+logger = timtools.log.get_logger("sshtools.daemon")
+
+SOCKET_NAME: str = "sshtoolsd.sock"
+DAEMON_INTERVAL: float = 30
+DAEMON_QUERY_TIMEOUT: float = 0.2
+
+
+def get_socket_path() -> Path:
+    """Returns the path of the Unix socket the daemon listens on"""
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return Path(runtime_dir) / SOCKET_NAME
+    return sshtools.tools.CACHE_DIR / SOCKET_NAME
+
+
+def is_enabled() -> bool:
+    """Should the daemon be queried before probing in-process?"""
+    return not ReachabilityDaemon.in_process and "SSHTOOLS_NO_DAEMON" not in os.environ
+
+
+class ReachabilityDaemon:
+    """Probes all devices on a schedule and keeps the results in memory"""
+
+    in_process: bool = False
+    interval: float
+    _state: dict[str, dict]
+    _lock: threading.Lock
+    _server: typing.Optional[socketserver.ThreadingUnixStreamServer]
+
+    def __init__(self, interval: float = DAEMON_INTERVAL):
+        self.interval = interval
+        self._state = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def refresh_device(self, device: sshtools.device.Device):
+        """
+        Probe all possible ips of a device and store the reachable ones
+        :param device: The device to probe
+        """
+        # The probes run without the lock, so a reload does not wait for them
+        with sshtools.config.CONFIG_LOCK:
+            possible_ips = device.get_possible_ips()
+            strict_ips = device.get_possible_ips(
+                include_dns=False, include_hostname=False
+            )
+        # Probing in the background also retries the backed off ips
+        alive_ips = possible_ips.get_alive_addresses(include_backed_off=True)
+
+        addresses: list[dict] = []
+        for ip_address in sorted(alive_ips, key=sshtools.ip.get_sort_value):
+            addresses.append(
+                {
+                    "ip": str(ip_address),
+                    "latency": ip_address.latency,
+                    "sshable": ip_address.is_sshable(),
+                    "strict": ip_address in strict_ips,
+                }
+            )
+
+        with self._lock:
+            self._state[device.name] = {"updated": time.time(), "addresses": addresses}
+
+    def refresh(self):
+        """Probe all devices in the configuration"""
+        with sshtools.config.CONFIG_LOCK:
+            devices = [
+                device
+                for device in sshtools.device.DeviceConfig.get_devices()
+                if not device.is_self
+            ]
+        sshtools.device.sweep_devices(devices, include_backed_off=True)
+        sshtools.tools.mt_map(self.refresh_device, devices)
+        logger.debug("Refreshed the reachability of %d devices", len(devices))
+
+    def reload_devices(self, names: set[str]):
+        """
+        Forget the state of devices whose configuration changed and probe them again
+        :param names: The names of the devices
+        """
+        with self._lock:
+            for name in names:
+                self._state.pop(name, None)
+
+        devices = []
+        with sshtools.config.CONFIG_LOCK:
+            for name in names:
+                try:
+                    devices.append(sshtools.device.Device(name))
+                except sshtools.errors.ErrorHandler:
+                    continue
+        sshtools.tools.mt_map(
+            self.refresh_device, [device for device in devices if not device.is_self]
+        )
+
+    def watch_config(self):
+        """Reload the devices whose configuration changes"""
+        from sshtools import watcher  # pylint: disable=import-outside-toplevel
+
+        config_watcher = watcher.ConfigWatcher(on_reload=self.reload_devices)
+        try:
+            config_watcher.start()
+        except OSError as error:
+            logger.warning("Not reloading the configuration on changes: %s", error)
+
+    def answer(self, request: dict) -> dict:
+        """
+        Answer a query of a client
+        :param request:
+            A dictionary with the name of the device ('device')
+            and optionally the filters 'strict_ip' and 'only_sshable'
+        :return: The best address of the device, its latency and whether it is sshable
+        """
+        name = sshtools.device.DeviceConfig.get_name_from_hostname(
+            request.get("device", "")
+        )
+        with self._lock:
+            device_state = self._state.get(name)
+        if device_state is None:
+            return {"device": name, "ip": None, "updated": None}
+
+        for address in device_state["addresses"]:
+            if request.get("strict_ip") and not address["strict"]:
+                continue
+            if request.get("only_sshable") and not address["sshable"]:
+                continue
+            return {
+                "device": name,
+                "updated": device_state["updated"],
+                "interval": self.interval,
+                **address,
+            }
+        return {
+            "device": name,
+            "ip": None,
+            "updated": device_state["updated"],
+            "interval": self.interval,
+        }
+
+    def run_refresh_loop(self):
+        """Keep refreshing the state of the devices"""
+        while True:
+            start = time.monotonic()
+            try:
+                self.refresh()
+            except sshtools.errors.NetworkError:
+                logger.info("Not connected to a network, retrying later")
+            sshtools.cache.flush_all()
+            time.sleep(max(self.interval - (time.monotonic() - start), 0))
+
+    def serve(self, socket_path: Path = None, refresh: bool = True):
+        """
+        Serve the state of the devices over a Unix socket (blocks)
+        :param socket_path: The path to create the socket at
+        :param refresh: Probe the devices on a schedule in the background
+        """
+        ReachabilityDaemon.in_process = True
+
+        if socket_path is None:
+            socket_path = get_socket_path()
+        socket_path.parent.mkdir(parents=True, exist_ok=True)
+        if socket_path.is_socket():
+            socket_path.unlink()
+
+        daemon = self
+
+        class RequestHandler(socketserver.StreamRequestHandler):
+            """Answers a single JSON request"""
+
+            def handle(self):
+                try:
+                    request = json.loads(self.rfile.readline())
+                    response = daemon.answer(request)
+                except ValueError as error:
+                    response = {"error": str(error)}
+                self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+        if refresh:
+            threading.Thread(target=self.run_refresh_loop, daemon=True).start()
+            self.watch_config()
+        with socketserver.ThreadingUnixStreamServer(
+            str(socket_path), RequestHandler
+        ) as server:
+            self._server = server
+            logger.info("Listening on %s", socket_path)
+            try:
+                server.serve_forever()
+            finally:
+                self._server = None
+                socket_path.unlink(missing_ok=True)
+
+    def shutdown(self):
+        """Stop serving (blocks until serve has stopped accepting requests)"""
+        if self._server is not None:
+            self._server.shutdown()
+
+
+def query(
+    device_name: str,
+    strict_ip: bool = False,
+    only_sshable: bool = False,
+    socket_path: Path = None,
+) -> typing.Optional[dict]:
+    """
+    Ask the daemon for the best address of a device
+    :param device_name: The name of the device
+    :param strict_ip: Only return an actual IP address (no DNS or hostnames allowed)
+    :param only_sshable: Only return IPs that can be connected to using SSH
+    :param socket_path: The path of the socket of the daemon
+    :return: The answer of the daemon or None if the daemon is not running
+    """
+    if socket_path is None:
+        socket_path = get_socket_path()
+    if not socket_path.is_socket():
+        return None
+
+    request = {
+        "device": device_name,
+        "strict_ip": strict_ip,
+        "only_sshable": only_sshable,
+    }
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(DAEMON_QUERY_TIMEOUT)
+            client.connect(str(socket_path))
+            client.sendall(json.dumps(request).encode("utf-8") + b"\n")
+            with client.makefile("rb") as response_file:
+                response = json.loads(response_file.readline())
+    except (OSError, ValueError) as error:
+        logger.debug("The daemon could not be queried: %s", error)
+        return None
+
+    if "error" in response:
+        logger.debug("The daemon returned an error: %s", response["error"])
+        return None
+    return response
+
+
+def get_ip(
+    device: sshtools.device.Device, strict_ip: bool = False, only_sshable: bool = False
+) -> typing.Optional[sshtools.ip.IPAddress]:
+    """
+    Returns the best ip address of a device according to the daemon
+    :param device: The device whose ip address is requested
+    :param strict_ip: Only return an actual IP address (no DNS or hostnames allowed)
+    :param only_sshable: Only return IPs that can be connected to using SSH
+    :return: The ip address or None when the daemon has no recent answer
+    """
+    if not is_enabled():
+        return None
+
+    response = query(device.name, strict_ip=strict_ip, only_sshable=only_sshable)
+    if response is None or response.get("ip") is None:
+        return None
+    if time.time() - response["updated"] > 2 * response["interval"]:
+        logger.debug("The answer of the daemon for %s is outdated", device)
+        return None
+
+    ip_address = sshtools.ip.IPAddress(response["ip"])
+    # Let the checks in this process use the results of the daemon
+    ip_address.cache_ping(
+        sshtools.ip_address.PingResult(True, response["latency"]), persist=False
+    )
+    sshtools.cache.get_cache().put(
+        ip_address.ssh_cache_key, response["sshable"], persist=False
+    )
+    return ip_address
+
+
+def run():
+    """Main executable for sshtoolsd"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-v", "--verbose", action="store_true")
+    parser.add_argument(
+        "-i",
+        "--interval",
+        help="The number of seconds between probing all devices",
+        type=float,
+        default=DAEMON_INTERVAL,
+    )
+    parser.add_argument(
+        "-s", "--socket", help="The path of the Unix socket to listen on", type=Path
+    )
+    args = parser.parse_args()
+
+    timtools.log.set_verbose(args.verbose)
+
+    ReachabilityDaemon(interval=args.interval).serve(socket_path=args.socket)
+
+
+if __name__ == "__main__":
+    run()
@@ -3,24 +3,29 @@
 from __future__ import annotations  # python -3.9 compatibility
 
 import datetime as dt
-import json
 import socket
 from pathlib import Path
-from typing import Optional, Union
+from typing import Iterable, Optional, Union
 
 import timtools.bash
 import timtools.locations
 import timtools.log
 
+import sshtools.cache
 import sshtools.config
 import sshtools.connection
+import sshtools.daemon
 import sshtools.errors
 import sshtools.interface
 import sshtools.ip
-import sshtools.pathfinder
+import sshtools.resolver
+import sshtools.snapshot
+import sshtools.store
 import sshtools.tools
 
 DEVICES_DIR = sshtools.tools.CONFIG_DIR / "devices"
+LAST_IP_CACHE_NAME: str = "last_ips"
+LAST_IP_LIFETIME: float = 7 * 24 * 60 * 60
 logger = timtools.log.get_logger("sshtools.device")
 
 
@@ -28,6 +33,10 @@ class DeviceConfig:
     """The config for the devices"""
 
     __config_all: dict = None
+    # Indexes are rebuilt when the configuration they were built from is replaced
+    __name_index: tuple[Optional[dict], dict[str, str]] = (None, {})
+    __address_index: tuple[Optional[dict], dict[str, str]] = (None, {})
+    __fleet: tuple[Optional[dict], list[sshtools.config.FleetEntry]] = (None, [])
 
     @classmethod
     def _get_config_all(cls) -> dict[str, dict]:
@@ -37,11 +46,18 @@ class DeviceConfig:
         TODO: use @property when python >=3.9 can be ensured
         """
         if cls.__config_all is None:
-            cls.__config_all = {
-                dev.stem: json.load(dev.open("r")) for dev in DEVICES_DIR.iterdir()
-            }
+            store = sshtools.store.get_store()
+            if store is not None:
+                cls.__config_all = store.get_devices()
+            else:
+                cls.__config_all = sshtools.snapshot.get_snapshot().devices
         return cls.__config_all
 
+    @classmethod
+    def get_configs(cls) -> dict[str, dict]:
+        """Return the config of every device"""
+        return cls._get_config_all()
+
     @classmethod
     def get_config(cls, name) -> dict:
         """
@@ -49,30 +65,104 @@ class DeviceConfig:
         :param name: The name of the device
         :return: The dictionary containing the config
         """
-        config = cls._get_config_all().get(name, {})
-        if name not in cls._get_config_all().keys() and name != "localhost":
-            raise sshtools.errors.DeviceNotFoundError(name)
+        store = sshtools.store.get_store()
+        if cls.__config_all is None and store is not None:
+            # Look up the single device instead of loading the whole fleet
+            config = store.get_device(name)
+        else:
+            config = cls._get_config_all().get(name)
+        if config is None:
+            if name != "localhost":
+                raise sshtools.errors.DeviceNotFoundError(name)
+            config = {}
         return config
 
     @classmethod
-    def get_devices(
-        cls, filter_main: bool = False, filter_super: bool = False
+    def get_devices(  # pylint: disable=too-many-arguments
+        cls,
+        filter_main: bool = False,
+        filter_super: bool = False,
+        filter_sync: bool = False,
+        filter_ssh: bool = False,
+        networks: Optional[Iterable[str]] = None,
     ) -> list[Device]:
         """
         Return devices in the configuration.
         Multiple filters can be applied at the same time for an AND operation.
+        The filters use the configuration of the devices,
+        so only the devices that pass them are constructed.
 
         :param filter_main: Returns only devices that are marked as "main devices"
         :param filter_super: Returns only devices that are marked as "super devices"
+        :param filter_sync: Returns only devices that are not excluded from sync
+        :param filter_ssh: Returns only devices that are not excluded from SSH
+        :param networks: Returns only devices with a connection in one of these networks
         """
-        config: dict = cls._get_config_all()
-        device_names: list[str] = list(config.keys())
-        devices = [Device(name) for name in device_names]
+        entries = cls.get_fleet()
         if filter_main:
-            devices = list(filter(lambda d: d.is_main_device, devices))
+            entries = [entry for entry in entries if entry.is_main_device]
         if filter_super:
-            devices = list(filter(lambda d: d.is_super, devices))
-        return devices
+            entries = [entry for entry in entries if entry.is_super]
+        if filter_sync:
+            entries = [entry for entry in entries if entry.sync is not False]
+        if filter_ssh:
+            entries = [entry for entry in entries if entry.ssh is not False]
+        if networks is not None:
+            network_names = set(networks)
+            entries = [entry for entry in entries if entry.networks & network_names]
+        return [Device(entry.name) for entry in entries]
+
+    @classmethod
+    def get_fleet(cls) -> list[sshtools.config.FleetEntry]:
+        """Returns the filter fields of all devices in the configuration"""
+        config_all = cls._get_config_all()
+        source, fleet = cls.__fleet
+        if source is config_all:
+            return fleet
+
+        fleet = []
+        for name, config in config_all.items():
+            sync = config.get("sync", False)
+            is_main_device = config.get("main_device", sync is not False)
+            if isinstance(sync, str):
+                sync = sshtools.tools.str_to_bool(sync, default="limited")
+            fleet.append(
+                sshtools.config.FleetEntry(
+                    name=name,
+                    is_main_device=is_main_device,
+                    is_super=config.get("priority", 80) == 0,
+                    sync=sync,
+                    ssh=config.get("ssh", True),
+                    networks=frozenset(
+                        connection.get("network", "public")
+                        for connection in config.get("connections", [])
+                    ),
+                )
+            )
+
+        cls.__fleet = (config_all, fleet)
+        return fleet
+
+    @classmethod
+    def update_configs(cls, changes: dict[str, Optional[dict]]):
+        """
+        Apply changes to the configuration.
+        The indexes and the fleet are rebuilt, because the configuration is replaced.
+        :param changes: The new configuration of every changed device (None if removed)
+        """
+        if cls.__config_all is None:
+            # Nothing is loaded (e.g. single devices are read from the database)
+            return
+        with sshtools.config.CONFIG_LOCK:
+            config_all = dict(cls.__config_all)
+            for name, config in changes.items():
+                if config is None:
+                    config_all.pop(name, None)
+                else:
+                    config_all[name] = config
+            cls.__config_all = config_all
+            if sshtools.store.get_store() is None:
+                sshtools.snapshot.get_snapshot().update(devices=config_all)
 
     @classmethod
     def get_device(cls, name: str):
@@ -85,28 +175,74 @@ class DeviceConfig:
         Returns the name corresponding to a given hostname.
         If no name is found, the hostname is returned
         """
-        if hostname in cls._get_config_all().keys():
-            return hostname
-
-        for name, config in cls._get_config_all().items():
-            if config.get("hostname", None) == hostname:
-                return name
-
-            if hostname in config.get("container_hostnames", []):
-                return name
-
-        return hostname
+        store = sshtools.store.get_store()
+        if cls.__config_all is None and store is not None:
+            return store.get_name(hostname) or hostname
+        return cls._get_name_index().get(hostname, hostname)
 
+    @classmethod
+    def get_name_from_address(cls, address: str) -> Optional[str]:
+        """
+        Returns the name of the device a configured ip address belongs to
+        :param address: The ip address
+        :return: The name of the device or None if no device has the ip address
+        """
+        config_all = cls._get_config_all()
+        source, index = cls.__address_index
+        if source is not config_all:
+            index = {}
+            for device in cls.get_devices():
+                for ip_address in device.ip_address_list_all:
+                    index.setdefault(str(ip_address), device.name)
+            cls.__address_index = (config_all, index)
+        return index.get(address)
 
-class Device:  # pylint:disable=too-many-instance-attributes
+    @classmethod
+    def _get_name_index(cls) -> dict[str, str]:
+        """Returns the name of the device for every name, hostname and container hostname"""
+        config_all = cls._get_config_all()
+        source, index = cls.__name_index
+        if source is config_all:
+            return index
+
+        index = {}
+        for name, config in config_all.items():
+            if config.get("hostname", None) is not None:
+                index.setdefault(config["hostname"], name)
+            for container_hostname in config.get("container_hostnames", []):
+                index.setdefault(container_hostname, name)
+        # The names of the devices take precedence over their hostnames
+        index.update({name: name for name in config_all.keys()})
+
+        cls.__name_index = (config_all, index)
+        return index
+
+
+class Device:  # pylint:disable=too-many-instance-attributes,too-many-public-methods
     """A physical device"""
 
+    __slots__ = (
+        "name",
+        "hostname",
+        "mdns",
+        "ip_id",
+        "is_container",
+        "config",
+        "ip_address_list_all",
+        "interfaces",
+        "is_main_device",
+        "use_generated_ips",
+        "last_ip_address",
+        "last_ip_address_update",
+    )
+
     __instances: dict[str, "Device"] = {}
 
+    name: str
     hostname: str
     mdns: Optional[str]
     ip_id: int
-    is_container: bool = False
+    is_container: bool
     config: sshtools.config.ConnectionConfig
     ip_address_list_all: sshtools.ip.IPAddressList
     interfaces: list[sshtools.interface.Interface]
@@ -138,23 +274,61 @@ class Device:  # pylint:disable=too-many-instance-attributes
         )
         self.ip_id = config.get("ip_id")
 
-        self.config = sshtools.config.ConnectionConfig(
-            sync=config.get("sync", False),
-            ssh=config.get("ssh", True),
-            ssh_port=config.get("ssh_port", "22"),
-            mosh=config.get("mosh", True),
-            user=config.get("user", "tim"),
-            priority=config.get("priority", 80),
+        sync = config.get("sync", False)
+        if isinstance(sync, str):
+            sync = sshtools.tools.str_to_bool(sync, default="limited")
+        self.config = sshtools.config.get_shared(
+            sshtools.config.ConnectionConfig(
+                sync=sync,
+                ssh=config.get("ssh", True),
+                ssh_port=config.get("ssh_port", "22"),
+                mosh=config.get("mosh", True),
+                user=config.get("user", "tim"),
+                priority=config.get("priority", 80),
+            )
         )
 
         self.is_main_device = config.get("main_device", self.config.sync is not False)
         self.use_generated_ips = config.get("use_generated_ips", True)
 
-        if isinstance(self.config.sync, str):
-            self.config.sync = sshtools.tools.str_to_bool(
-                self.config.sync, default="limited"
+        if sshtools.store.get_store() is not None:
+            # The database is already a single file, so there is no snapshot to use
+            compiled = self._compile(config)
+        else:
+            snapshot = sshtools.snapshot.get_snapshot()
+            compiled = snapshot.get_compiled(name)
+            if compiled is None:
+                compiled = self._compile(config)
+                snapshot.set_compiled(name, compiled)
+
+        self.interfaces = [
+            sshtools.interface.Interface(
+                self, iface_data["name"], mac=iface_data["mac"]
             )
+            for iface_data in compiled["interfaces"]
+        ]
+        self.ip_address_list_all = sshtools.ip.IPAddressList()
+        for connection in compiled["connections"]:
+            network = sshtools.connection.Network(connection["network"])
+            if connection["adapter"] is not None:
+                network.interface = connection["adapter"]
+            ip_address = sshtools.ip.IPAddress(connection["ip_address"])
+            ip_address.config = sshtools.config.get_shared(
+                sshtools.ip.IPConnectionConfig(network=network, **connection["config"])
+            )
+            self.ip_address_list_all.add(ip_address)
+
+        if self.hostname is not None:
+            self.mdns = self.hostname + ".local"
+        else:
+            self.mdns = None
 
+    def _compile(self, config: dict) -> dict:
+        """
+        Derive the interfaces and ip addresses of the device from its configuration
+        :param config: The configuration of the device
+        :return: A JSON serializable form that is stored in the configuration snapshot
+        """
         self.interfaces = []
         for iface_data in config.get("interfaces", []):
             iface = sshtools.interface.Interface(
@@ -162,7 +336,7 @@ class Device:  # pylint:disable=too-many-instance-attributes
             )
             self.interfaces.append(iface)
 
-        self.ip_address_list_all = sshtools.ip.IPAddressList()
+        connections: list[dict] = []
         for ip_data in config.get("connections", []):
             config_ip_address: Optional[str] = ip_data.get("ip_address", None)
             config_network: sshtools.connection.Network = sshtools.connection.Network(
@@ -184,29 +358,38 @@ class Device:  # pylint:disable=too-many-instance-attributes
 
             if config_ip_address is not None:
                 ip_address = sshtools.ip.IPAddress(ip_data.get("ip_address"))
-            elif config_network.ip_start is not None and self.ip_id is not None:
+            elif (
+                config_network.ip_start is not None or config_network.prefix is not None
+            ) and self.ip_id is not None:
                 ip_address = config_network.construct_ip(self)
             else:
                 raise ValueError(
                     f"No IP address configured for {self} in network {config_network}"
                 )
 
-            ip_address.config = sshtools.ip.IPConnectionConfig(
-                sync=ip_data.get("sync", self.config.sync),
-                ssh=ip_data.get("ssh", self.config.ssh),
-                ssh_port=ip_data.get("ssh_port", self.config.ssh_port),
-                mosh=ip_data.get("mosh", self.config.mosh),
-                user=ip_data.get("user", self.config.user),
-                priority=ip_data.get("priority", config_network.priority),
-                network=config_network,
-                check_online=ip_data.get("check_online", True),
+            connections.append(
+                {
+                    "ip_address": str(ip_address),
+                    "network": config_network.name,
+                    "adapter": interface,
+                    "config": {
+                        "sync": ip_data.get("sync", self.config.sync),
+                        "ssh": ip_data.get("ssh", self.config.ssh),
+                        "ssh_port": ip_data.get("ssh_port", self.config.ssh_port),
+                        "mosh": ip_data.get("mosh", self.config.mosh),
+                        "user": ip_data.get("user", self.config.user),
+                        "priority": ip_data.get("priority", config_network.priority),
+                        "check_online": ip_data.get("check_online", True),
+                    },
+                }
             )
-            self.ip_address_list_all.add(ip_address)
 
-        if self.hostname is not None:
-            self.mdns = self.hostname + ".local"
-        else:
-            self.mdns = None
+        return {
+            "interfaces": [
+                {"name": iface.name, "mac": iface.mac} for iface in self.interfaces
+            ],
+            "connections": connections,
+        }
 
     def __new__(cls, name: str, *_, **__):
         name = DeviceConfig.get_name_from_hostname(name)
@@ -217,6 +400,53 @@ class Device:  # pylint:disable=too-many-instance-attributes
         cls.__instances[name] = instance
         return instance
 
+    @classmethod
+    def rebuild(cls, name: str) -> Optional[Device]:
+        """
+        Rebuild a device after its configuration changed
+        :param name: The name of the device
+        :return: The rebuilt device or None if it was not built before or has been removed
+        """
+        if sshtools.store.get_store() is None:
+            sshtools.snapshot.get_snapshot().discard_compiled(name)
+
+        instance = cls.__instances.get(name)
+        if instance is None:
+            return None
+        instance.forget_probes()
+        try:
+            # Creating an existing device initializes the same instance again
+            Device(name)
+        except sshtools.errors.DeviceNotFoundError:
+            del cls.__instances[name]
+            return None
+        except sshtools.errors.ErrorHandler as error:
+            # The instance may be partially initialized, so it is built again when requested
+            logger.warning("Could not rebuild %s: %s", name, error)
+            del cls.__instances[name]
+            return None
+        instance.forget_probes()
+        return instance
+
+    def forget_probes(self):
+        """Forget the cached probe results of the device (e.g. because its configuration changed)"""
+        ip_addresses = (
+            self.get_possible_ips(include_ips=False) | self.ip_address_list_all
+        )
+        sshtools.cache.get_cache().remove(
+            key
+            for ip_address in ip_addresses
+            for key in ip_address.get_probe_cache_keys()
+        )
+        sshtools.resolver.get_resolver().forget(
+            str(ip_address) for ip_address in ip_addresses if ip_address.version == 0
+        )
+        sshtools.cache.get_cache(
+            LAST_IP_CACHE_NAME, lifetime=LAST_IP_LIFETIME
+        ).invalidate(prefix=f"{self.name}:")
+        self.last_ip_address = None
+        self.last_ip_address_update = None
+
     @staticmethod
     def get_self() -> Device:
         """Return the device object of this machine"""
@@ -237,7 +467,10 @@ class Device:  # pylint:disable=too-many-instance-attributes
         return reachable_ips
 
     def get_ip(
-        self, strict_ip: bool = False, only_sshable: bool = False
+        self,
+        strict_ip: bool = False,
+        only_sshable: bool = False,
+        verify_login: bool = False,
     ) -> sshtools.ip.IPAddress:
         """
         Returns the IP to used for the device.
@@ -245,22 +478,92 @@ class Device:  # pylint:disable=too-many-instance-attributes
 
         :param strict_ip: Only return an actual IP address (no DNS or hostnames allowed)
         :param only_sshable: Only return IPs that can be connected to using SSH
+        :param verify_login:
+            Verify that an authenticated SSH connection can be established to the selected IP
+            (implies only_sshable)
         """
         if self.is_self:
             if strict_ip:
                 return sshtools.ip.IPAddress("127.0.0.1")
             return sshtools.ip.IPAddress(self.hostname)
 
-        alive_ips = self.get_active_ips(strict_ip=strict_ip, only_sshable=only_sshable)
-        if alive_ips.length > 0:
-            ip_address = alive_ips.first
+        daemon_ip = sshtools.daemon.get_ip(
+            self, strict_ip=strict_ip, only_sshable=only_sshable or verify_login
+        )
+        if daemon_ip is not None and (not verify_login or daemon_ip.can_login()):
+            logger.info("Selected %s for %s (sshtoolsd)", daemon_ip, self)
+            self.last_ip_address = daemon_ip
+            self.last_ip_address_update = dt.datetime.now()
+            return daemon_ip
+
+        possible_ips = self.get_possible_ips(
+            include_dns=not strict_ip, include_hostname=not strict_ip
+        )
+
+        # When the last known good ip still answers, the other candidates are not
+        # resolved or probed at all. It is probed on its own with the timeouts
+        # learned for its network, so a stale one only delays the fan-out briefly.
+        last_ip = self._get_last_known_good_ip(possible_ips)
+        if last_ip is not None and sshtools.ip.IPAddressList.is_ip_alive(
+            last_ip, only_sshable=only_sshable or verify_login
+        ):
+            if not verify_login or last_ip.can_login():
+                logger.info("Selected %s for %s (last known good)", last_ip, self)
+                self.last_ip_address = last_ip
+                self.last_ip_address_update = dt.datetime.now()
+                return last_ip
+
+        logger.info(
+            "Trying %d ips for %s: %s",
+            possible_ips.length,
+            self,
+            possible_ips.list,
+        )
+
+        ip_address = possible_ips.get_best_address(
+            only_sshable=only_sshable or verify_login
+        )
+        while verify_login and ip_address is not None and not ip_address.can_login():
+            logger.info("Could not log in on %s over SSH", ip_address)
+            possible_ips = possible_ips - [ip_address]
+            ip_address = possible_ips.get_best_address(only_sshable=True)
+
+        if ip_address is not None:
             logger.info("Selected %s for %s", ip_address, self)
             self.last_ip_address = ip_address
             self.last_ip_address_update = dt.datetime.now()
+            self._store_last_known_good_ip(ip_address)
             return ip_address
 
         raise sshtools.errors.NotReachableError(self.name)
 
+    @property
+    def _last_ip_cache_key(self) -> str:
+        """The key of the last known good ip of this device on the current networks"""
+        network_context = sshtools.connection.Network.get_network_context()
+        return f"{self.name}:{network_context}"
+
+    def _get_last_known_good_ip(
+        self, possible_ips: sshtools.ip.IPAddressList
+    ) -> Optional[sshtools.ip.IPAddress]:
+        """
+        Returns the ip that was last selected for this device on the current networks
+        :param possible_ips: The ips that are allowed to be returned
+        """
+        last_ip: Optional[str] = sshtools.cache.get_cache(
+            LAST_IP_CACHE_NAME, lifetime=LAST_IP_LIFETIME
+        ).get(self._last_ip_cache_key, max_age=LAST_IP_LIFETIME)
+        for ip_address in possible_ips:
+            if str(ip_address) == last_ip:
+                return ip_address
+        return None
+
+    def _store_last_known_good_ip(self, ip_address: sshtools.ip.IPAddress):
+        """Remember the ip that was selected for this device on the current networks"""
+        sshtools.cache.get_cache(LAST_IP_CACHE_NAME, lifetime=LAST_IP_LIFETIME).put(
+            self._last_ip_cache_key, str(ip_address)
+        )
+
     def get_possible_ips(
         self,
         include_dns: bool = True,
@@ -408,7 +711,10 @@ class Device:  # pylint:disable=too-many-instance-attributes
 
     def can_connect_to_device(self, target: "Device") -> bool:
         """Can this device connect to the target device"""
-        return sshtools.pathfinder.Path.device_is_present_for_device(self, target)
+        # The pathfinder (and sshin) are only needed to plan connections
+        from sshtools import pathfinder  # pylint: disable=import-outside-toplevel
+
+        return pathfinder.Path.device_is_present_for_device(self, target)
 
     @property
     def sync(self) -> Union[str, bool]:
@@ -449,3 +755,24 @@ class Device:  # pylint:disable=too-many-instance-attributes
 
     def __str__(self):
         return self.hostname or self.name
+
+
+def sweep_devices(
+    devices: list[Device], strict_ip: bool = False, include_backed_off: bool = False
+):
+    """
+    Ping all possible ips of many devices in one pass and cache the results
+    :param devices: The devices to sweep
+    :param strict_ip: Only sweep actual IP addresses (no DNS or hostnames)
+    :param include_backed_off: Also ping the ips whose backoff window is still open
+    """
+    ip_addresses = sshtools.ip.IPAddressList()
+    for device in devices:
+        if not device.is_self:
+            ip_addresses.add_list(
+                device.get_possible_ips(
+                    include_dns=not strict_ip, include_hostname=not strict_ip
+                )
+            )
+    logger.info("Sweeping %d ips of %d devices", ip_addresses.length, len(devices))
+    ip_addresses.sweep(include_backed_off=include_backed_off)
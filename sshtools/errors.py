@@ -51,8 +51,8 @@ class DeviceNotPresentError(ErrorHandler):
 class ConfigError(ErrorHandler):
     """Error raised when there is problem with the config"""
 
-    def __init__(self, name):
-        super().__init__(f"Device {name} was not correctly configured for this action.")
+    def __init__(self, name, kind: str = "Device"):
+        super().__init__(f"{kind} {name} was not correctly configured for this action.")
 
 
 class NetworkNotFound(ErrorHandler):
@@ -18,10 +18,12 @@ def forget_device(target: sshtools.device.Device):
     Remove all entries for a device in .ssh/known_hosts
     :param target: The device whose entries need to be removed
     """
-    ips = target.get_possible_ips(
-        include_dns=True, include_ips=True, include_hostname=True
+    ips = (
+        target.get_possible_ips(
+            include_dns=True, include_ips=True, include_hostname=True
+        )
+        | target.ip_address_list_all
     )
-    ips.add_list(target.ip_address_list_all)
     for ip_address in ips:
         timtools.bash.run(
             ["ssh-keygen", "-R", str(ip_address)],
@@ -9,7 +9,6 @@ import timtools.log
 
 import sshtools.device
 import sshtools.errors
-import sshtools.sshin
 import sshtools.tools
 
 logger = timtools.log.get_logger("ssh-tools.getip")
@@ -20,13 +19,16 @@ def get_ip_string(
     ssh_string: bool = False,
     strict_ip: bool = False,
     only_sshable: bool = False,
+    verify_login: bool = False,
 ) -> str:
     """Return the full address of the user on the device"""
 
     if not target.is_present:
         return "x"
 
-    ip_address = target.get_ip(strict_ip=strict_ip, only_sshable=only_sshable)
+    ip_address = target.get_ip(
+        strict_ip=strict_ip, only_sshable=only_sshable, verify_login=verify_login
+    )
     if ssh_string:
         user = target.user
         return f"{user}@{ip_address}"
@@ -42,6 +44,7 @@ def run():
         "target", help="Computer voor wie het ip adres moet worden bepaald", nargs="*"
     )
     parser.add_argument("-v", "--verbose", help="Geef feedback", action="store_true")
+    sshtools.tools.add_max_age_argument(parser)
     parser.add_argument(
         "--ssh-string",
         help="Geeft de volledige string voor SSH ([USER]@[IP])",
@@ -53,6 +56,12 @@ def run():
         help="Selecteer alleen maar IPs waar met SSH naar geconnecteerd worden",
         action="store_true",
     )
+    parser.add_argument(
+        "-l",
+        "--login",
+        help="Controleer ook of er met SSH kan ingelogd worden (trager)",
+        action="store_true",
+    )
     parser.add_argument(
         "-i",
         "--ip",
@@ -68,6 +77,7 @@ def run():
     args = parser.parse_args()
 
     timtools.log.set_verbose(args.verbose)
+    sshtools.tools.PROBE_MAX_AGE = args.max_age
 
     targets: list[sshtools.device.Device]
     if len(args.target) == 0:
@@ -75,12 +85,16 @@ def run():
     else:
         targets = [sshtools.device.Device(name) for name in args.target]
 
+    if len(targets) > 1:
+        sshtools.device.sweep_devices(targets, strict_ip=args.ip)
+
     def device_add_row(rows: list[list[str]], device: sshtools.device.Device):
         ip_string = get_ip_string(
             device,
             ssh_string=args.ssh_string,
             strict_ip=args.ip,
             only_sshable=args.ssh,
+            verify_login=args.login,
         )
         rows.append([device.name, ip_string])
 
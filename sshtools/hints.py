@@ -0,0 +1,200 @@
+"""Module for passive liveness hints from the neighbour and connection tables of the kernel"""
+from __future__ import annotations  # python -3.9 compatibility
+
+import dataclasses
+import ipaddress
+import socket
+import struct
+import typing
+from pathlib import Path
+
+import cachetools.func
+import timtools.log
+
+import sshtools.connection
+import sshtools.tools
+
+logger = timtools.log.get_logger("sshtools.hints")
+
+TCP_TABLE_PATHS: tuple[Path, ...] = (Path("/proc/net/tcp"), Path("/proc/net/tcp6"))
+TCP_ESTABLISHED: int = 0x1
+# Dumping the neighbour table over rtnetlink (linux/netlink.h, linux/rtnetlink.h)
+NLMSG_ERROR: int = 0x2
+NLMSG_DONE: int = 0x3
+NLM_F_REQUEST: int = 0x1
+NLM_F_DUMP: int = 0x300
+RTM_NEWNEIGH: int = 28
+RTM_GETNEIGH: int = 30
+NDA_DST: int = 1
+NLMSG_HEADER: struct.Struct = struct.Struct("=IHHII")
+NDMSG: struct.Struct = struct.Struct("=BxxxiHBB")
+RTATTR_HEADER: struct.Struct = struct.Struct("=HH")
+# The neighbour recently confirmed its address (linux/neighbour.h),
+# STALE entries (which are also complete) say nothing about the host being up
+NUD_REACHABLE: int = 0x2
+NEIGHBOUR_DUMP_TIMEOUT: float = 0.5
+# Latency in milliseconds assumed for a hinted address whose network has no learned rtt
+HINT_LATENCY: float = 1
+
+
+@dataclasses.dataclass
+class Hints:
+    """What the kernel already knows about the reachability of other hosts"""
+
+    neighbours: set[str]
+    connections: set[tuple[str, int]]
+
+    def is_alive(self, address: str, port: int) -> bool:
+        """Is the host known to be up?"""
+        return address in self.neighbours or (address, port) in self.connections
+
+    def is_connected(self, address: str, port: int) -> bool:
+        """Is there an established TCP connection to the port of the host?"""
+        return (address, port) in self.connections
+
+
+def parse_neighbour(message: bytes) -> typing.Optional[str]:
+    """
+    Returns the address of a reachable neighbour
+    :param message: The payload of an RTM_NEWNEIGH message
+    :return: The ip address or None if the neighbour is not in the REACHABLE state
+    """
+    if len(message) < NDMSG.size:
+        return None
+    family, _, state, _, _ = NDMSG.unpack_from(message)
+    if not state & NUD_REACHABLE:
+        return None
+
+    offset = NDMSG.size
+    while offset + RTATTR_HEADER.size <= len(message):
+        length, attribute_type = RTATTR_HEADER.unpack_from(message, offset)
+        if length < RTATTR_HEADER.size:
+            break
+        if attribute_type == NDA_DST:
+            try:
+                return socket.inet_ntop(
+                    family, message[offset + RTATTR_HEADER.size : offset + length]
+                )
+            except (OSError, ValueError):
+                return None
+        offset += (length + 3) & ~3
+    return None
+
+
+def parse_neighbour_messages(data: bytes) -> tuple[set[str], bool]:
+    """
+    Returns the reachable neighbours in a datagram of a neighbour table dump
+    :param data: The datagram received on a netlink socket
+    :return: The ip addresses and whether the dump is complete
+    """
+    neighbours: set[str] = set()
+    offset = 0
+    while offset + NLMSG_HEADER.size <= len(data):
+        length, message_type, _, _, _ = NLMSG_HEADER.unpack_from(data, offset)
+        if length < NLMSG_HEADER.size:
+            break
+        if message_type in (NLMSG_DONE, NLMSG_ERROR):
+            return neighbours, True
+        if message_type == RTM_NEWNEIGH:
+            address = parse_neighbour(
+                data[offset + NLMSG_HEADER.size : offset + length]
+            )
+            if address is not None:
+                neighbours.add(address)
+        offset += (length + 3) & ~3
+    return neighbours, False
+
+
+def read_neighbours() -> set[str]:
+    """Returns the neighbours the kernel recently confirmed to be reachable"""
+    request = NLMSG_HEADER.pack(
+        NLMSG_HEADER.size + NDMSG.size,
+        RTM_GETNEIGH,
+        NLM_F_REQUEST | NLM_F_DUMP,
+        1,
+        0,
+    ) + NDMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+
+    neighbours: set[str] = set()
+    try:
+        with socket.socket(
+            socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE
+        ) as netlink_socket:
+            netlink_socket.settimeout(NEIGHBOUR_DUMP_TIMEOUT)
+            netlink_socket.send(request)
+            done = False
+            while not done:
+                data = netlink_socket.recv(65536)
+                if not data:
+                    break
+                reachable, done = parse_neighbour_messages(data)
+                neighbours |= reachable
+    except (AttributeError, OSError) as error:
+        logger.debug("Could not read the neighbour table: %s", error)
+    return neighbours
+
+
+def decode_address(hex_address: str) -> tuple[str, int]:
+    """
+    Decode an address of the TCP table of the kernel
+    :param hex_address: The address and port (e.g. 0100007F:0016)
+    :return: The ip address and the port
+    """
+    hex_ip, hex_port = hex_address.split(":")
+    # The address is stored as 32-bit words in host byte order
+    words = struct.unpack(f"<{len(hex_ip) // 8}I", bytes.fromhex(hex_ip))
+    packed = struct.pack(f">{len(words)}I", *words)
+    ip_address = ipaddress.ip_address(packed)
+    if isinstance(ip_address, ipaddress.IPv6Address) and ip_address.ipv4_mapped:
+        ip_address = ip_address.ipv4_mapped
+    return str(ip_address), int(hex_port, 16)
+
+
+def parse_tcp_table(table: str) -> set[tuple[str, int]]:
+    """
+    Returns the remote endpoints of the established connections in the TCP table
+    :param table: The contents of /proc/net/tcp or /proc/net/tcp6
+    """
+    connections: set[tuple[str, int]] = set()
+    for line in table.splitlines()[1:]:
+        fields = line.split()
+        if len(fields) >= 4 and int(fields[3], 16) == TCP_ESTABLISHED:
+            connections.add(decode_address(fields[2]))
+    return connections
+
+
+def read_table(path: Path) -> str:
+    """Returns the contents of a kernel table (empty if it is not available)"""
+    try:
+        return path.read_text(encoding="utf-8")
+    except OSError as error:
+        logger.debug("Could not read %s: %s", path, error)
+        return ""
+
+
+@cachetools.func.ttl_cache(ttl=sshtools.tools.IP_CACHE_TIMEOUT)
+def get_hints() -> Hints:
+    """Returns the hints of the kernel (read once per lookup cycle)"""
+    connections: set[tuple[str, int]] = set()
+    for path in TCP_TABLE_PATHS:
+        connections |= parse_tcp_table(read_table(path))
+    hints = Hints(
+        neighbours=read_neighbours(),
+        connections=connections,
+    )
+    logger.debug(
+        "The kernel knows %d neighbours and %d connections",
+        len(hints.neighbours),
+        len(hints.connections),
+    )
+    return hints
+
+
+def get_hint_latency(network: typing.Optional[sshtools.connection.Network]) -> float:
+    """
+    Returns the latency to assume for a hinted address
+    :param network: The network of the address
+    """
+    if network is not None and network.rtt.srtt is not None:
+        return network.rtt.srtt * 1000
+    return HINT_LATENCY
@@ -15,6 +15,8 @@ if TYPE_CHECKING:
 class Interface:  # pylint: disable=too-few-public-methods
     """Class representing a network interface"""
 
+    __slots__ = ("device", "name", "type", "mac")
+
     device: "sshtools.device.Device"
     name: str
     type: str
@@ -1,16 +1,23 @@
 """Module for handling collections of IP address"""
 from __future__ import annotations
 
+import heapq
+import queue
 import socket
-from typing import Union
+import threading
+from typing import Iterable, Iterator, Optional, Union
 
-import cachetools.func
-import psutil
 import timtools.log
 import timtools.multithreading
 
+import sshtools.cache
 import sshtools.errors
+import sshtools.hints
 import sshtools.ip_address
+import sshtools.netstate
+import sshtools.probe
+import sshtools.resolver
+import sshtools.tailscale
 import sshtools.tools
 
 logger = timtools.log.get_logger("sshtools.ip")
@@ -19,176 +26,494 @@ IPConnectionConfig = sshtools.ip_address.IPConnectionConfig
 IPAddress = sshtools.ip_address.IPAddress
 
 
-def hash_ip_list(ip_list: list[IPAddress]) -> int:
-    """Return a unique hash for a list of IPAddresses"""
-    ip_str_list: list[str] = [str(ip_address) for ip_address in ip_list]
-    return hash(",".join(ip_str_list))
+def get_static_sort_value(ip_address: IPAddress) -> float:
+    """
+    Returns the part of the sort value of an ip address that is known without probing it
+    (lower is better)
+    """
+    value: float = 0
+    if not any(char.isdigit() for char in str(ip_address)):
+        if ".local" in str(ip_address):
+            value -= 7
+        else:
+            value -= 5
+
+    if ip_address.config and ip_address.config.mosh:
+        value -= 10
+
+    if ip_address.config and ip_address.config.priority:
+        priority = ip_address.config.priority
+    else:
+        priority = 80
+    value -= (100 - priority) / 10
+
+    return value
+
+
+def get_sort_value(ip_address: IPAddress) -> float:
+    """Returns the value used to sort ip addresses (lower is better)"""
+    return ip_address.latency + get_static_sort_value(ip_address)
+
+
+def get_sort_value_bound(ip_address: IPAddress) -> float:
+    """Returns the lowest sort value an ip address can obtain after it is probed"""
+    lowest_latency = -1 if ip_address.config_value("check_online") is False else 0
+    return lowest_latency + get_static_sort_value(ip_address)
+
+
+def is_probe_deferred(ip_address: IPAddress) -> bool:
+    """
+    Is probing the ip address in the foreground deferred, because it failed repeatedly
+    and its backoff window is still open? (it is retried once the window expires)
+    """
+    return ip_address.is_backed_off and ip_address.get_cached_ping() is None
 
 
 class IPAddressList:
-    """A collection of IPAddress"""
+    """
+    An ordered collection of unique IPAddress.
+    Adding an ip address that is already in the collection does not change it.
+    """
 
-    _ip_addresses: list[IPAddress]
-    _last_sort_hash: int
+    _members: dict[IPAddress, None]
+    # Incremented whenever the composition of the collection changes
+    _version: int
+    _sorted_version: int
 
-    def __init__(self, ip_addresses: list[IPAddress] = None):
-        if ip_addresses is not None:
-            self._ip_addresses = ip_addresses.copy()
-        else:
-            self._ip_addresses = []
-        self._last_sort_hash = 0
+    def __init__(self, ip_addresses: Iterable[IPAddress] = None):
+        self._members = dict.fromkeys(ip_addresses or [])
+        self._version = 0
+        self._sorted_version = -1
 
     def add(self, ip_address: IPAddress):
         """
         Add an ip address to the collection
         :param ip_address: The IPAddress to add
         """
-        if isinstance(ip_address, IPAddress):
-            self._ip_addresses.append(ip_address)
-        else:
+        if not isinstance(ip_address, IPAddress):
             raise ValueError("Only IPAddress objects can be added to a IPAddressList")
+        if ip_address not in self._members:
+            self._members[ip_address] = None
+            self._version += 1
 
-    def add_list(self, ip_addresses: Union[list[IPAddress], "IPAddressList"]):
+    def add_list(self, ip_addresses: Iterable[IPAddress]):
         """
         Add a list of ip address to the collection
         :param ip_addresses: A list of IPAddress or a IPAddressList object to add
         """
-        if all(isinstance(ip, IPAddress) for ip in ip_addresses):
-            self._ip_addresses += ip_addresses
-        else:
+        if isinstance(ip_addresses, IPAddressList):
+            # The members of another collection are known to be IPAddress objects
+            length = len(self._members)
+            members = ip_addresses._members  # pylint: disable=protected-access
+            self._members.update(members)
+            if len(self._members) != length:
+                self._version += 1
+            return
+
+        ip_addresses = list(ip_addresses)
+        if not all(isinstance(ip, IPAddress) for ip in ip_addresses):
             raise ValueError("Only IPAddress objects can be added to a IPAddressList")
+        for ip_address in ip_addresses:
+            self.add(ip_address)
+
+    def copy(self) -> IPAddressList:
+        """Returns a copy of the collection"""
+        return IPAddressList(self._members)
+
+    def union(self, ip_addresses: Iterable[IPAddress]) -> IPAddressList:
+        """
+        Returns the ip addresses that are in the collection or in the other ip addresses
+        (the ip addresses of the collection come first)
+        """
+        union = self.copy()
+        union.add_list(ip_addresses)
+        return union
 
-    def get_alive_addresses(self, only_sshable: bool = False) -> "IPAddressList":
+    def intersection(self, ip_addresses: Iterable[IPAddress]) -> IPAddressList:
+        """
+        Returns the ip addresses of the collection that are also in the other ip addresses
+        (in the order of the collection)
+        """
+        others = IPAddressList._as_set(ip_addresses)
+        return IPAddressList(ip for ip in self._members if ip in others)
+
+    def difference(self, ip_addresses: Iterable[IPAddress]) -> IPAddressList:
+        """
+        Returns the ip addresses of the collection that are not in the other ip addresses
+        (in the order of the collection)
+        """
+        others = IPAddressList._as_set(ip_addresses)
+        return IPAddressList(ip for ip in self._members if ip not in others)
+
+    @staticmethod
+    def _as_set(
+        ip_addresses: Iterable[IPAddress],
+    ) -> Union[set[IPAddress], dict[IPAddress, None]]:
+        """Returns the ip addresses in a collection with fast membership tests"""
+        if isinstance(ip_addresses, IPAddressList):
+            return ip_addresses._members  # pylint: disable=protected-access
+        if isinstance(ip_addresses, (set, frozenset, dict)):
+            return ip_addresses
+        return set(ip_addresses)
+
+    def __or__(self, other: Iterable[IPAddress]) -> IPAddressList:
+        return self.union(other)
+
+    def __and__(self, other: Iterable[IPAddress]) -> IPAddressList:
+        return self.intersection(other)
+
+    def __sub__(self, other: Iterable[IPAddress]) -> IPAddressList:
+        return self.difference(other)
+
+    def resolve(self):
+        """Resolve the hostnames in the collection concurrently (the answers are cached)"""
+        hostnames = [str(ip_address) for ip_address in self._members]
+        sshtools.resolver.get_resolver().resolve_all(hostnames)
+
+    def get_endpoints(self) -> dict[tuple[str, int], list[IPAddress]]:
+        """
+        Group the ip addresses of the collection by the endpoint they resolve to,
+        so every endpoint only needs to be probed once
+        :return: The aliases of every endpoint (address and port), in collection order
+        """
+        self.resolve()
+        endpoints: dict[tuple[str, int], list[IPAddress]] = {}
+        for ip_address in self._members:
+            endpoints.setdefault(ip_address.endpoint, []).append(ip_address)
+        return endpoints
+
+    def apply_hints(self, endpoints: dict[tuple[str, int], list[IPAddress]] = None):
+        """
+        Mark the endpoints the kernel already knows to be up as alive without any traffic
+        (a reachable neighbour entry or an established connection to the SSH port),
+        active probes confirm them in the background
+        :param endpoints: The endpoints of the collection (see get_endpoints)
+        """
+        if endpoints is None:
+            endpoints = self.get_endpoints()
+        hints = sshtools.hints.get_hints()
+
+        hinted_ips: list[IPAddress] = []
+        for (address, port), aliases in endpoints.items():
+            ip_address = aliases[0]
+            if (
+                not hints.is_alive(address, port)
+                or ip_address.get_cached_ping() is not None
+            ):
+                continue
+            hinted_ips.append(ip_address)
+            ip_address.cache_ping(
+                sshtools.probe.PingResult(
+                    True, sshtools.hints.get_hint_latency(ip_address.network)
+                ),
+                persist=False,
+            )
+            if hints.is_connected(address, port):
+                sshtools.cache.get_cache().put(
+                    ip_address.ssh_cache_key, True, persist=False
+                )
+
+        if not hinted_ips:
+            return
+        logger.debug("The kernel knows these ips are up: %s", hinted_ips)
+
+        def confirm():
+            for hinted_ip in hinted_ips:
+                hinted_ip.record_ping(hinted_ip.probe_ping())
+
+        threading.Thread(target=confirm, daemon=True).start()
+
+    def get_alive_addresses(
+        self, only_sshable: bool = False, include_backed_off: bool = False
+    ) -> "IPAddressList":
         """
         Determine which ip addresses from the collection are reachable.
         Multiple filters (only_*) will act as an AND operation.
 
         :param only_sshable: Only return IPs that can be connected to using SSH
+        :param include_backed_off:
+            Also probe the IPs whose backoff window is still open (for background refreshes)
 
         :return: A IPAddressList of reachable ip addresses
         """
 
-        def is_ip_alive(ip_address: IPAddress) -> bool:
-            out = ip_address.is_alive
-            if only_sshable:
-                out = out and ip_address.is_sshable()
-            return out
-
-        # Lookup ssh/mosh-ability for all IPAddresses simultaneously to improve performance
-        timtools.multithreading.mt_map(lambda i: i.cache_online, self._ip_addresses)
+        alive_ips_set: set[IPAddress] = set()
+
+        def probe_endpoint(aliases: list[IPAddress]):
+            # The first alias probes the endpoint, the others use its cached results
+            for alias in aliases:
+                if self.is_ip_alive(alias, only_sshable=only_sshable):
+                    alive_ips_set.add(alias)
+
+        endpoints = self.get_endpoints()
+        self.apply_hints(endpoints)
+        alias_groups = [
+            [
+                alias
+                for alias in aliases
+                if include_backed_off or not is_probe_deferred(alias)
+            ]
+            for aliases in endpoints.values()
+        ]
+
+        # Probe all endpoints simultaneously to improve performance
+        sshtools.tools.mt_map(
+            probe_endpoint, [group for group in alias_groups if group]
+        )
 
-        alive_ips_list = sshtools.tools.mt_filter(is_ip_alive, self._ip_addresses)
-        alive_ips: IPAddressList = IPAddressList(alive_ips_list)
-        return alive_ips
+        return self.intersection(alive_ips_set)
 
-    def sort_ips(self):
-        """
-        Sort the ip addresses based on the order of precedence for connecting
+    def get_best_address(self, only_sshable: bool = False) -> Optional[IPAddress]:
         """
-        if self._is_sorted:
-            return
+        Determine the best ranked reachable ip address of the collection.
+        Returns as soon as no candidate that is still being probed can beat
+        the best reachable one, the remaining probes finish in the background.
+        Candidates that are backed off after repeated failures are not probed
+        until their backoff window expires.
 
-        def sort_value(ip_address: IPAddress) -> float:
-            value: float = ip_address.latency
-            if not any(char.isdigit() for char in str(ip_address)):
-                if ".local" in str(ip_address):
-                    value -= 7
-                else:
-                    value -= 5
+        :param only_sshable: Only return IPs that can be connected to using SSH
 
-            if ip_address.config and ip_address.config.mosh:
-                value -= 10
+        :return: The best reachable ip address or None if none is reachable
+        """
+        return CandidateRanker(self, only_sshable=only_sshable).get_winner()
 
-            if ip_address.config and ip_address.config.priority:
-                priority = ip_address.config.priority
-            else:
-                priority = 80
-            value -= (100 - priority) / 10
+    def ranked(self, only_sshable: bool = False) -> Iterator[IPAddress]:
+        """
+        Yields the reachable ip addresses of the collection from best to worst ranked,
+        each as soon as no candidate that is still being probed can outrank it
 
-            return value
+        :param only_sshable: Only yield IPs that can be connected to using SSH
+        """
+        return iter(CandidateRanker(self, only_sshable=only_sshable))
 
-        sorted_ips = {}
+    @staticmethod
+    def is_ip_alive(ip_address: IPAddress, only_sshable: bool = False) -> bool:
+        """Is the ip address alive (and sshable if requested)?"""
+        out = ip_address.is_alive
+        if only_sshable:
+            out = out and ip_address.is_sshable()
+        return out
 
-        # Lookup ssh/mosh-ability for all IPAddresses simultaneously to improve performance
-        timtools.multithreading.mt_map(lambda i: i.cache_online, self._ip_addresses)
+    def sweep(self, include_backed_off: bool = False):
+        """
+        Ping all ip addresses of the collection in one pass over a single socket
+        and cache the results, so later checks do not need to probe them again
+        :param include_backed_off:
+            Also ping the IPs whose backoff window is still open (for background refreshes)
+        """
+        # One alias per endpoint is pinged, the others share its cached result
+        ip_addresses: list[IPAddress] = []
+        for aliases in self.get_endpoints().values():
+            for ip_address in aliases:
+                if (
+                    ip_address.config_value("check_online") is not False
+                    and ip_address.get_cached_ping() is None
+                    and (include_backed_off or not ip_address.is_backed_off)
+                    and sshtools.tailscale.get_known_ping(
+                        ip_address.ip_address, ip_address.network
+                    )
+                    is None
+                ):
+                    ip_addresses.append(ip_address)
+                    break
+        if not ip_addresses:
+            return
 
-        sorted_ips.update(
-            dict.fromkeys(
-                sorted(
-                    self._ip_addresses,
-                    key=sort_value,
+        resolved_addresses: dict[IPAddress, Optional[str]] = {
+            ip_address: ip_address.resolved_address for ip_address in ip_addresses
+        }
+        try:
+            results = sshtools.probe.ping_many(
+                [address for address in resolved_addresses.values() if address],
+                timeout=max(ip_address.ping_timeout for ip_address in ip_addresses),
+            )
+        except PermissionError:
+            logger.debug("ICMP sockets are not permitted, skipping the sweep")
+            return
+
+        for ip_address, resolved_address in resolved_addresses.items():
+            ip_address.record_ping(
+                results.get(
+                    resolved_address, sshtools.probe.PingResult(False, float("inf"))
                 )
             )
-        )
-        self._ip_addresses = list(sorted_ips.keys())
-        self._last_sort_hash = hash_ip_list(self._ip_addresses)
+
+    def sort_ips(self):
+        """
+        Sort the ip addresses based on the order of precedence for connecting
+        (unreachable ip addresses keep their order at the end of the collection)
+        """
+        if self._is_sorted:
+            return
+
+        members = dict.fromkeys(self.ranked())
+        members.update(self._members)
+        self._members = members
+        self._sorted_version = self._version
 
     @property
-    def _is_sorted(self):
+    def _is_sorted(self) -> bool:
         """
-        Checks if the order and/or composition of the ip list
+        Checks if the composition of the ip list
         has been changed since the last sort
         """
-        list_hash = hash_ip_list(self._ip_addresses)
-        return list_hash == self._last_sort_hash
+        return self._sorted_version == self._version
+
+    @property
+    def _ip_addresses(self) -> list[IPAddress]:
+        """The ip addresses of the collection, in order"""
+        return list(self._members)
 
     @property
     def first(self) -> IPAddress:
         """Returns the first ip address in the collection after sorting"""
         self.sort_ips()
-        return self._ip_addresses[0]
+        for ip_address in self._members:
+            return ip_address
+        raise IndexError("The collection is empty")
 
     @property
     def length(self) -> int:
         """Returns the length of the collection"""
-        return len(self._ip_addresses)
+        return len(self._members)
 
     @property
     def list(self) -> list[IPAddress]:
         """Returns a list object of the collections"""
         return self._ip_addresses
 
-    def __iter__(self):
+    def __contains__(self, ip_address: IPAddress) -> bool:
+        return ip_address in self._members
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+    def __iter__(self) -> Iterator[IPAddress]:
         """Enables iterating over the list"""
-        return IPAddressListIterator(self)
+        return iter(self._members)
+
+
+class CandidateRanker:
+    """
+    Ranks the ip addresses of a collection while they are being probed.
+    The part of the sort value that is known up front decides the order of the probes
+    and bounds the value a candidate that is still being probed can obtain,
+    so a candidate is final as soon as no pending candidate can outrank it.
+    Candidates whose backoff window is still open are not probed.
+    """
+
+    ip_addresses: IPAddressList
+    only_sshable: bool
+    include_backed_off: bool
+
+    def __init__(
+        self,
+        ip_addresses: IPAddressList,
+        only_sshable: bool = False,
+        include_backed_off: bool = False,
+    ):
+        """
+        :param ip_addresses: The candidates
+        :param only_sshable: Only rank IPs that can be connected to using SSH
+        :param include_backed_off: Also probe the IPs whose backoff window is still open
+        """
+        self.ip_addresses = ip_addresses
+        self.only_sshable = only_sshable
+        self.include_backed_off = include_backed_off
 
+    def _probe(self) -> tuple[list[IPAddress], queue.Queue]:
+        """
+        Start probing all candidates in the background
+        :return: The candidates and the queue receiving (candidate, alive) pairs
+        """
+        endpoints = self.ip_addresses.get_endpoints()
+        self.ip_addresses.apply_hints(endpoints)
+        results: queue.Queue = queue.Queue()
+
+        def probe(aliases: list[IPAddress]):
+            # The first alias probes the endpoint, the others use its cached results
+            for alias in aliases:
+                alive = False
+                try:
+                    alive = IPAddressList.is_ip_alive(
+                        alias, only_sshable=self.only_sshable
+                    )
+                finally:
+                    results.put((alias, alive))
+
+        # Probe the endpoints with the most promising candidates first,
+        # the candidates that are backed off are left out
+        alias_groups: list[list[IPAddress]] = []
+        for aliases in endpoints.values():
+            probed = [
+                alias
+                for alias in aliases
+                if self.include_backed_off or not is_probe_deferred(alias)
+            ]
+            if probed:
+                alias_groups.append(sorted(probed, key=get_sort_value_bound))
+        alias_groups.sort(key=lambda aliases: get_sort_value_bound(aliases[0]))
+        for aliases in alias_groups:
+            # Daemon threads do not delay the exit of the program
+            threading.Thread(target=probe, args=(aliases,), daemon=True).start()
+
+        return [alias for aliases in alias_groups for alias in aliases], results
+
+    def _rank(self) -> Iterator[IPAddress]:
+        """Yields the reachable candidates from best to worst ranked"""
+        candidates, results = self._probe()
+        bounds: dict[IPAddress, float] = {
+            candidate: get_sort_value_bound(candidate) for candidate in candidates
+        }
+        order: dict[IPAddress, int] = {
+            candidate: index for index, candidate in enumerate(candidates)
+        }
+        pending: set[IPAddress] = set(candidates)
+        # Reachable candidates that may still be outranked: (sort value, order, candidate)
+        ready: list[tuple[float, int, IPAddress]] = []
+
+        while pending or ready:
+            bound = min(
+                (bounds[candidate] for candidate in pending), default=float("inf")
+            )
+            while ready and ready[0][0] <= bound:
+                yield heapq.heappop(ready)[2]
+            if not pending:
+                break
+
+            ip_address, alive = results.get()
+            pending.discard(ip_address)
+            if alive:
+                heapq.heappush(
+                    ready, (get_sort_value(ip_address), order[ip_address], ip_address)
+                )
 
-class IPAddressListIterator:  # pylint: disable=too-few-public-methods
-    """Iterator class for IPAddressLists"""
+    def __iter__(self) -> Iterator[IPAddress]:
+        """Yields the reachable candidates in their final order"""
+        return self._rank()
 
-    def __init__(self, ip_address_list: IPAddressList):
-        self._ip_address_list = ip_address_list
-        # variable to keep track of current index
-        self._index = 0
+    def get_winner(self) -> Optional[IPAddress]:
+        """Returns the best ranked reachable candidate as soon as it is known"""
+        winner = next(self._rank(), None)
+        if winner is not None:
+            logger.debug("Selected %s as the best candidate", winner)
+        return winner
 
-    def __next__(self):
-        """Returns the next value from the object's lists"""
-        if self._index < self._ip_address_list.length:
-            result = self._ip_address_list.list[self._index]
-            self._index += 1
-            return result
 
-        raise StopIteration
+_current_ips: tuple[int, Optional[IPAddressList]] = (-1, None)
 
 
-@cachetools.func.ttl_cache(ttl=sshtools.tools.IP_CACHE_TIMEOUT)
 def get_current_ips() -> IPAddressList:
     """Get the IPs that the current device has assigned"""
-    interface_data = psutil.net_if_addrs()
-    interface_names = sorted(interface_data.keys())
-    addresses = IPAddressList()
-    for interface_name in interface_names:
-        try:
-            ip_address_list = IPAddressList(
-                [
-                    sshtools.ip.IPAddress(address.address)
-                    for address in interface_data[interface_name]
-                    if address.family == socket.AF_INET
-                ]
-            )
-            addresses.add_list(ip_address_list)
-        except StopIteration:
-            pass
+    global _current_ips  # pylint: disable=global-statement,invalid-name
+    network_state = sshtools.netstate.get_state()
+    generation, addresses = _current_ips
+    if generation == network_state.generation and addresses is not None:
+        return addresses
+
+    addresses = IPAddressList(
+        [IPAddress(address) for address in network_state.get_addresses(socket.AF_INET)]
+    )
     if addresses.length == 0:
         raise sshtools.errors.NetworkError()
 
@@ -197,5 +522,6 @@ def get_current_ips() -> IPAddressList:
         addresses.length,
         str(addresses.list),
     )
+    _current_ips = (network_state.generation, addresses)
 
     return addresses
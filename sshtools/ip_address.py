@@ -1,7 +1,6 @@
 """Module for handling ip addresses"""
 from __future__ import annotations  # python -3.9 compatibility
 
-import dataclasses
 import ipaddress
 import re
 import socket
@@ -13,30 +12,42 @@ import timtools.bash
 import timtools.log
 import timtools.multithreading
 
+import sshtools.backoff
+import sshtools.cache
 import sshtools.connection
 import sshtools.device
+import sshtools.probe
+import sshtools.resolver
+import sshtools.tailscale
 import sshtools.tools
 from sshtools.config import IPConnectionConfig
 
 logger = timtools.log.get_logger("sshtools.ip_address")
 
+PingResult = sshtools.probe.PingResult
 
-@dataclasses.dataclass
-class PingResult:
-    """Class to store the result of a ping operation"""
 
-    alive: bool
-    latency: float
-
-
-class IPAddress:
+class IPAddress:  # pylint:disable=too-many-public-methods
     """An IP address. IP objects with the same IP address will behave like singletons"""
 
+    __slots__ = (
+        "ip_address",
+        "version",
+        "is_hostname",
+        "config",
+        "__ip_obj",
+        "__network",
+    )
+
     ip_address: str
     version: int
     is_hostname: bool
-    config: IPConnectionConfig = None
+    config: typing.Optional[IPConnectionConfig]
     __ip_obj: ipaddress.ip_address
+    # The network looked up for the ip address and the configuration it was looked up in
+    __network: tuple[
+        typing.Optional[dict], typing.Optional[sshtools.connection.Network]
+    ]
     __instances: dict[str, "IPAddress"] = {}
 
     def __init__(self, ip_address: str, hostname: bool = False):
@@ -55,6 +66,8 @@ class IPAddress:
             return cls.__instances[ip_address]
 
         instance = super(IPAddress, cls).__new__(cls)
+        instance.config = None
+        instance.__network = (None, None)
         cls.__instances[ip_address] = instance
         return instance
 
@@ -64,11 +77,19 @@ class IPAddress:
         if self.config and self.config.network:
             return self.config.network
 
-        for network in sshtools.connection.Network.get_networks():
-            if network.has_ip_address(self):
-                return network
+        network_configs = sshtools.connection.Network.get_configs()
+        source, network = self.__network
+        if source is not network_configs:
+            network = sshtools.connection.Network.get_network_of(self)
+            self.__network = (network_configs, network)
+        return network
 
-        return None
+    @property
+    def ip_object(
+        self,
+    ) -> typing.Optional[typing.Union[ipaddress.IPv4Address, ipaddress.IPv6Address]]:
+        """The parsed ip address (None for hostnames)"""
+        return self.__ip_obj
 
     def _determine_ip_version(self) -> int:
         """
@@ -86,6 +107,24 @@ class IPAddress:
 
         raise ValueError(f"{self.ip_address} is not a valid ip address or hostname.")
 
+    @property
+    def resolved_address(self) -> typing.Optional[str]:
+        """The ip address this address resolves to (None if it cannot be resolved)"""
+        if self.__ip_obj:
+            return self.ip_address
+        return sshtools.resolver.get_resolver().resolve(self.ip_address)
+
+    @property
+    def endpoint(self) -> tuple[str, int]:
+        """
+        The resolved address and SSH port of the ip address.
+        Aliases (e.g. a hostname and its ip) share an endpoint and their probe results.
+        """
+        resolved_address = self.resolved_address
+        if resolved_address is None:
+            return self.ip_address, self.ssh_port
+        return resolved_address, self.ssh_port
+
     @property
     def is_vpn(self) -> bool:
         """Is the ip address a VPN?"""
@@ -126,12 +165,109 @@ class IPAddress:
 
         timtools.multithreading.mt_map(exec_string_method, ["ping", "sshable"])
 
-    @cachetools.func.ttl_cache(ttl=sshtools.tools.IP_CACHE_TIMEOUT)
     def ping(self) -> PingResult:
         """Is the ip address alive?"""
         if self.config_value("check_online") is False:
             return PingResult(True, -1)
 
+        cached_result = self.get_cached_ping()
+        if cached_result is not None:
+            return cached_result
+
+        known_result = sshtools.tailscale.get_known_ping(self.ip_address, self.network)
+        if known_result is not None:
+            logger.debug("Tailscale knows the state of %s: %s", self, known_result)
+            self.cache_ping(known_result, persist=False)
+            return known_result
+
+        ping_result = self.probe_ping()
+        self.record_ping(ping_result)
+        return ping_result
+
+    def probe_ping(self) -> PingResult:
+        """Ping the ip address, ignoring any cached result"""
+        resolved_address = self.resolved_address
+        if resolved_address is None:
+            logger.debug("%s could not be resolved", self)
+            return PingResult(False, float("inf"))
+
+        try:
+            return sshtools.probe.ping(resolved_address, timeout=self.ping_timeout)
+        except PermissionError:
+            logger.debug(
+                "ICMP sockets are not permitted, falling back to the ping executable"
+            )
+            return self._ping_executable()
+
+    def record_ping(self, ping_result: PingResult):
+        """
+        Learn from a fresh result of pinging the ip address and cache it
+        :param ping_result: The result of the ping
+        """
+        if ping_result.alive:
+            sshtools.backoff.get_history().record_success(self.ip_address)
+            if self.network is not None:
+                self.network.record_rtt(ping_result.latency)
+        else:
+            sshtools.backoff.get_history().record_failure(self.ip_address)
+        self.cache_ping(ping_result)
+
+    @property
+    def is_backed_off(self) -> bool:
+        """Has the ip address failed to answer so often that it should not be awaited?"""
+        return sshtools.backoff.get_history().is_backed_off(self.ip_address)
+
+    @property
+    def ping_cache_key(self) -> str:
+        """The key of the ping result in the probe cache (shared by aliases)"""
+        address, _ = self.endpoint
+        return f"ping:{address}"
+
+    @property
+    def ssh_cache_key(self) -> str:
+        """The key of the SSH check in the probe cache (shared by aliases)"""
+        address, port = self.endpoint
+        return f"ssh:{address}:{port}"
+
+    def get_probe_cache_keys(self) -> list[str]:
+        """
+        Returns the keys of all probe results of the ip address in the probe cache,
+        without resolving the ip address
+        """
+        addresses = [self.ip_address]
+        if self.__ip_obj is None:
+            is_cached, resolved_address = sshtools.resolver.get_resolver().get_cached(
+                self.ip_address
+            )
+            if is_cached and resolved_address is not None:
+                addresses.append(resolved_address)
+        return [
+            key
+            for address in addresses
+            for key in [f"ping:{address}", f"ssh:{address}:{self.ssh_port}"]
+        ]
+
+    def get_cached_ping(self) -> typing.Optional[PingResult]:
+        """Returns the cached result of pinging the ip address (if any)"""
+        cached_result = sshtools.cache.get_cache().get(self.ping_cache_key)
+        if cached_result is None:
+            return None
+        return PingResult(*cached_result)
+
+    def cache_ping(self, ping_result: PingResult, persist: bool = True):
+        """
+        Store the result of pinging the ip address
+        :param ping_result: The result to store
+        :param persist: Also store the result on disk for other processes
+        """
+        sshtools.cache.get_cache().put(
+            self.ping_cache_key,
+            [ping_result.alive, ping_result.latency],
+            persist=persist,
+        )
+
+    def _ping_executable(self) -> PingResult:
+        """Ping the ip address using the ping executable"""
         ping_cmd = [
             "ping",
             "-q",  # be quiet
@@ -145,7 +281,7 @@ class IPAddress:
                 capture_stdout=True,
                 capture_stderr=True,
                 passable_exit_codes=[0, 2],
-                timeout=sshtools.tools.IP_PING_TIMEOUT,
+                timeout=self.ping_timeout,
             )
             is_alive = ping_result.exit_code == 0
             if is_alive:
@@ -161,6 +297,20 @@ class IPAddress:
 
         return PingResult(is_alive, ping_time)
 
+    @property
+    def ping_timeout(self) -> float:
+        """The number of seconds to wait for a ping reply"""
+        if self.network is not None:
+            return self.network.ping_timeout
+        return sshtools.tools.IP_PING_TIMEOUT
+
+    @property
+    def ssh_timeout(self) -> float:
+        """The number of seconds to wait for the SSH server to answer"""
+        if self.network is not None:
+            return self.network.ssh_timeout
+        return sshtools.tools.IP_SSH_TIMEOUT
+
     @property
     def is_alive(self) -> bool:
         """Returns whether this IP address is alive"""
@@ -179,12 +329,46 @@ class IPAddress:
             return self.ip_address
         return f"{user}@{self.ip_address}"
 
-    @cachetools.func.ttl_cache(ttl=sshtools.tools.IP_CACHE_TIMEOUT)
+    @property
+    def ssh_port(self) -> int:
+        """Returns the port to connect to for SSH"""
+        ssh_port = self.config_value("ssh_port")
+        if ssh_port is None:
+            return 22
+        return int(ssh_port)
+
     def is_sshable(self) -> bool:
-        """Can an SSH connection be established to the IP?"""
+        """Is an SSH server answering on the IP?"""
         if not self.is_alive or self.config_value("ssh") is False:
             return False
 
+        cached_result = sshtools.cache.get_cache().get(self.ssh_cache_key)
+        if cached_result is not None:
+            return cached_result
+
+        resolved_address = self.resolved_address
+        if resolved_address is None:
+            # Connecting to None would connect to the loopback interface
+            logger.debug("%s could not be resolved, it is not sshable", self)
+            sshtools.cache.get_cache().put(self.ssh_cache_key, False)
+            return False
+
+        banner = sshtools.probe.ssh_banner(
+            resolved_address, port=self.ssh_port, timeout=self.ssh_timeout
+        )
+        logger.debug("SSH banner of %s: %s", self, banner)
+        sshtools.cache.get_cache().put(self.ssh_cache_key, banner is not None)
+        return banner is not None
+
+    @cachetools.func.ttl_cache(ttl=sshtools.tools.IP_CACHE_TIMEOUT)
+    def can_login(self) -> bool:
+        """
+        Can an (authenticated) SSH connection be established to the IP?
+        This is considerably slower than is_sshable.
+        """
+        if not self.is_sshable():
+            return False
+
         ssh_cmd: list[str] = [
             "ssh",
             "-o BatchMode=yes",
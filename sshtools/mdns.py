@@ -0,0 +1,174 @@
+"""Module for resolving .local hostnames with multicast DNS (RFC 6762)"""
+from __future__ import annotations  # python -3.9 compatibility
+
+import select
+import socket
+import struct
+import time
+import typing
+
+import timtools.log
+
+logger = timtools.log.get_logger("sshtools.mdns")
+
+MDNS_ADDRESS: tuple[str, int] = ("224.0.0.251", 5353)
+MDNS_TIMEOUT: float = 0.3
+# Keep the queries below the MTU of the network
+MDNS_PACKET_SIZE: int = 1400
+DNS_HEADER_SIZE: int = 12
+DNS_TYPE_A: int = 1
+DNS_CLASS_IN: int = 1
+# Ask for a unicast response (RFC 6762 section 5.4),
+# so no socket has to be bound to the mDNS port to receive the answers
+DNS_UNICAST_RESPONSE: int = 0x8000
+DNS_FLAG_RESPONSE: int = 0x8000
+MAX_COMPRESSION_POINTERS: int = 16
+
+
+def encode_name(name: str) -> bytes:
+    """
+    Encode a hostname as a sequence of DNS labels
+    :param name: The hostname (e.g. laptop.local)
+    """
+    labels = [label.encode("utf-8") for label in name.rstrip(".").split(".")]
+    return b"".join(bytes([len(label)]) + label for label in labels) + b"\x00"
+
+
+def build_queries(names: typing.Iterable[str]) -> list[bytes]:
+    """
+    Build the packets asking for the IPv4 addresses of hostnames
+    :param names: The hostnames
+    :return: As few packets as possible containing a question for every hostname
+    """
+    packets: list[bytes] = []
+    questions: list[bytes] = []
+
+    def add_packet():
+        header = struct.pack("!6H", 0, 0, len(questions), 0, 0, 0)
+        packets.append(header + b"".join(questions))
+
+    for name in names:
+        question = encode_name(name) + struct.pack(
+            "!HH", DNS_TYPE_A, DNS_CLASS_IN | DNS_UNICAST_RESPONSE
+        )
+        size = DNS_HEADER_SIZE + sum(len(queued) for queued in questions)
+        if questions and size + len(question) > MDNS_PACKET_SIZE:
+            add_packet()
+            questions = []
+        questions.append(question)
+
+    if questions:
+        add_packet()
+    return packets
+
+
+def read_name(data: bytes, offset: int) -> tuple[str, int]:
+    """
+    Read a (possibly compressed) name from a DNS packet
+    :param data: The packet
+    :param offset: The position of the name in the packet
+    :return: The name and the position after the name
+    """
+    labels: list[str] = []
+    end: typing.Optional[int] = None
+    pointers = 0
+    while True:
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            pointers += 1
+            if pointers > MAX_COMPRESSION_POINTERS:
+                raise ValueError("Too many compression pointers")
+            if end is None:
+                end = offset + 2
+            offset = ((length & 0x3F) << 8) | data[offset + 1]
+            continue
+
+        offset += 1
+        if length == 0:
+            break
+        labels.append(data[offset : offset + length].decode("utf-8", errors="replace"))
+        offset += length
+
+    return ".".join(labels), end if end is not None else offset
+
+
+def parse_response(data: bytes) -> dict[str, str]:
+    """
+    Returns the IPv4 addresses in a DNS response
+    :param data: The packet
+    :return: The address of every (lowercase) name with an A record in the response
+    """
+    answers: dict[str, str] = {}
+    try:
+        _, flags, questions, *record_counts = struct.unpack_from("!6H", data)
+        if not flags & DNS_FLAG_RESPONSE:
+            return answers
+
+        offset = DNS_HEADER_SIZE
+        for _ in range(questions):
+            _, offset = read_name(data, offset)
+            offset += 4
+
+        for _ in range(sum(record_counts)):
+            name, offset = read_name(data, offset)
+            record_type, _, _, length = struct.unpack_from("!HHIH", data, offset)
+            offset += 10
+            if offset + length > len(data):
+                raise ValueError("Record exceeds the packet")
+            if record_type == DNS_TYPE_A and length == 4:
+                answers.setdefault(
+                    name.lower(), socket.inet_ntoa(data[offset : offset + 4])
+                )
+            offset += length
+    except (IndexError, ValueError, struct.error) as error:
+        logger.debug("Ignoring malformed mDNS response: %s", error)
+    return answers
+
+
+def query(
+    names: typing.Iterable[str],
+    timeout: float = None,
+    target: tuple[str, int] = None,
+) -> typing.Optional[dict[str, str]]:
+    """
+    Ask for the addresses of many hostnames in one burst of multicast queries
+    :param names: The hostnames (e.g. laptop.local)
+    :param timeout: The number of seconds to collect answers
+    :param target: The address to send the queries to (defaults to the mDNS group)
+    :return:
+        The address of every hostname that was answered
+        or None if the queries could not be sent
+    """
+    requested = {name.rstrip(".").lower(): name for name in names}
+    if not requested:
+        return {}
+    if timeout is None:
+        timeout = MDNS_TIMEOUT
+    if target is None:
+        target = MDNS_ADDRESS
+
+    answers: dict[str, str] = {}
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as mdns_socket:
+            mdns_socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 255)
+            for packet in build_queries(requested.values()):
+                mdns_socket.sendto(packet, target)
+
+            deadline = time.monotonic() + timeout
+            while len(answers) < len(requested):
+                remaining = deadline - time.monotonic()
+                if (
+                    remaining <= 0
+                    or not select.select([mdns_socket], [], [], remaining)[0]
+                ):
+                    break
+                data, _ = mdns_socket.recvfrom(9000)
+                for name, address in parse_response(data).items():
+                    if name in requested:
+                        answers[requested[name]] = address
+    except OSError as error:
+        logger.debug("Could not send mDNS queries: %s", error)
+        return None
+
+    logger.debug("mDNS answered %d of %d names", len(answers), len(requested))
+    return answers
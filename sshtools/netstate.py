@@ -0,0 +1,193 @@
+"""Module for keeping track of the network interfaces and addresses of this machine"""
+from __future__ import annotations  # python -3.9 compatibility
+
+import functools
+import select
+import socket
+import struct
+import threading
+import time
+import typing
+
+import timtools.log
+
+import sshtools.cache
+import sshtools.resolver
+import sshtools.tools
+
+logger = timtools.log.get_logger("sshtools.netstate")
+
+# Multicast groups of rtnetlink (linux/rtnetlink.h)
+RTMGRP_LINK: int = 0x1
+RTMGRP_IPV4_IFADDR: int = 0x10
+RTMGRP_IPV4_ROUTE: int = 0x40
+RTMGRP_IPV6_IFADDR: int = 0x100
+RTMGRP_IPV6_ROUTE: int = 0x400
+RTNETLINK_GROUPS: int = (
+    RTMGRP_LINK
+    | RTMGRP_IPV4_IFADDR
+    | RTMGRP_IPV4_ROUTE
+    | RTMGRP_IPV6_IFADDR
+    | RTMGRP_IPV6_ROUTE
+)
+RTM_MESSAGE_TYPES: dict[int, str] = {
+    16: "RTM_NEWLINK",
+    17: "RTM_DELLINK",
+    20: "RTM_NEWADDR",
+    21: "RTM_DELADDR",
+    24: "RTM_NEWROUTE",
+    25: "RTM_DELROUTE",
+}
+# Events arriving within this many seconds of each other are handled together
+EVENT_SETTLE_TIME: float = 0.05
+
+Snapshot = dict[str, tuple[tuple[int, str], ...]]
+
+
+def parse_netlink_messages(data: bytes) -> list[str]:
+    """
+    Returns the names of the rtnetlink messages in a netlink datagram
+    :param data: The datagram received on a netlink socket
+    """
+    message_names: list[str] = []
+    offset = 0
+    while offset + 16 <= len(data):
+        length, message_type = struct.unpack_from("=IH", data, offset)
+        if length < 16:
+            break
+        message_names.append(RTM_MESSAGE_TYPES.get(message_type, str(message_type)))
+        offset += (length + 3) & ~3
+    return message_names
+
+
+def take_snapshot() -> Snapshot:
+    """Returns the addresses assigned to every interface of this machine"""
+    # psutil is slow to import and only needed once the network is inspected
+    import psutil  # pylint: disable=import-outside-toplevel
+
+    return {
+        interface_name: tuple(
+            (address.family, address.address) for address in addresses
+        )
+        for interface_name, addresses in sorted(psutil.net_if_addrs().items())
+    }
+
+
+class NetworkState:
+    """
+    Always-current snapshot of the interfaces and addresses of this machine.
+    Changes are picked up from rtnetlink events, when those are not available
+    the snapshot is refreshed after IP_CACHE_TIMEOUT seconds instead.
+    """
+
+    generation: int
+    watching: bool
+    _snapshot: Snapshot
+    _updated: float
+    _callbacks: list[typing.Callable[[], None]]
+    _lock: threading.RLock
+
+    def __init__(self, watch: bool = True):
+        self.generation = 0
+        self.watching = False
+        self._snapshot = {}
+        self._updated = 0
+        self._callbacks = []
+        self._lock = threading.RLock()
+        self.update(take_snapshot())
+        if watch:
+            self._start_watching()
+
+    def on_change(self, callback: typing.Callable[[], None]):
+        """
+        Register a function that is called whenever the interfaces or addresses change
+        :param callback: A function without arguments
+        """
+        self._callbacks.append(callback)
+
+    def update(self, snapshot: Snapshot):
+        """
+        Replace the snapshot, notifying the listeners when it changed
+        :param snapshot: The new snapshot (see take_snapshot)
+        """
+        with self._lock:
+            self._updated = time.monotonic()
+            if snapshot == self._snapshot:
+                return
+            self._snapshot = snapshot
+            self.generation += 1
+
+        logger.debug("Network state changed (generation %d)", self.generation)
+        for callback in self._callbacks:
+            callback()
+
+    @property
+    def snapshot(self) -> Snapshot:
+        """The addresses assigned to every interface of this machine"""
+        if (
+            not self.watching
+            and time.monotonic() - self._updated > sshtools.tools.IP_CACHE_TIMEOUT
+        ):
+            self.update(take_snapshot())
+        return self._snapshot
+
+    @property
+    def interfaces(self) -> list[str]:
+        """The names of the interfaces of this machine"""
+        return list(self.snapshot.keys())
+
+    def get_addresses(self, family: int = socket.AF_INET) -> list[str]:
+        """
+        Returns the addresses of this machine
+        :param family: The address family of the addresses (e.g. socket.AF_INET)
+        """
+        return [
+            address
+            for addresses in self.snapshot.values()
+            for address_family, address in addresses
+            if address_family == family
+        ]
+
+    def _start_watching(self):
+        """Subscribe to rtnetlink events in a background thread"""
+        try:
+            netlink_socket = socket.socket(
+                socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE
+            )
+            netlink_socket.bind((0, RTNETLINK_GROUPS))
+        except (AttributeError, OSError) as error:
+            logger.debug("rtnetlink is not available, polling instead: %s", error)
+            return
+
+        self.watching = True
+        threading.Thread(
+            target=self._watch, args=(netlink_socket,), daemon=True
+        ).start()
+
+    def _watch(self, netlink_socket: socket.socket):
+        """Refresh the snapshot whenever rtnetlink reports a change"""
+        with netlink_socket:
+            while True:
+                try:
+                    events = parse_netlink_messages(netlink_socket.recv(65536))
+                    # Wait for a burst of events to settle before taking a snapshot
+                    while select.select([netlink_socket], [], [], EVENT_SETTLE_TIME)[0]:
+                        events += parse_netlink_messages(netlink_socket.recv(65536))
+                except OSError as error:
+                    logger.debug("Stopped watching rtnetlink: %s", error)
+                    self.watching = False
+                    return
+
+                logger.debug("rtnetlink events: %s", ", ".join(events))
+                self.update(take_snapshot())
+
+
+@functools.lru_cache(maxsize=None)
+def get_state() -> NetworkState:
+    """Returns the network state of this machine"""
+    state = NetworkState()
+    # Results of earlier probes say nothing about reachability from a new network
+    state.on_change(sshtools.cache.get_cache().invalidate)
+    # Hostnames may resolve differently (or not at all) on another network
+    state.on_change(sshtools.resolver.get_resolver().invalidate)
+    return state
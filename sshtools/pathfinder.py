@@ -90,9 +90,16 @@ class PathFinder:
         if self.in_same_network(self.source, self.target):
             possible_paths.append(Path(path))
 
+        target_networks = [
+            network.name
+            for network in self.get_device_networks(self.target)
+            if not network.is_public
+        ]
         relays = sshtools.tools.mt_filter(
             self.device_is_a_possible_relay,
-            sshtools.device.DeviceConfig.get_devices(),
+            sshtools.device.DeviceConfig.get_devices(
+                filter_ssh=True, networks=target_networks
+            ),
         )
 
         for device in relays:
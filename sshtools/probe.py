@@ -0,0 +1,463 @@
+"""Module for probing the reachability of ip addresses without spawning subprocesses"""
+from __future__ import annotations  # python -3.9 compatibility
+
+import dataclasses
+import errno
+import itertools
+import random
+import select
+import socket
+import struct
+import time
+import typing
+
+import timtools.log
+
+import sshtools.profiling
+import sshtools.tools
+
+logger = timtools.log.get_logger("sshtools.probe")
+
+ICMP_ECHO_REQUEST: int = 8
+ICMP_ECHO_REPLY: int = 0
+ICMPV6_ECHO_REQUEST: int = 128
+ICMPV6_ECHO_REPLY: int = 129
+ICMP_PAYLOAD: bytes = b"sshtools"
+SSH_BANNER_PREFIXES: tuple[str, ...] = ("SSH-2.0-", "SSH-1.99-")
+SSH_BANNER_MAX_LENGTH: int = 4096
+# Opening an ICMP socket fails with these errors when the address family (e.g. IPv6)
+# or the ICMP protocol is not supported, the addresses are unreachable then
+ICMP_UNSUPPORTED_ERRNOS: tuple[int, ...] = (
+    errno.EAFNOSUPPORT,
+    errno.EPROTONOSUPPORT,
+    errno.ESOCKTNOSUPPORT,
+)
+
+_sequence_counter = itertools.count(1)
+
+
+@dataclasses.dataclass
+class PingResult:
+    """Class to store the result of a ping operation"""
+
+    alive: bool
+    latency: float
+
+
+@dataclasses.dataclass
+class EchoReply:
+    """An ICMP echo reply received on an IcmpSocket"""
+
+    identifier: int
+    sequence: int
+    time: float
+
+
+def checksum(data: bytes) -> int:
+    """
+    Calculate the internet checksum (RFC 1071) of a packet
+    :param data: The bytes to calculate the checksum for
+    :return: The 16-bit checksum
+    """
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def build_echo_request(
+    identifier: int, sequence: int, family: int = socket.AF_INET
+) -> bytes:
+    """
+    Build an ICMP(v6) echo request packet
+    :param identifier: The identifier of the echo request
+    :param sequence: The sequence number of the echo request
+    :param family: The address family (socket.AF_INET or socket.AF_INET6)
+    :return: The packet, including its checksum
+    """
+    icmp_type = ICMP_ECHO_REQUEST if family == socket.AF_INET else ICMPV6_ECHO_REQUEST
+    header = struct.pack("!BBHHH", icmp_type, 0, 0, identifier, sequence)
+    packet_checksum = checksum(header + ICMP_PAYLOAD)
+    header = struct.pack("!BBHHH", icmp_type, 0, packet_checksum, identifier, sequence)
+    return header + ICMP_PAYLOAD
+
+
+def parse_echo_reply(
+    packet: bytes, family: int = socket.AF_INET, has_ip_header: bool = False
+) -> typing.Optional[tuple[int, int]]:
+    """
+    Parse an ICMP(v6) packet
+    :param packet: The received packet
+    :param family: The address family (socket.AF_INET or socket.AF_INET6)
+    :param has_ip_header: Does the packet start with an IPv4 header (raw sockets)
+    :return: The identifier and sequence number if it is an echo reply, otherwise None
+    """
+    if has_ip_header:
+        header_length = (packet[0] & 0x0F) * 4
+        packet = packet[header_length:]
+    if len(packet) < 8:
+        return None
+
+    icmp_type, _, _, identifier, sequence = struct.unpack("!BBHHH", packet[:8])
+    reply_type = ICMP_ECHO_REPLY if family == socket.AF_INET else ICMPV6_ECHO_REPLY
+    if icmp_type != reply_type:
+        return None
+    return identifier, sequence
+
+
+def resolve_address(
+    address: str,
+) -> typing.Optional[tuple[int, tuple]]:
+    """
+    Resolve an ip address or hostname to a socket address
+    (a hostname is looked up serially, use sshtools.resolver for many hostnames)
+    :param address: The ip address or hostname
+    :return: The address family and socket address, or None if it cannot be resolved
+    """
+    try:
+        addr_info = socket.getaddrinfo(address, None, type=socket.SOCK_DGRAM)
+    except (socket.gaierror, UnicodeError):
+        return None
+
+    for family, _, _, _, sockaddr in addr_info:
+        if family in (socket.AF_INET, socket.AF_INET6):
+            return family, sockaddr
+    return None
+
+
+def resolve_addresses(addresses: list[str]) -> dict[str, tuple[int, tuple]]:
+    """
+    Resolve many ip addresses and hostnames to socket addresses,
+    the hostnames are looked up concurrently
+    :param addresses: The ip addresses and hostnames
+    :return: The address family and socket address of every address that could be resolved
+    """
+    from sshtools import resolver  # pylint: disable=import-outside-toplevel
+
+    resolved: dict[str, tuple[int, tuple]] = {}
+    for address, ip_address in resolver.get_resolver().resolve_all(addresses).items():
+        resolved_address = resolve_address(ip_address) if ip_address else None
+        if resolved_address is not None:
+            resolved[address] = resolved_address
+    return resolved
+
+
+class IcmpSocket:
+    """
+    A socket for sending ICMP echo requests and receiving their replies.
+    Unprivileged ICMP datagram sockets are preferred, raw sockets are used as a fallback.
+    """
+
+    _socket_types: dict[int, int] = {}
+
+    family: int
+    raw: bool
+    identifier: int
+
+    def __init__(self, family: int = socket.AF_INET):
+        self.family = family
+        self._socket = self._open_socket(family)
+        self._socket.setblocking(False)
+        self.raw = self._socket.type == socket.SOCK_RAW
+        # Datagram sockets get their identifier assigned by the kernel,
+        # which also only delivers the replies belonging to this socket
+        self.identifier = random.getrandbits(16)
+
+    @classmethod
+    def _open_socket(cls, family: int) -> socket.socket:
+        """
+        Open an ICMP socket, remembering which socket type is permitted
+        :raises PermissionError: When neither datagram nor raw ICMP sockets are permitted
+        """
+        protocol = (
+            socket.IPPROTO_ICMP if family == socket.AF_INET else socket.IPPROTO_ICMPV6
+        )
+        if family in cls._socket_types:
+            return socket.socket(family, cls._socket_types[family], protocol)
+
+        for socket_type in (socket.SOCK_DGRAM, socket.SOCK_RAW):
+            try:
+                icmp_socket = socket.socket(family, socket_type, protocol)
+            except PermissionError:
+                continue
+            cls._socket_types[family] = socket_type
+            return icmp_socket
+
+        raise PermissionError(
+            "Neither unprivileged nor raw ICMP sockets are permitted on this system"
+        )
+
+    def send(self, sockaddr: tuple, sequence: int) -> float:
+        """
+        Send an echo request
+        :param sockaddr: The socket address to send the echo request to
+        :param sequence: The sequence number of the echo request
+        :return: The (monotonic) time at which the request was sent
+        """
+        packet = build_echo_request(self.identifier, sequence, family=self.family)
+        send_time = time.monotonic()
+        self._socket.sendto(packet, sockaddr)
+        return send_time
+
+    def receive(self, timeout: float) -> list[EchoReply]:
+        """
+        Wait for echo replies
+        :param timeout: The maximum amount of seconds to wait for a reply
+        :return: The echo replies that arrived (empty if the timeout expired)
+        """
+        readable, _, _ = select.select([self._socket], [], [], max(timeout, 0))
+        if not readable:
+            return []
+
+        replies: list[EchoReply] = []
+        while True:
+            try:
+                packet = self._socket.recv(2048)
+            except (BlockingIOError, InterruptedError):
+                break
+            receive_time = time.monotonic()
+            parsed = parse_echo_reply(
+                packet,
+                family=self.family,
+                has_ip_header=self.raw and self.family == socket.AF_INET,
+            )
+            if parsed is None:
+                continue
+            identifier, sequence = parsed
+            if self.raw and identifier != self.identifier:
+                # Raw sockets receive the replies to every ICMP socket on the system
+                continue
+            replies.append(EchoReply(identifier, sequence, receive_time))
+        return replies
+
+    def fileno(self) -> int:
+        """Returns the file descriptor of the socket (allows using select)"""
+        return self._socket.fileno()
+
+    def close(self):
+        """Close the socket"""
+        self._socket.close()
+
+    def __enter__(self) -> IcmpSocket:
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def open_icmp_socket(family: int) -> typing.Optional[IcmpSocket]:
+    """
+    Open an ICMP socket for an address family
+    :raises PermissionError: When this process is not allowed to open ICMP sockets
+    :return: The socket or None if the address family or ICMP is not supported
+    """
+    try:
+        return IcmpSocket(family)
+    except PermissionError:
+        raise
+    except OSError as error:
+        if error.errno not in ICMP_UNSUPPORTED_ERRNOS:
+            raise
+        logger.debug("ICMP is not supported for address family %s: %s", family, error)
+        return None
+
+
+def next_sequence() -> int:
+    """Returns a sequence number for an echo request"""
+    return next(_sequence_counter) & 0xFFFF
+
+
+def ping(address: str, timeout: float = None) -> PingResult:
+    """
+    Send a single ICMP echo request to an address and wait for the reply
+    :param address: The ip address or hostname to ping
+    :param timeout: The maximum amount of seconds to wait for a reply
+    :raises PermissionError: When this process is not allowed to open ICMP sockets
+    :return: A PingResult with the round trip time in milliseconds
+    """
+    sshtools.profiling.mark("first probe")
+    if timeout is None:
+        timeout = sshtools.tools.IP_PING_TIMEOUT
+    deadline = time.monotonic() + timeout
+
+    resolved = resolve_address(address)
+    if resolved is None:
+        logger.debug("%s could not be resolved", address)
+        return PingResult(False, float("inf"))
+    family, sockaddr = resolved
+
+    icmp_socket = open_icmp_socket(family)
+    if icmp_socket is None:
+        return PingResult(False, float("inf"))
+    with icmp_socket:
+        sequence = next_sequence()
+        try:
+            send_time = icmp_socket.send(sockaddr, sequence)
+        except OSError as error:
+            logger.debug("Could not send echo request to %s: %s", address, error)
+            return PingResult(False, float("inf"))
+
+        while (remaining := deadline - time.monotonic()) > 0:
+            for reply in icmp_socket.receive(remaining):
+                if reply.sequence == sequence:
+                    return PingResult(True, (reply.time - send_time) * 1000)
+
+    return PingResult(False, float("inf"))
+
+
+def _wait_for_replies(
+    icmp_sockets: dict[int, IcmpSocket],
+    pending: dict[tuple[int, int], tuple[str, float]],
+    deadline: float,
+) -> dict[str, PingResult]:
+    """
+    Collect the echo replies to the pending requests of a sweep
+    :param icmp_sockets: The socket used for every address family
+    :param pending: The address and send time of every (family, sequence) pair
+    :param deadline: The (monotonic) time after which no replies are awaited
+    :return: A PingResult for every address that replied
+    """
+    results: dict[str, PingResult] = {}
+    while pending and (remaining := deadline - time.monotonic()) > 0:
+        readable, _, _ = select.select(list(icmp_sockets.values()), [], [], remaining)
+        for family, icmp_socket in icmp_sockets.items():
+            if icmp_socket not in readable:
+                continue
+            for reply in icmp_socket.receive(0):
+                if (family, reply.sequence) in pending:
+                    address, send_time = pending.pop((family, reply.sequence))
+                    results[address] = PingResult(True, (reply.time - send_time) * 1000)
+    return results
+
+
+def ping_many(
+    addresses: typing.Iterable[str], timeout: float = None
+) -> dict[str, PingResult]:
+    """
+    Ping many addresses at once over a single socket per address family (like fping)
+    :param addresses: The ip addresses or hostnames to ping
+    :param timeout: The maximum amount of seconds to wait for all replies
+    :raises PermissionError: When this process is not allowed to open ICMP sockets
+    :return: A dictionary with a PingResult for every address
+    """
+    sshtools.profiling.mark("first probe")
+    if timeout is None:
+        timeout = sshtools.tools.IP_PING_TIMEOUT
+    addresses = list(dict.fromkeys(addresses))
+    results: dict[str, PingResult] = {
+        address: PingResult(False, float("inf")) for address in addresses
+    }
+
+    resolved = resolve_addresses(addresses)
+    deadline = time.monotonic() + timeout
+
+    icmp_sockets: dict[int, IcmpSocket] = {}
+    try:
+        for family in {family for family, _ in resolved.values()}:
+            icmp_socket = open_icmp_socket(family)
+            if icmp_socket is not None:
+                icmp_sockets[family] = icmp_socket
+
+        # Replies are matched to their address by their sequence number
+        pending: dict[tuple[int, int], tuple[str, float]] = {}
+        for sequence, (address, (family, sockaddr)) in enumerate(
+            resolved.items(), start=1
+        ):
+            if family not in icmp_sockets:
+                continue
+            try:
+                send_time = icmp_sockets[family].send(sockaddr, sequence & 0xFFFF)
+            except OSError as error:
+                logger.debug("Could not send echo request to %s: %s", address, error)
+                continue
+            pending[(family, sequence & 0xFFFF)] = (address, send_time)
+
+        results.update(_wait_for_replies(icmp_sockets, pending, deadline))
+    finally:
+        for icmp_socket in icmp_sockets.values():
+            icmp_socket.close()
+
+    logger.debug(
+        "Swept %d addresses, %d replied",
+        len(addresses),
+        sum(result.alive for result in results.values()),
+    )
+    return results
+
+
+def connect_tcp(
+    address: str, port: int, deadline: float
+) -> typing.Optional[socket.socket]:
+    """
+    Open a non-blocking TCP connection
+    :param address: The ip address or hostname to connect to
+    :param port: The port to connect to
+    :param deadline: The (monotonic) time by which the connection must be established
+    :return: The connected socket or None if no connection could be established
+    """
+    sshtools.profiling.mark("first probe")
+    try:
+        addr_info = socket.getaddrinfo(address, int(port), type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError, ValueError):
+        logger.debug("%s could not be resolved", address)
+        return None
+    family, socket_type, protocol, _, sockaddr = addr_info[0]
+
+    tcp_socket = socket.socket(family, socket_type, protocol)
+    tcp_socket.setblocking(False)
+    error_code = tcp_socket.connect_ex(sockaddr)
+    if error_code in (0, errno.EINPROGRESS):
+        _, writable, _ = select.select(
+            [], [tcp_socket], [], max(deadline - time.monotonic(), 0)
+        )
+        if writable and tcp_socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0:
+            return tcp_socket
+
+    tcp_socket.close()
+    return None
+
+
+def ssh_banner(
+    address: str, port: int = 22, timeout: float = None
+) -> typing.Optional[str]:
+    """
+    Open a non-blocking TCP connection to an SSH server and read its identification string
+    :param address: The ip address or hostname of the server
+    :param port: The port the SSH server listens on
+    :param timeout: The maximum amount of seconds to wait for the banner
+    :return: The SSH identification string (e.g. 'SSH-2.0-OpenSSH_9.6') or None
+    """
+    if timeout is None:
+        timeout = sshtools.tools.IP_SSH_TIMEOUT
+    deadline = time.monotonic() + timeout
+
+    tcp_socket = connect_tcp(address, port, deadline)
+    if tcp_socket is None:
+        return None
+
+    with tcp_socket:
+        received: bytes = b""
+        while (remaining := deadline - time.monotonic()) > 0:
+            readable, _, _ = select.select([tcp_socket], [], [], remaining)
+            try:
+                data = tcp_socket.recv(1024) if readable else b""
+            except (BlockingIOError, InterruptedError):
+                continue
+            except OSError:
+                data = b""
+            if not data:
+                break
+            received += data
+
+            # The server may send other lines before its identification string
+            *lines, received = received.split(b"\n")
+            for line in lines:
+                banner = line.rstrip(b"\r").decode("utf-8", errors="replace")
+                if banner.startswith(SSH_BANNER_PREFIXES):
+                    return banner
+            if len(received) > SSH_BANNER_MAX_LENGTH:
+                break
+
+    return None
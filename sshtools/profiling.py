@@ -0,0 +1,129 @@
+"""
+Module for measuring the startup time of the command line tools.
+Set SSHTOOLS_PROFILE=1 to print the import cost of every module
+and the time until the first probe when the program exits.
+"""
+from __future__ import annotations  # python -3.9 compatibility
+
+import atexit
+import os
+import sys
+import threading
+import time
+import types
+import typing
+
+PROFILE_ENV: str = "SSHTOOLS_PROFILE"
+PROFILE_TOP: int = 25
+START_TIME: float = time.perf_counter()
+
+
+class TimingLoader:
+    """Wraps the loader of a module to measure how long executing the module takes"""
+
+    def __init__(self, loader: typing.Any, name: str, profiler: ImportProfiler):
+        self.loader = loader
+        self.name = name
+        self.profiler = profiler
+
+    def create_module(self, spec) -> typing.Optional[types.ModuleType]:
+        """Create the module using the wrapped loader"""
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module: types.ModuleType):
+        """Execute the module using the wrapped loader and store its import time"""
+        stack = self.profiler.get_stack()
+        stack.append(0)
+        start = time.perf_counter()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            total = time.perf_counter() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += total
+            self.profiler.timings[self.name] = (total - children, total)
+
+    def __getattr__(self, name: str):
+        # Keep resource readers and the like of the wrapped loader available
+        return getattr(self.loader, name)
+
+
+class ImportProfiler:
+    """Measures the own and the cumulative import time of every module"""
+
+    timings: dict[str, tuple[float, float]]
+    milestones: dict[str, float]
+    _local: threading.local
+
+    def __init__(self):
+        self.timings = {}
+        self.milestones = {}
+        self._local = threading.local()
+
+    def get_stack(self) -> list[float]:
+        """Returns the import times of the children of the modules being imported"""
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def find_spec(self, fullname: str, path=None, target=None):
+        """Find the module using the other finders and wrap its loader"""
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = TimingLoader(spec.loader, fullname, self)
+        return spec
+
+    def mark(self, event: str):
+        """Remember when an event first happened"""
+        self.milestones.setdefault(event, time.perf_counter() - START_TIME)
+
+    def report(self, stream: typing.TextIO = None):
+        """Print the milestones and the modules that took longest to import"""
+        if stream is None:
+            stream = sys.stderr
+        stream.write(f"sshtools startup profile ({PROFILE_ENV})\n")
+        for event, elapsed in self.milestones.items():
+            stream.write(f"  {event}: {elapsed * 1000:.1f} ms\n")
+        stream.write(f"  exit: {(time.perf_counter() - START_TIME) * 1000:.1f} ms\n")
+
+        stream.write(f"Slowest imports (top {PROFILE_TOP}):\n")
+        stream.write(f"  {'self ms':>8} {'total ms':>9}  module\n")
+        slowest = sorted(self.timings.items(), key=lambda item: -item[1][0])
+        for name, (own, total) in slowest[:PROFILE_TOP]:
+            stream.write(f"  {own * 1000:8.1f} {total * 1000:9.1f}  {name}\n")
+
+
+_profiler: typing.Optional[ImportProfiler] = None  # pylint: disable=invalid-name
+
+
+def enable():
+    """Start measuring imports and report when the program exits"""
+    global _profiler  # pylint: disable=global-statement,invalid-name
+    if _profiler is not None:
+        return
+    _profiler = ImportProfiler()
+    sys.meta_path.insert(0, _profiler)
+    atexit.register(_profiler.report)
+
+
+def is_requested() -> bool:
+    """Is profiling requested through the environment?"""
+    return os.environ.get(PROFILE_ENV, "") not in ("", "0")
+
+
+def mark(event: str):
+    """
+    Remember when an event first happened (only when profiling is enabled)
+    :param event: A short description (e.g. 'first probe')
+    """
+    if _profiler is not None:
+        _profiler.mark(event)
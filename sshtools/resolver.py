@@ -0,0 +1,205 @@
+"""Module for resolving hostnames concurrently, with a cache shared between invocations"""
+from __future__ import annotations  # python -3.9 compatibility
+
+import functools
+import ipaddress
+import socket
+import threading
+import time
+import typing
+
+import timtools.log
+
+import sshtools.cache
+import sshtools.mdns
+import sshtools.tailscale
+
+logger = timtools.log.get_logger("sshtools.resolver")
+
+RESOLVER_CACHE_NAME: str = "resolver"
+POSITIVE_TTL: float = 5 * 60
+NEGATIVE_TTL: float = 60
+RESOLVE_TIMEOUT: float = 2
+
+
+def is_numeric(name: str) -> bool:
+    """Is the name already an ip address?"""
+    try:
+        ipaddress.ip_address(name.split("%", maxsplit=1)[0])
+    except ValueError:
+        return False
+    return True
+
+
+async def getaddrinfo(name: str) -> typing.Optional[str]:
+    """
+    Resolve a hostname without blocking the event loop
+    :param name: The hostname to resolve
+    :return: The first ip address of the hostname or None if it cannot be resolved
+    """
+    import asyncio  # pylint: disable=import-outside-toplevel
+
+    loop = asyncio.get_running_loop()
+    future: asyncio.Future = loop.create_future()
+
+    def set_result(address: typing.Optional[str]):
+        if not future.done():
+            future.set_result(address)
+
+    def lookup():
+        try:
+            addr_info = socket.getaddrinfo(name, None, type=socket.SOCK_DGRAM)
+            address = next(
+                (
+                    sockaddr[0]
+                    for family, _, _, _, sockaddr in addr_info
+                    if family in (socket.AF_INET, socket.AF_INET6)
+                ),
+                None,
+            )
+        except (socket.gaierror, UnicodeError):
+            address = None
+        try:
+            loop.call_soon_threadsafe(set_result, address)
+        except RuntimeError:
+            # The event loop was closed after the lookup timed out
+            pass
+
+    # A daemon thread (instead of the default executor) does not delay the exit
+    # of the program when the lookup hangs
+    threading.Thread(target=lookup, daemon=True).start()
+    return await future
+
+
+class Resolver:
+    """Resolves hostnames concurrently and caches positive and negative answers"""
+
+    _cache: sshtools.cache.ProbeCache
+
+    def __init__(self, cache: sshtools.cache.ProbeCache):
+        self._cache = cache
+
+    def get_cached(self, name: str) -> tuple[bool, typing.Optional[str]]:
+        """
+        Look up a hostname in the cache
+        :param name: The hostname
+        :return: Whether a valid answer is cached and the cached address (None if negative)
+        """
+        entry = self._cache.get(name, max_age=POSITIVE_TTL)
+        if entry is None or time.time() > entry["expires"]:
+            return False, None
+        return True, entry["address"]
+
+    def store(self, name: str, address: typing.Optional[str], ttl: float = None):
+        """
+        Store an answer in the cache
+        :param name: The hostname
+        :param address: The address of the hostname (None if it cannot be resolved)
+        :param ttl: The number of seconds the answer is valid
+        """
+        if ttl is None:
+            ttl = POSITIVE_TTL if address is not None else NEGATIVE_TTL
+        self._cache.put(name, {"address": address, "expires": time.time() + ttl})
+
+    def invalidate(self):
+        """Forget all answers (e.g. because the DNS servers changed)"""
+        self._cache.invalidate()
+
+    def forget(self, names: typing.Iterable[str]):
+        """
+        Forget the answers for some hostnames (e.g. because their configuration changed)
+        :param names: The hostnames
+        """
+        self._cache.remove(names)
+
+    async def _resolve_many(
+        self, names: list[str], timeout: float
+    ) -> tuple[dict[str, typing.Optional[str]], set[str]]:
+        """
+        Resolve hostnames concurrently
+        :return: The address of every hostname (None if unknown) and the hostnames that timed out
+        """
+        import asyncio  # pylint: disable=import-outside-toplevel
+
+        timed_out: set[str] = set()
+
+        async def resolve_name(name: str) -> tuple[str, typing.Optional[str]]:
+            try:
+                return name, await asyncio.wait_for(getaddrinfo(name), timeout)
+            except asyncio.TimeoutError:
+                logger.debug("Resolving %s timed out", name)
+                timed_out.add(name)
+                return name, None
+
+        addresses = dict(await asyncio.gather(*(resolve_name(name) for name in names)))
+        return addresses, timed_out
+
+    def resolve_all(
+        self, names: typing.Iterable[str], timeout: float = RESOLVE_TIMEOUT
+    ) -> dict[str, typing.Optional[str]]:
+        """
+        Resolve many hostnames at once
+        :param names: The hostnames (ip addresses are returned as is)
+        :param timeout: The maximum number of seconds to wait for an answer
+        :return: The address of every hostname (None if it could not be resolved)
+        """
+        addresses: dict[str, typing.Optional[str]] = {}
+        unresolved: list[str] = []
+        for name in dict.fromkeys(names):
+            if is_numeric(name):
+                addresses[name] = name
+                continue
+            is_cached, address = self.get_cached(name)
+            if is_cached:
+                addresses[name] = address
+            else:
+                unresolved.append(name)
+
+        for name in [
+            name for name in unresolved if sshtools.tailscale.is_tailnet_name(name)
+        ]:
+            peer = sshtools.tailscale.get_peer(name)
+            if peer is not None and peer.address is not None:
+                addresses[name] = peer.address
+                self.store(name, peer.address)
+        unresolved = [name for name in unresolved if name not in addresses]
+
+        local_names = [name for name in unresolved if name.endswith(".local")]
+        if local_names:
+            mdns_answers = sshtools.mdns.query(local_names)
+            # The names without an answer to the multicast query are passed to the
+            # system resolver, which may know them from /etc/hosts or a unicast DNS zone
+            for name, address in (mdns_answers or {}).items():
+                addresses[name] = address
+                self.store(name, address)
+            unresolved = [name for name in unresolved if name not in addresses]
+
+        if unresolved:
+            # asyncio is slow to import and not needed when every name is cached
+            import asyncio  # pylint: disable=import-outside-toplevel
+
+            resolved, timed_out = asyncio.run(self._resolve_many(unresolved, timeout))
+            for name, address in resolved.items():
+                # A timeout says nothing about the name, so it is asked again next time
+                if name not in timed_out:
+                    self.store(name, address)
+            logger.debug("Resolved %s", resolved)
+            addresses.update(resolved)
+
+        return addresses
+
+    def resolve(self, name: str) -> typing.Optional[str]:
+        """
+        Resolve a single hostname
+        :param name: The hostname (ip addresses are returned as is)
+        :return: The address of the hostname or None if it could not be resolved
+        """
+        return self.resolve_all([name])[name]
+
+
+@functools.lru_cache(maxsize=None)
+def get_resolver() -> Resolver:
+    """Returns the resolver of this process"""
+    return Resolver(
+        sshtools.cache.get_cache(RESOLVER_CACHE_NAME, lifetime=POSITIVE_TTL)
+    )
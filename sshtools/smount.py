@@ -12,6 +12,7 @@ import timtools.log
 
 import sshtools.device
 import sshtools.errors
+import sshtools.tools
 
 logger = timtools.log.get_logger("sshtools.smount")
 
@@ -94,6 +95,7 @@ def run():
         help="The location on this machine where the source will be mounted.",
     )
     parser.add_argument("-v", "--verbose", action="store_true")
+    sshtools.tools.add_max_age_argument(parser)
     parser.add_argument("-r", "--root", help="Mount as root", action="store_true")
     parser.add_argument(
         "-o", "--open", help="Open the mount point after mounting", action="store_true"
@@ -101,6 +103,7 @@ def run():
     args = parser.parse_args()
 
     timtools.log.set_verbose(args.verbose)
+    sshtools.tools.PROBE_MAX_AGE = args.max_age
 
     target = sshtools.device.Device(args.target)
     source = args.source
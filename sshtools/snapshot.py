@@ -0,0 +1,178 @@
+"""Module for a compiled snapshot of the configuration, so warm starts only load one file"""
+from __future__ import annotations  # python -3.9 compatibility
+
+import atexit
+import functools
+import json
+import os
+import threading
+import typing
+from pathlib import Path
+
+import timtools.log
+
+import sshtools.connection
+import sshtools.device
+import sshtools.tools
+
+logger = timtools.log.get_logger("sshtools.snapshot")
+
+SNAPSHOT_NAME: str = "config_snapshot.json"
+# Increase when the compiled form of the configuration changes
+SNAPSHOT_VERSION: int = 1
+
+
+def get_signature(directories: list[Path]) -> list:
+    """
+    Returns the modification times and sizes of configuration directories and their files
+    :param directories: The configuration directories
+    """
+    signature: list = [SNAPSHOT_VERSION]
+    for directory in directories:
+        entries: list = [[str(directory), directory.stat().st_mtime_ns]]
+        for path in sorted(directory.iterdir()):
+            stat = path.stat()
+            entries.append([path.name, stat.st_mtime_ns, stat.st_size])
+        signature.append(entries)
+    return signature
+
+
+class ConfigSnapshot:  # pylint:disable=too-many-instance-attributes
+    """
+    The parsed configuration files and the compiled devices derived from them.
+    The snapshot is stored in the cache directory and is only used
+    as long as none of the configuration files has changed.
+    """
+
+    path: Path
+    directories: list[Path]
+    signature: list
+    devices: dict[str, dict]
+    networks: dict[str, dict]
+    compiled: dict[str, dict]
+    _dirty: bool
+    _lock: threading.Lock
+
+    def __init__(self, path: Path, devices_dir: Path, networks_dir: Path):
+        self.path = path
+        self.directories = [devices_dir, networks_dir]
+        self.signature = get_signature(self.directories)
+        self._dirty = False
+        self._lock = threading.Lock()
+        if not self._load():
+            self._parse(devices_dir, networks_dir)
+        atexit.register(self.save)
+
+    def _load(self) -> bool:
+        """Load the stored snapshot, returns whether it is still valid"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as snapshot_file:
+                snapshot = json.load(snapshot_file)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as error:
+            logger.debug("Could not read the config snapshot %s: %s", self.path, error)
+            return False
+
+        if snapshot.get("signature") != self.signature:
+            logger.debug("The configuration changed, recompiling the snapshot")
+            return False
+
+        self.devices = snapshot["devices"]
+        self.networks = snapshot["networks"]
+        self.compiled = snapshot["compiled"]
+        return True
+
+    def _parse(self, devices_dir: Path, networks_dir: Path):
+        """Parse the configuration files"""
+        self.devices = {}
+        for device_file in devices_dir.iterdir():
+            with open(device_file, "r", encoding="utf-8") as config_file:
+                self.devices[device_file.stem] = json.load(config_file)
+
+        self.networks = {}
+        for network_file in networks_dir.iterdir():
+            with open(network_file, "r", encoding="utf-8") as config_file:
+                for network_config in json.load(config_file):
+                    self.networks[network_config["name"]] = network_config
+
+        self.compiled = {}
+        self._dirty = True
+
+    def get_compiled(self, name: str) -> typing.Optional[dict]:
+        """
+        Returns the compiled form of a device
+        :param name: The name of the device
+        :return: The compiled device or None if it has not been compiled yet
+        """
+        return self.compiled.get(name)
+
+    def set_compiled(self, name: str, compiled: dict):
+        """
+        Store the compiled form of a device
+        :param name: The name of the device
+        :param compiled: A JSON serializable dictionary
+        """
+        with self._lock:
+            self.compiled[name] = compiled
+            self._dirty = True
+
+    def update(
+        self,
+        devices: typing.Optional[dict[str, dict]] = None,
+        networks: typing.Optional[dict[str, dict]] = None,
+    ):
+        """
+        Replace the configuration after some configuration files changed
+        :param devices: The configuration of every device (if it changed)
+        :param networks: The configuration of every network (if it changed)
+        """
+        with self._lock:
+            self.signature = get_signature(self.directories)
+            if devices is not None:
+                self.devices = devices
+            if networks is not None:
+                self.networks = networks
+            self._dirty = True
+
+    def discard_compiled(self, name: str):
+        """
+        Forget the compiled form of a device, so it is compiled again
+        :param name: The name of the device
+        """
+        with self._lock:
+            if self.compiled.pop(name, None) is not None:
+                self._dirty = True
+
+    def save(self):
+        """Store the snapshot in the cache directory (when it changed)"""
+        with self._lock:
+            if not self._dirty:
+                return
+            snapshot = {
+                "signature": self.signature,
+                "devices": self.devices,
+                "networks": self.networks,
+                "compiled": dict(self.compiled),
+            }
+            self._dirty = False
+
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Replace the file atomically, so readers never see a partial file
+            tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as tmp_file:
+                json.dump(snapshot, tmp_file)
+            os.replace(tmp_path, self.path)
+        except OSError as error:
+            logger.debug("Could not store the config snapshot %s: %s", self.path, error)
+
+
+@functools.lru_cache(maxsize=None)
+def get_snapshot() -> ConfigSnapshot:
+    """Returns the configuration snapshot of this process"""
+    return ConfigSnapshot(
+        sshtools.tools.CACHE_DIR / SNAPSHOT_NAME,
+        sshtools.device.DEVICES_DIR,
+        sshtools.connection.NETWORK_DIR,
+    )
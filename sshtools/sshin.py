@@ -3,6 +3,7 @@
 from __future__ import annotations  # python -3.9 compatibility
 
 import argparse
+import dataclasses
 import os
 import socket
 import sys
@@ -14,6 +15,7 @@ import sshtools.device
 import sshtools.errors
 import sshtools.ip
 import sshtools.pathfinder
+import sshtools.tools
 
 logger = timtools.log.get_logger("sshtools.sshin")
 
@@ -42,7 +44,7 @@ class Ssh:
 
         self.device: sshtools.device.Device = dev
         if user is not None:
-            self.device.config.user = user
+            self.device.config = dataclasses.replace(self.device.config, user=user)
 
         self.hostname: str = socket.gethostname()
         self.username: str = os.environ["USER"]
@@ -185,10 +187,12 @@ def run():
     )
     parser.add_argument("-s", "--ssh", help="Always use SSH.", action="store_true")
     parser.add_argument("-v", "--verbose", action="store_true")
+    sshtools.tools.add_max_age_argument(parser)
     args = parser.parse_args()
     logger.debug(args)
 
     timtools.log.set_verbose(args.verbose)
+    sshtools.tools.PROBE_MAX_AGE = args.max_age
 
     target = sshtools.device.Device(args.target)
 
@@ -246,8 +246,10 @@ def get_relevant_devices(
         else:
             master = sshtools.device.Device.get_self()
         slaves = sshtools.tools.mt_filter(
-            lambda d: d != master and d.is_main_device and d.sync is not False,
-            sshtools.device.DeviceConfig.get_devices(),
+            lambda d: d != master and d.sync is not False,
+            sshtools.device.DeviceConfig.get_devices(
+                filter_main=True, filter_sync=True
+            ),
         )
 
     if master in slaves:
@@ -271,9 +273,11 @@ def run():
         action="store_true",
     )
     parser.add_argument("-d", "--dry-run", action="store_true")
+    sshtools.tools.add_max_age_argument(parser)
     args = parser.parse_args()
 
     timtools.log.set_verbose(args.verbose)
+    sshtools.tools.PROBE_MAX_AGE = args.max_age
 
     master: sshtools.device.Device
     slaves: list[sshtools.device.Device]
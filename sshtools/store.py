@@ -0,0 +1,209 @@
+"""
+Module for storing the configuration of a large fleet in a single SQLite database.
+When the database exists in the configuration directory, it is used instead of
+the directories with a file per device, so a single device can be looked up by
+name or hostname without loading the rest of the fleet.
+"""
+from __future__ import annotations  # python -3.9 compatibility
+
+import argparse
+import functools
+import json
+import os
+import threading
+import typing
+from pathlib import Path
+
+import timtools.log
+
+import sshtools.connection
+import sshtools.device
+import sshtools.tools
+
+if typing.TYPE_CHECKING:
+    import sqlite3
+
+logger = timtools.log.get_logger("sshtools.store")
+
+STORE_NAME: str = "fleet.sqlite"
+# Increase when the layout of the database changes
+STORE_VERSION: int = 1
+STORE_SCHEMA: str = f"""
+PRAGMA user_version = {STORE_VERSION};
+CREATE TABLE devices (name TEXT PRIMARY KEY, config TEXT NOT NULL);
+CREATE TABLE hostnames (hostname TEXT PRIMARY KEY, name TEXT NOT NULL);
+CREATE TABLE networks (name TEXT PRIMARY KEY, config TEXT NOT NULL);
+"""
+
+
+class ConfigStore:
+    """A read-only view of the configuration in the database"""
+
+    path: Path
+    _connection: sqlite3.Connection
+    _lock: threading.Lock
+
+    def __init__(self, path: Path):
+        import sqlite3  # pylint: disable=import-outside-toplevel
+
+        self.path = path
+        self._connection = sqlite3.connect(
+            f"{path.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False
+        )
+        self._lock = threading.Lock()
+        (version,) = self._query("PRAGMA user_version")[0]
+        if version != STORE_VERSION:
+            raise ValueError(
+                f"{path} has version {version}, expected {STORE_VERSION}. "
+                "Import the configuration again."
+            )
+
+    def _query(self, query: str, *parameters) -> list[tuple]:
+        """Execute a query (the connection is shared between threads)"""
+        with self._lock:
+            return self._connection.execute(query, parameters).fetchall()
+
+    def get_device(self, name: str) -> typing.Optional[dict]:
+        """
+        Returns the configuration of a device
+        :param name: The name of the device
+        :return: The configuration or None if the device does not exist
+        """
+        rows = self._query("SELECT config FROM devices WHERE name = ?", name)
+        return json.loads(rows[0][0]) if rows else None
+
+    def get_name(self, hostname: str) -> typing.Optional[str]:
+        """
+        Returns the name of the device with a name, hostname or container hostname
+        :param hostname: The name, hostname or container hostname
+        :return: The name or None if no device has the hostname
+        """
+        rows = self._query("SELECT name FROM hostnames WHERE hostname = ?", hostname)
+        return rows[0][0] if rows else None
+
+    def get_devices(self) -> dict[str, dict]:
+        """Returns the configuration of every device"""
+        rows = self._query("SELECT name, config FROM devices ORDER BY rowid")
+        return {name: json.loads(config) for name, config in rows}
+
+    def get_networks(self) -> dict[str, dict]:
+        """Returns the configuration of every network"""
+        rows = self._query("SELECT name, config FROM networks ORDER BY rowid")
+        return {name: json.loads(config) for name, config in rows}
+
+
+def read_directories(
+    devices_dir: Path, networks_dir: Path
+) -> tuple[dict[str, dict], dict[str, dict]]:
+    """
+    Read the directories with the configuration files
+    :param devices_dir: The directory with a file per device
+    :param networks_dir: The directory with the files listing the networks
+    :return: The configuration of every device and of every network
+    """
+    devices: dict[str, dict] = {}
+    for device_file in sorted(devices_dir.iterdir()):
+        with open(device_file, "r", encoding="utf-8") as config_file:
+            devices[device_file.stem] = json.load(config_file)
+
+    return devices, read_networks(networks_dir)
+
+
+def read_networks(networks_dir: Path) -> dict[str, dict]:
+    """
+    Read the files listing the networks
+    :param networks_dir: The directory with the files listing the networks
+    :return: The configuration of every network
+    """
+    networks: dict[str, dict] = {}
+    for network_file in sorted(networks_dir.iterdir()):
+        with open(network_file, "r", encoding="utf-8") as config_file:
+            for network_config in json.load(config_file):
+                networks[network_config["name"]] = network_config
+    return networks
+
+
+def import_directories(path: Path, devices_dir: Path, networks_dir: Path) -> int:
+    """
+    Create the database from the directories with the configuration files
+    :param path: The location of the database (an existing database is replaced)
+    :param devices_dir: The directory with a file per device
+    :param networks_dir: The directory with the files listing the networks
+    :return: The number of imported devices
+    """
+    import sqlite3  # pylint: disable=import-outside-toplevel
+
+    devices, networks = read_directories(devices_dir, networks_dir)
+
+    # The names of the devices take precedence over their hostnames
+    hostnames: dict[str, str] = {name: name for name in devices}
+    for name, config in devices.items():
+        if config.get("hostname", None) is not None:
+            hostnames.setdefault(config["hostname"], name)
+        for container_hostname in config.get("container_hostnames", []):
+            hostnames.setdefault(container_hostname, name)
+
+    # Build the database next to the old one and replace it atomically
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp_path.unlink(missing_ok=True)
+    connection = sqlite3.connect(tmp_path)
+    try:
+        with connection:
+            connection.executescript(STORE_SCHEMA)
+            connection.executemany(
+                "INSERT INTO devices VALUES (?, ?)",
+                [(name, json.dumps(config)) for name, config in devices.items()],
+            )
+            connection.executemany(
+                "INSERT INTO hostnames VALUES (?, ?)", hostnames.items()
+            )
+            connection.executemany(
+                "INSERT INTO networks VALUES (?, ?)",
+                [(name, json.dumps(config)) for name, config in networks.items()],
+            )
+    finally:
+        connection.close()
+    os.replace(tmp_path, path)
+
+    logger.info(
+        "Imported %d devices and %d networks into %s",
+        len(devices),
+        len(networks),
+        path,
+    )
+    return len(devices)
+
+
+@functools.lru_cache(maxsize=None)
+def get_store() -> typing.Optional[ConfigStore]:
+    """Returns the configuration database or None if the configuration is not stored in one"""
+    path = sshtools.tools.CONFIG_DIR / STORE_NAME
+    if not path.is_file():
+        return None
+    return ConfigStore(path)
+
+
+def run():
+    """Import the configuration directories into the configuration database"""
+    parser = argparse.ArgumentParser(
+        description="Import the configuration files into a single database"
+    )
+    parser.add_argument(
+        "--output",
+        help="The location of the database",
+        type=Path,
+        default=sshtools.tools.CONFIG_DIR / STORE_NAME,
+    )
+    parser.add_argument("-v", "--verbose", help="Geef feedback", action="store_true")
+    args = parser.parse_args()
+
+    timtools.log.set_verbose(args.verbose)
+
+    count = import_directories(
+        args.output, sshtools.device.DEVICES_DIR, sshtools.connection.NETWORK_DIR
+    )
+    print(f"Imported {count} devices into {args.output}")
+
+
+if __name__ == "__main__":
+    run()
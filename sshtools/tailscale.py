@@ -0,0 +1,169 @@
+"""Module for using the peer state known by the local Tailscale daemon"""
+from __future__ import annotations  # python -3.9 compatibility
+
+import dataclasses
+import datetime as dt
+import ipaddress
+import json
+import os
+import re
+import shutil
+import subprocess
+import typing
+
+import cachetools.func
+import timtools.bash
+import timtools.log
+
+import sshtools.connection
+import sshtools.hints
+import sshtools.ip_address
+import sshtools.probe
+import sshtools.tools
+
+logger = timtools.log.get_logger("sshtools.tailscale")
+
+# Read the status from this file instead of asking the Tailscale daemon (e.g. for tests)
+TAILSCALE_STATUS_ENV: str = "SSHTOOLS_TAILSCALE_STATUS"
+TAILSCALE_TIMEOUT: float = 2
+TAILNET_SUFFIXES: tuple[str, ...] = (".ts.net", ".beta.tailscale.net")
+
+
+@dataclasses.dataclass
+class Peer:
+    """A device in the tailnet as seen by the local Tailscale daemon"""
+
+    name: str
+    online: bool
+    last_seen: typing.Optional[dt.datetime]
+    addresses: list[str]
+
+    @property
+    def address(self) -> typing.Optional[str]:
+        """The address to connect to (IPv4 is preferred)"""
+        return min(
+            self.addresses,
+            key=lambda address: ipaddress.ip_address(address).version,
+            default=None,
+        )
+
+
+def is_tailnet_name(name: str) -> bool:
+    """Is the hostname a MagicDNS name of the tailnet?"""
+    return name.rstrip(".").lower().endswith(TAILNET_SUFFIXES)
+
+
+def parse_time(timestamp: typing.Optional[str]) -> typing.Optional[dt.datetime]:
+    """
+    Parse a timestamp of Tailscale (RFC 3339 with up to nanoseconds)
+    :return: The time or None if it is missing or the zero time
+    """
+    match = re.match(r"^(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)", timestamp or "")
+    if match is None or match.group(1).startswith("0001-"):
+        return None
+    return dt.datetime.fromisoformat(match.group(1)).replace(tzinfo=dt.timezone.utc)
+
+
+def parse_status(status: dict) -> dict[str, Peer]:
+    """
+    Returns the peers in the output of 'tailscale status --json'
+    :param status: The parsed output
+    :return: The peers by their (lowercase) MagicDNS name
+    """
+    peers: dict[str, Peer] = {}
+    for peer_status in (status.get("Peer") or {}).values():
+        name = peer_status.get("DNSName", "").rstrip(".").lower()
+        if not name:
+            continue
+        peers[name] = Peer(
+            name=name,
+            online=bool(peer_status.get("Online")),
+            last_seen=parse_time(peer_status.get("LastSeen")),
+            addresses=peer_status.get("TailscaleIPs") or [],
+        )
+    return peers
+
+
+def read_status() -> typing.Optional[dict]:
+    """Returns the output of 'tailscale status --json' (None if it is not available)"""
+    status_path = os.environ.get(TAILSCALE_STATUS_ENV)
+    try:
+        if status_path:
+            with open(status_path, "r", encoding="utf-8") as status_file:
+                return json.load(status_file)
+
+        if shutil.which("tailscale") is None:
+            return None
+        result: timtools.bash.CommandResult = timtools.bash.run(
+            ["tailscale", "status", "--json"],
+            capture_stdout=True,
+            capture_stderr=True,
+            passable_exit_codes=["*"],
+            timeout=TAILSCALE_TIMEOUT,
+        )
+        if result.exit_code != 0:
+            return None
+        return json.loads(result.output)
+    except (OSError, ValueError, subprocess.TimeoutExpired) as error:
+        logger.debug("Could not read the Tailscale status: %s", error)
+        return None
+
+
+@cachetools.func.ttl_cache(ttl=sshtools.tools.IP_CACHE_TIMEOUT)
+def get_peers() -> dict[str, Peer]:
+    """Returns the peers of the tailnet (read once per lookup cycle)"""
+    status = read_status()
+    if status is None:
+        return {}
+    peers = parse_status(status)
+    logger.debug(
+        "Tailscale knows %d peers (%d online)",
+        len(peers),
+        sum(peer.online for peer in peers.values()),
+    )
+    return peers
+
+
+def get_peer(name: str) -> typing.Optional[Peer]:
+    """
+    Returns the peer a MagicDNS name belongs to
+    :param name: The hostname (names of the old beta domain are matched by hostname)
+    :return: The peer or None if the name is not a known tailnet name
+    """
+    if not is_tailnet_name(name):
+        return None
+    peers = get_peers()
+    name = name.rstrip(".").lower()
+    if name in peers:
+        return peers[name]
+
+    hostname = name.split(".", maxsplit=1)[0]
+    for peer_name, peer in peers.items():
+        if peer_name.split(".", maxsplit=1)[0] == hostname:
+            return peer
+    return None
+
+
+def get_known_ping(
+    name: str, network: typing.Optional[sshtools.connection.Network] = None
+) -> typing.Optional[sshtools.probe.PingResult]:
+    """
+    Returns the result of pinging a tailnet name without probing it, if it is known
+    :param name: The hostname
+    :param network: The network of the hostname (its round trip time is used as latency)
+    :return:
+        A dead result for peers that are offline, an alive result for peers that are online
+        and None for names that are not known to the Tailscale daemon
+    """
+    peer = get_peer(name)
+    if peer is None:
+        return None
+    if not peer.online:
+        return sshtools.probe.PingResult(False, float("inf"))
+
+    if (network is None or network.rtt.srtt is None) and peer.address is not None:
+        # Generated tailnet names have no network, the Tailscale address of the peer does
+        network = sshtools.connection.Network.get_network_of(
+            sshtools.ip_address.IPAddress(peer.address)
+        )
+    return sshtools.probe.PingResult(True, sshtools.hints.get_hint_latency(network))
@@ -1,11 +1,11 @@
 """Tools for use in the sshtools package"""
 from __future__ import annotations  # python -3.9 compatibility
 
+import argparse
 import tempfile
 from pathlib import Path
 from typing import Any, Callable, Iterable
 
-import tabulate
 import timtools.bash
 import timtools.locations
 import timtools.multithreading
@@ -27,9 +27,17 @@ elif global_config_dir.is_dir():
 else:
     CONFIG_DIR = src_config_dir
 
+CACHE_DIR: Path = timtools.locations.get_user_cache_dir() / "sshtools"
+
 IP_CACHE_TIMEOUT: int = 5
 IP_PING_TIMEOUT: float = 1
 IP_SSH_TIMEOUT: float = 4
+# Lower bounds for the timeouts networks learn from the round trip times they observe
+IP_PING_TIMEOUT_MIN: float = 0.02
+IP_SSH_TIMEOUT_MIN: float = 0.5
+RTT_MIN_SAMPLES: int = 5
+# Maximum age (in seconds) of probe results from earlier invocations that can be used
+PROBE_MAX_AGE: float = 0
 
 
 def get_tmp_dir() -> Path:
@@ -40,6 +48,19 @@ def get_tmp_dir() -> Path:
     return Path(tempfile.mkdtemp())
 
 
+def add_max_age_argument(parser: argparse.ArgumentParser):
+    """
+    Adds the --max-age option to the parser of a CLI (its value is meant for PROBE_MAX_AGE)
+    :param parser: The argument parser of the CLI
+    """
+    parser.add_argument(
+        "--max-age",
+        help="Accept probe results of earlier invocations that are at most this many seconds old",
+        type=float,
+        default=0,
+    )
+
+
 def mt_filter(func: Callable, collection: Iterable, max_workers=20) -> list:
     """
     Filters a list based on a function, by using parallel processing
@@ -81,7 +102,7 @@ def create_table(
     row_source: Iterable,
     sorting_key: Callable = None,
     **kwargs,
-) -> tabulate.tabulate:
+) -> str:
     """
     Prints a table containing the rows creating by running a 'add_row'
     on every item in 'row_source' in parallel.
@@ -95,8 +116,11 @@ def create_table(
         (will be an input for 'sorted(rows, key=sorting_key)'
     :param kwargs: Additional keyword arguments will be passed directly to tabulate
 
-    :return: A 'tabulate' table object (can be printed simply with 'print(table)'
+    :return: The table as a string
     """
+    # tabulate is slow to import and only needed for tables
+    import tabulate  # pylint: disable=import-outside-toplevel
+
     output: list[list] = []
 
     mt_map(lambda src: add_row(output, src), row_source)
@@ -0,0 +1,336 @@
+"""
+Module for reloading the configuration in long-running processes.
+The configuration directories are watched with inotify and only the devices
+and networks whose configuration changed are rebuilt.
+"""
+from __future__ import annotations  # python -3.9 compatibility
+
+import ctypes
+import json
+import os
+import select
+import struct
+import threading
+import typing
+from pathlib import Path
+
+import timtools.log
+
+import sshtools.config
+import sshtools.connection
+import sshtools.device
+import sshtools.errors
+import sshtools.store
+import sshtools.tools
+
+logger = timtools.log.get_logger("sshtools.watcher")
+
+# Events of inotify (linux/inotify.h)
+IN_CLOSE_WRITE: int = 0x00000008
+IN_MOVED_FROM: int = 0x00000040
+IN_MOVED_TO: int = 0x00000080
+IN_DELETE: int = 0x00000200
+IN_Q_OVERFLOW: int = 0x00004000
+WATCH_MASK: int = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+EVENT_HEADER: struct.Struct = struct.Struct("iIII")
+EVENT_BUFFER_SIZE: int = 64 * 1024
+# Editors write files in several steps, so wait for the events to settle before reloading
+RELOAD_DELAY: float = 0.2
+# The number of seconds between checking whether the watcher has to stop
+WATCH_INTERVAL: float = 1
+
+
+def parse_events(data: bytes) -> list[tuple[int, int, str]]:
+    """
+    Parse the events read from an inotify file descriptor
+    :param data: The bytes that were read
+    :return: The watch descriptor, the event mask and the file name of every event
+    """
+    events: list[tuple[int, int, str]] = []
+    offset = 0
+    while offset + EVENT_HEADER.size <= len(data):
+        watch, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+        offset += EVENT_HEADER.size
+        name = data[offset : offset + length].rstrip(b"\0")
+        offset += length
+        events.append((watch, mask, name.decode("utf-8", errors="replace")))
+    return events
+
+
+class Inotify:
+    """A minimal interface to the inotify API of Linux"""
+
+    fd: int
+    watches: dict[int, Path]
+    _libc: ctypes.CDLL
+
+    def __init__(self):
+        # The symbols of the process include the C library
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError("inotify is not available on this system")
+        self.fd = self._check(self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC))
+        self.watches = {}
+
+    @staticmethod
+    def _check(result: int) -> int:
+        """Raise the error of a failed call to the C library"""
+        if result < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        return result
+
+    def add_watch(self, path: Path, mask: int = WATCH_MASK):
+        """
+        Watch the files in a directory
+        :param path: The directory
+        :param mask: The events to watch
+        """
+        watch = self._check(
+            self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        )
+        self.watches[watch] = path
+
+    def read(self, timeout: float) -> list[tuple[typing.Optional[Path], int, str]]:
+        """
+        Wait for events
+        :param timeout: The maximum number of seconds to wait
+        :return:
+            The watched directory (None when the event queue overflowed),
+            the event mask and the file name of every event
+        """
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, EVENT_BUFFER_SIZE)
+        except BlockingIOError:
+            return []
+        return [
+            (self.watches.get(watch), mask, name)
+            for watch, mask, name in parse_events(data)
+        ]
+
+    def close(self):
+        """Stop watching"""
+        os.close(self.fd)
+
+
+def read_device(path: Path) -> typing.Optional[dict]:
+    """
+    Read the configuration file of a device
+    :return: The configuration or None if the file does not exist (anymore)
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as config_file:
+            return json.load(config_file)
+    except FileNotFoundError:
+        return None
+
+
+def get_changes(
+    old: dict[str, dict], new: dict[str, typing.Optional[dict]]
+) -> dict[str, typing.Optional[dict]]:
+    """
+    Returns the configurations that changed
+    :param old: The current configurations
+    :param new: The new configurations (None if removed)
+    """
+    return {name: config for name, config in new.items() if old.get(name) != config}
+
+
+def apply_changes(
+    device_changes: dict[str, typing.Optional[dict]],
+    network_changes: dict[str, typing.Optional[dict]],
+) -> set[str]:
+    """
+    Apply changes to the configuration and rebuild the affected devices and networks
+    :param device_changes: The new configuration of every changed device (None if removed)
+    :param network_changes: The new configuration of every changed network (None if removed)
+    :return: The names of the devices that were affected by the changes
+    """
+    with sshtools.config.CONFIG_LOCK:
+        affected = set(device_changes)
+        if network_changes:
+            sshtools.connection.Network.update_configs(network_changes)
+        sshtools.device.DeviceConfig.update_configs(device_changes)
+        if network_changes:
+            # The addresses of the devices in a network depend on its configuration
+            affected.update(
+                entry.name
+                for entry in sshtools.device.DeviceConfig.get_fleet()
+                if entry.networks & network_changes.keys()
+            )
+
+        for name in sorted(affected):
+            sshtools.device.Device.rebuild(name)
+
+    logger.info(
+        "Reloaded %d devices and %d networks",
+        len(device_changes),
+        len(network_changes),
+    )
+    return affected
+
+
+class ConfigWatcher:
+    """Watches the configuration and applies its changes in a background thread"""
+
+    devices_dir: Path
+    networks_dir: Path
+    store_path: Path
+    on_reload: typing.Optional[typing.Callable[[set[str]], None]]
+    _inotify: typing.Optional[Inotify]
+    _stop: threading.Event
+    _thread: typing.Optional[threading.Thread]
+
+    def __init__(
+        self,
+        on_reload: typing.Callable[[set[str]], None] = None,
+        devices_dir: Path = None,
+        networks_dir: Path = None,
+        store_path: Path = None,
+    ):
+        """
+        :param on_reload: Called with the names of the affected devices after every reload
+        """
+        self.on_reload = on_reload
+        self.devices_dir = devices_dir or sshtools.device.DEVICES_DIR
+        self.networks_dir = networks_dir or sshtools.connection.NETWORK_DIR
+        self.store_path = store_path or sshtools.tools.CONFIG_DIR / (
+            sshtools.store.STORE_NAME
+        )
+        self._inotify = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start watching the configuration (raises an OSError if inotify is not available)"""
+        self._inotify = Inotify()
+        for directory in dict.fromkeys(
+            [self.devices_dir, self.networks_dir, self.store_path.parent]
+        ):
+            if directory.is_dir():
+                self._inotify.add_watch(directory)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        logger.debug("Watching the configuration in %s", self.store_path.parent)
+
+    def stop(self):
+        """Stop watching the configuration"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def _run(self):
+        """Collect the changed files and reload them once the events settle"""
+        pending: set[Path] = set()
+        while not self._stop.is_set():
+            events = self._inotify.read(RELOAD_DELAY if pending else WATCH_INTERVAL)
+            for directory, mask, name in events:
+                if directory is None or mask & IN_Q_OVERFLOW:
+                    # Events were lost, so everything could have changed
+                    pending.update(self._get_all_paths())
+                elif name:
+                    pending.add(directory / name)
+
+            if pending and not events:
+                try:
+                    affected = self.reload(pending)
+                except (OSError, ValueError, sshtools.errors.ErrorHandler) as error:
+                    logger.warning("Could not reload the configuration: %s", error)
+                    affected = set()
+                pending = set()
+                if affected and self.on_reload is not None:
+                    self.on_reload(affected)
+
+    def _get_all_paths(self) -> set[Path]:
+        """Returns the paths of all configuration files"""
+        paths = {self.store_path}
+        for directory in [self.devices_dir, self.networks_dir]:
+            if directory.is_dir():
+                paths.update(directory.iterdir())
+        # Include the devices whose files were removed
+        paths.update(
+            self.devices_dir / f"{name}.json"
+            for name in sshtools.device.DeviceConfig.get_configs().keys()
+        )
+        return paths
+
+    def reload(self, paths: typing.Iterable[Path]) -> set[str]:
+        """
+        Apply the changes of configuration files
+        :param paths: The configuration files that changed
+        :return: The names of the devices that were affected by the changes
+        """
+        paths = set(paths)
+        if self.store_path in paths:
+            return self._reload_store()
+        if sshtools.store.get_store() is not None:
+            # The configuration directories are not used
+            return set()
+
+        # A file that cannot be read is skipped, the other changes are still applied
+        new_devices: dict[str, typing.Optional[dict]] = {}
+        for path in sorted(paths):
+            if path.parent != self.devices_dir:
+                continue
+            try:
+                new_devices[path.stem] = read_device(path)
+            except (OSError, ValueError) as error:
+                logger.warning("Could not reload %s: %s", path, error)
+        device_changes = get_changes(
+            sshtools.device.DeviceConfig.get_configs(), new_devices
+        )
+
+        network_changes: dict[str, typing.Optional[dict]] = {}
+        if any(path.parent == self.networks_dir for path in paths):
+            try:
+                network_changes = self._get_network_changes(
+                    sshtools.store.read_networks(self.networks_dir)
+                )
+            except (OSError, ValueError, KeyError) as error:
+                # Without every file the removed networks cannot be told apart
+                logger.warning("Could not reload the networks: %s", error)
+
+        if not device_changes and not network_changes:
+            return set()
+        return apply_changes(device_changes, network_changes)
+
+    def _reload_store(self) -> set[str]:
+        """Apply the changes of a replaced configuration database"""
+        old_store = sshtools.store.get_store()
+        if old_store is not None:
+            old_devices = old_store.get_devices()
+        else:
+            old_devices = sshtools.device.DeviceConfig.get_configs()
+
+        sshtools.store.get_store.cache_clear()
+        new_store = sshtools.store.get_store()
+        if new_store is not None:
+            new_devices, new_networks = (
+                new_store.get_devices(),
+                new_store.get_networks(),
+            )
+        else:
+            new_devices, new_networks = sshtools.store.read_directories(
+                self.devices_dir, self.networks_dir
+            )
+
+        removed: dict[str, typing.Optional[dict]] = dict.fromkeys(old_devices)
+        device_changes = get_changes(old_devices, {**removed, **new_devices})
+        network_changes = self._get_network_changes(new_networks)
+        return apply_changes(device_changes, network_changes)
+
+    @staticmethod
+    def _get_network_changes(
+        new_networks: dict[str, dict]
+    ) -> dict[str, typing.Optional[dict]]:
+        """Returns the networks whose configuration changed"""
+        old_networks = sshtools.connection.Network.get_configs()
+        removed: dict[str, typing.Optional[dict]] = dict.fromkeys(old_networks)
+        return get_changes(old_networks, {**removed, **new_networks})
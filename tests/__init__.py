@@ -1,3 +1,4 @@
 import sshtools.tools
 
 sshtools.tools.CONFIG_DIR = sshtools.tools.PROJECT_DIR.parent / "config_test"
+sshtools.tools.CACHE_DIR = sshtools.tools.get_tmp_dir()
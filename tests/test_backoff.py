@@ -0,0 +1,34 @@
+import sshtools.backoff
+import sshtools.cache
+import sshtools.tools
+
+
+def create_history() -> sshtools.backoff.FailureHistory:
+    cache = sshtools.cache.ProbeCache(sshtools.tools.get_tmp_dir() / "failures.json")
+    return sshtools.backoff.FailureHistory(cache)
+
+
+def test_get_backoff():
+    get_backoff = sshtools.backoff.FailureHistory.get_backoff
+    threshold = sshtools.backoff.FAILURE_THRESHOLD
+    assert get_backoff(0) == 0
+    assert get_backoff(threshold - 1) == 0
+    assert get_backoff(threshold) == sshtools.backoff.BACKOFF_BASE
+    assert get_backoff(threshold + 1) == 2 * sshtools.backoff.BACKOFF_BASE
+    assert get_backoff(threshold + 100) == sshtools.backoff.BACKOFF_MAX
+
+
+def test_backed_off():
+    history = create_history()
+    address = "host.beta.tailscale.net"
+    for _ in range(sshtools.backoff.FAILURE_THRESHOLD - 1):
+        history.record_failure(address)
+        assert history.is_backed_off(address) is False
+
+    history.record_failure(address)
+    assert history.is_backed_off(address) is True
+    assert history.get_failures(address)[0] == sshtools.backoff.FAILURE_THRESHOLD
+
+    history.record_success(address)
+    assert history.is_backed_off(address) is False
+    assert history.get_failures(address)[0] == 0
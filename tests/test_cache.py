@@ -0,0 +1,71 @@
+import time
+
+import sshtools.cache
+import sshtools.tools
+
+
+def create_cache() -> sshtools.cache.ProbeCache:
+    return sshtools.cache.ProbeCache(sshtools.tools.get_tmp_dir() / "probes.json")
+
+
+def test_memory():
+    cache = create_cache()
+    assert cache.get("ping:1.1.1.1") is None
+    cache.put("ping:1.1.1.1", [True, 2.5])
+    assert cache.get("ping:1.1.1.1") == [True, 2.5]
+
+
+def test_disk():
+    cache = create_cache()
+    cache.put("ping:1.1.1.1", [True, float("inf")])
+    cache.flush()
+
+    other_process_cache = sshtools.cache.ProbeCache(cache.path)
+    assert other_process_cache.get("ping:1.1.1.1", max_age=0) is None
+    assert other_process_cache.get("ping:1.1.1.1", max_age=60) == [True, float("inf")]
+
+
+def test_max_age():
+    cache = create_cache()
+    cache.put("ssh:1.1.1.1:22", True)
+    cache.flush()
+    time.sleep(0.2)
+
+    other_process_cache = sshtools.cache.ProbeCache(cache.path)
+    assert other_process_cache.get("ssh:1.1.1.1:22", max_age=0.1) is None
+    assert other_process_cache.get("ssh:1.1.1.1:22", max_age=1) is True
+
+
+def test_invalidate():
+    cache = create_cache()
+    cache.put("ping:1.1.1.1", [True, 1])
+    cache.put("ssh:1.1.1.1:22", True)
+    cache.invalidate("ping:")
+    assert cache.get("ping:1.1.1.1", max_age=60) is None
+    assert cache.get("ssh:1.1.1.1:22", max_age=60) is True
+
+
+def test_concurrent_writers():
+    cache = create_cache()
+    writers = [sshtools.cache.ProbeCache(cache.path) for _ in range(5)]
+
+    def write(i: int):
+        writers[i].put(f"ping:1.1.1.{i}", [True, i])
+        writers[i].flush()
+
+    sshtools.tools.mt_map(write, range(len(writers)))
+    for i in range(len(writers)):
+        assert cache.get(f"ping:1.1.1.{i}", max_age=60) == [True, i]
+
+
+def test_batched_writes():
+    cache = create_cache()
+    cache.put_many({"ping:1.1.1.1": [True, 1], "ssh:1.1.1.1:22": True})
+
+    other_process_cache = sshtools.cache.ProbeCache(cache.path)
+    assert other_process_cache.get("ping:1.1.1.1", max_age=60) is None
+    assert cache.get("ssh:1.1.1.1:22", max_age=60) is True
+
+    cache.flush()
+    assert other_process_cache.get("ping:1.1.1.1", max_age=60) == [True, 1]
+    assert other_process_cache.get("ssh:1.1.1.1:22", max_age=60) is True
@@ -1,7 +1,11 @@
+import ipaddress
+
 import pytest
 
+import sshtools.cache
 import sshtools.device
 import sshtools.interface
+import sshtools.tools
 from sshtools import connection, errors, ip
 
 
@@ -76,3 +80,149 @@ def test_ip_association():
     assert zt.has_ip_address(ip.IPAddress("2.2.2.150"))
     ztts = connection.Network("family")
     assert ztts.has_ip_address(ip.IPAddress("3.3.3.20"))
+
+
+def test_parse_prefix():
+    assert connection.parse_prefix({"ip_start": "1.1.1."}) == (
+        ipaddress.ip_network("1.1.1.0/24")
+    )
+    assert connection.parse_prefix({"ip_start": "10.1."}) == (
+        ipaddress.ip_network("10.1.0.0/16")
+    )
+    assert connection.parse_prefix({"prefix": "fd00::/64", "ip_start": "1.1.1."}) == (
+        ipaddress.ip_network("fd00::/64")
+    )
+    assert connection.parse_prefix({"prefix": "1.1.1.30/24"}) == (
+        ipaddress.ip_network("1.1.1.0/24")
+    )
+    assert connection.parse_prefix({"ip_start": "1.1.1.1"}) is None
+    assert connection.parse_prefix({}) is None
+
+    for net_config in [
+        {"name": "lab", "prefix": "1.1.1.0/33"},
+        {"name": "lab", "prefix": "lab"},
+        {"name": "lab", "ip_start": "300."},
+    ]:
+        with pytest.raises(errors.ConfigError, match="Network lab"):
+            connection.parse_prefix(net_config)
+
+
+def test_prefix_index():
+    index = connection.PrefixIndex()
+    index.insert(ipaddress.ip_network("10.0.0.0/8"), "wide")
+    index.insert(ipaddress.ip_network("10.1.0.0/16"), "narrow")
+    index.insert(ipaddress.ip_network("10.1.0.0/16"), "duplicate")
+    index.insert(ipaddress.ip_network("fd00::/8"), "ipv6")
+
+    assert index.lookup(ipaddress.ip_address("10.1.2.3")) == "narrow"
+    assert index.lookup(ipaddress.ip_address("10.2.0.1")) == "wide"
+    assert index.lookup(ipaddress.ip_address("11.0.0.1")) is None
+    assert index.lookup(ipaddress.ip_address("fd12::1")) == "ipv6"
+    assert index.lookup(ipaddress.ip_address("fe80::1")) is None
+
+
+def test_network_of():
+    assert ip.IPAddress("1.1.1.200").network == connection.Network("home")
+    assert ip.IPAddress("fd00:1::1e").network is None
+    assert ip.IPAddress("doesnotexist.local").network is None
+
+    connection.Network.update_configs(
+        {
+            "lab": {"name": "lab", "prefix": "1.1.1.128/25"},
+            "lab6": {"name": "lab6", "prefix": "fd00:1::/64"},
+        }
+    )
+    try:
+        # The longest prefix wins and the memoized networks are looked up again
+        assert ip.IPAddress("1.1.1.200").network == connection.Network("lab")
+        assert ip.IPAddress("1.1.1.20").network == connection.Network("home")
+        assert ip.IPAddress("fd00:1::1e").network == connection.Network("lab6")
+
+        lab6 = connection.Network("lab6")
+        assert lab6.has_ip_address(ip.IPAddress("fd00:1::1e"))
+        assert not lab6.has_ip_address(ip.IPAddress("1.1.1.200"))
+        laptop = sshtools.device.Device("laptop")
+        assert str(lab6.construct_ip(laptop)) == "fd00:1::1e"
+    finally:
+        connection.Network.update_configs({"lab": None, "lab6": None})
+    assert ip.IPAddress("1.1.1.200").network == connection.Network("home")
+
+
+def test_prefix_only_network():
+    laptop = sshtools.device.Device("laptop")
+    laptop_config = sshtools.device.DeviceConfig.get_config("laptop")
+    connection.Network.update_configs(
+        {"lab6": {"name": "lab6", "prefix": "fd00:1::/64"}}
+    )
+    sshtools.device.DeviceConfig.update_configs(
+        {
+            "laptop": {
+                **laptop_config,
+                "connections": [*laptop_config["connections"], {"network": "lab6"}],
+            }
+        }
+    )
+    try:
+        # The address in a network without ip_start is constructed from the prefix
+        rebuilt = sshtools.device.Device.rebuild("laptop")
+        assert rebuilt is laptop
+        assert ip.IPAddress("fd00:1::1e") in rebuilt.ip_address_list_all
+    finally:
+        sshtools.device.DeviceConfig.update_configs({"laptop": laptop_config})
+        connection.Network.update_configs({"lab6": None})
+        sshtools.device.Device.rebuild("laptop")
+
+
+def test_rtt_estimator():
+    estimator = connection.RttEstimator()
+    assert estimator.timeout is None
+
+    estimator.add_sample(0.004)
+    assert estimator.srtt == 0.004
+    assert estimator.rttvar == 0.002
+
+    for _ in range(sshtools.tools.RTT_MIN_SAMPLES):
+        estimator.add_sample(0.004)
+    assert estimator.srtt == pytest.approx(0.004)
+    assert 0.004 < estimator.timeout < 0.012
+
+    restored = connection.RttEstimator(**estimator.to_dict())
+    assert restored.timeout == estimator.timeout
+
+
+def test_timeouts(monkeypatch):
+    # Learn from samples without touching the estimators and cache of other tests
+    monkeypatch.setattr(connection.Network, "_Network__rtt_estimators", {})
+    monkeypatch.setattr(connection, "RTT_CACHE_NAME", "rtt-test-timeouts")
+
+    work = connection.Network("work")
+    assert work.ping_timeout == 0.25
+    assert work.ssh_timeout == 1.5
+
+    home = connection.Network("home")
+    for _ in range(sshtools.tools.RTT_MIN_SAMPLES):
+        home.record_rtt(2)
+    assert (
+        sshtools.tools.IP_PING_TIMEOUT_MIN
+        <= home.ping_timeout
+        < sshtools.tools.IP_PING_TIMEOUT
+    )
+    assert (
+        sshtools.tools.IP_SSH_TIMEOUT_MIN
+        <= home.ssh_timeout
+        < sshtools.tools.IP_SSH_TIMEOUT
+    )
+    assert ip.IPAddress("1.1.1.40").ping_timeout == home.ping_timeout
+
+    cache = sshtools.cache.get_cache(
+        "rtt-test-timeouts", lifetime=connection.RTT_LIFETIME
+    )
+    assert cache.get("home")["samples"] == sshtools.tools.RTT_MIN_SAMPLES
+    assert not cache.path.exists()
+
+
+def test_rtt_estimator_concurrent():
+    estimator = connection.RttEstimator()
+    sshtools.tools.mt_map(lambda _: estimator.add_sample(0.004), range(100))
+    assert estimator.samples == 100
+    assert estimator.srtt == pytest.approx(0.004)
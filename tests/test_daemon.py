@@ -0,0 +1,68 @@
+import threading
+import time
+
+import pytest
+
+import sshtools.daemon
+import sshtools.tools
+
+
+def create_daemon() -> sshtools.daemon.ReachabilityDaemon:
+    daemon = sshtools.daemon.ReachabilityDaemon(interval=10)
+    daemon._state["pi"] = {
+        "updated": time.time(),
+        "addresses": [
+            {"ip": "pi-hostname", "latency": 1.5, "sshable": False, "strict": False},
+            {"ip": "4.4.4.60", "latency": 2.5, "sshable": True, "strict": True},
+        ],
+    }
+    return daemon
+
+
+def test_answer():
+    daemon = create_daemon()
+
+    answer = daemon.answer({"device": "pi"})
+    assert answer["ip"] == "pi-hostname"
+    assert answer["latency"] == 1.5
+
+    assert (
+        daemon.answer({"device": "pi-hostname", "strict_ip": True})["ip"] == "4.4.4.60"
+    )
+    assert daemon.answer({"device": "pi", "only_sshable": True})["ip"] == "4.4.4.60"
+    assert daemon.answer({"device": "laptop"})["ip"] is None
+
+
+@pytest.fixture
+def served_daemon(monkeypatch):
+    monkeypatch.setattr(sshtools.daemon.ReachabilityDaemon, "in_process", False)
+    socket_path = sshtools.tools.get_tmp_dir() / "sshtoolsd.sock"
+
+    daemon = create_daemon()
+    thread = threading.Thread(
+        target=daemon.serve,
+        kwargs={"socket_path": socket_path, "refresh": False},
+        daemon=True,
+    )
+    thread.start()
+    for _ in range(50):
+        if socket_path.is_socket():
+            break
+        time.sleep(0.01)
+
+    yield socket_path
+
+    daemon.shutdown()
+    thread.join()
+
+
+def test_query(served_daemon):
+    answer = sshtools.daemon.query("pi", only_sshable=True, socket_path=served_daemon)
+    assert answer["ip"] == "4.4.4.60"
+    assert answer["sshable"] is True
+    assert sshtools.daemon.is_enabled() is False
+
+
+def test_query_without_daemon():
+    socket_path = sshtools.tools.get_tmp_dir() / "sshtoolsd.sock"
+    assert sshtools.daemon.query("pi", socket_path=socket_path) is None
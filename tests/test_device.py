@@ -1,5 +1,8 @@
+import dataclasses
+
 import pytest
 
+from sshtools import config as sshtools_config
 from sshtools import device, errors, ip
 
 
@@ -111,3 +114,87 @@ def test_ip_construction():
     assert "2.2.2.130" in ips
     # public
     assert "123.123.123" in ips
+
+
+def test_last_known_good_ip():
+    dev = device.Device("laptop")
+    possible_ips = dev.get_possible_ips()
+    strict_ips = dev.get_possible_ips(include_dns=False, include_hostname=False)
+    assert dev._get_last_known_good_ip(possible_ips) is None
+
+    dev._store_last_known_good_ip(ip.IPAddress("laptop-hostname.local"))
+    assert dev._get_last_known_good_ip(possible_ips) == ip.IPAddress(
+        "laptop-hostname.local"
+    )
+    assert dev._get_last_known_good_ip(strict_ips) is None
+
+
+def test_last_known_good_ip_skips_fan_out(monkeypatch):
+    monkeypatch.setenv("SSHTOOLS_NO_DAEMON", "1")
+    dev = device.Device("laptop")
+    last_ip = ip.IPAddress("laptop-hostname.local")
+    monkeypatch.setattr(device.Device, "_get_last_known_good_ip", lambda *_: last_ip)
+    monkeypatch.setattr(
+        ip.IPAddressList,
+        "is_ip_alive",
+        staticmethod(lambda ip_address, only_sshable=False: ip_address == last_ip),
+    )
+
+    def get_best_address(*_, **__):
+        raise AssertionError("The other candidates must not be probed")
+
+    monkeypatch.setattr(ip.IPAddressList, "get_best_address", get_best_address)
+    assert dev.get_ip() == last_ip
+
+
+def test_name_index():
+    assert device.DeviceConfig.get_name_from_hostname("laptop") == "laptop"
+    assert device.DeviceConfig.get_name_from_hostname("laptop-hostname") == "laptop"
+    assert device.DeviceConfig.get_name_from_hostname("unknown") == "unknown"
+    container_hostname = device.DeviceConfig.get_config("desktop")[
+        "container_hostnames"
+    ][0]
+    assert device.DeviceConfig.get_name_from_hostname(container_hostname) == "desktop"
+
+
+def test_address_index():
+    assert device.DeviceConfig.get_name_from_address("1.1.1.130") == "laptop"
+    assert device.DeviceConfig.get_name_from_address("2.2.2.60") == "pi"
+    assert device.DeviceConfig.get_name_from_address("9.9.9.9") is None
+
+
+def test_fleet():
+    for entry in device.DeviceConfig.get_fleet():
+        dev = device.Device(entry.name)
+        assert entry.is_main_device == dev.is_main_device
+        assert entry.is_super == dev.is_super
+        assert entry.sync == dev.config.sync
+        assert entry.networks == {
+            ip_address.config.network.name for ip_address in dev.ip_address_list_all
+        }
+
+    assert device.DeviceConfig.get_devices(filter_super=True) == [
+        device.Device("laptop")
+    ]
+    family_devices = device.DeviceConfig.get_devices(networks=["family"])
+    assert device.Device("laptop") in family_devices
+    assert device.Device("pi") not in family_devices
+
+
+def test_slots():
+    dev = device.Device("laptop")
+    assert not hasattr(dev, "__dict__")
+    assert not hasattr(dev.config, "__dict__")
+    for ip_address in dev.ip_address_list_all:
+        assert not hasattr(ip_address, "__dict__")
+        assert not hasattr(ip_address.config, "__dict__")
+        assert not hasattr(ip_address.config.network, "__dict__")
+    for interface in dev.interfaces:
+        assert not hasattr(interface, "__dict__")
+
+
+def test_shared_config():
+    dev = device.Device("laptop")
+    assert sshtools_config.get_shared(dataclasses.replace(dev.config)) is dev.config
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        dev.config.user = "someone"
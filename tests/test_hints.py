@@ -0,0 +1,110 @@
+import socket
+
+import pytest
+
+import sshtools.hints
+import sshtools.ip
+import sshtools.tools
+
+NUD_STALE = 0x4
+TCP_TABLE = """  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid
+   0: 00000000:07E8 00000000:0000 0A 00000000:00000000 00:00000000 00000000     0
+   1: 0100007F:D431 0300007F:0016 01 00000000:00000000 00:00000000 00000000  1000
+   2: 0100007F:D432 0400007F:0016 06 00000000:00000000 00:00000000 00000000  1000
+"""
+TCP6_TABLE = """  sl  local_address                         remote_address                        st
+   0: 0000000000000000FFFF00000100007F:D433 0000000000000000FFFF00000500007F:0016 01
+   1: 00000000000000000000000001000000:D434 00000000000000000000000001000000:0016 01
+"""
+
+
+def build_neighbour_message(address: str, state: int) -> bytes:
+    family = socket.AF_INET6 if ":" in address else socket.AF_INET
+    packed = socket.inet_pton(family, address)
+    attribute = sshtools.hints.RTATTR_HEADER.pack(
+        sshtools.hints.RTATTR_HEADER.size + len(packed), sshtools.hints.NDA_DST
+    )
+    payload = sshtools.hints.NDMSG.pack(family, 2, state, 0, 1) + attribute + packed
+    header = sshtools.hints.NLMSG_HEADER.pack(
+        sshtools.hints.NLMSG_HEADER.size + len(payload),
+        sshtools.hints.RTM_NEWNEIGH,
+        0x2,
+        1,
+        0,
+    )
+    return header + payload
+
+
+@pytest.fixture
+def kernel_tables(monkeypatch):
+    tmp_dir = sshtools.tools.get_tmp_dir()
+    paths = []
+    for name, table in [("tcp", TCP_TABLE), ("tcp6", TCP6_TABLE)]:
+        path = tmp_dir / name
+        path.write_text(table, encoding="utf-8")
+        paths.append(path)
+    monkeypatch.setattr(sshtools.hints, "TCP_TABLE_PATHS", tuple(paths))
+    monkeypatch.setattr(sshtools.hints, "read_neighbours", lambda: {"1.1.1.130"})
+    sshtools.hints.get_hints.cache_clear()
+    yield
+    sshtools.hints.get_hints.cache_clear()
+
+
+def test_parse_neighbour_messages():
+    done = sshtools.hints.NLMSG_HEADER.pack(
+        sshtools.hints.NLMSG_HEADER.size, sshtools.hints.NLMSG_DONE, 0x2, 1, 0
+    )
+    data = (
+        build_neighbour_message("1.1.1.130", sshtools.hints.NUD_REACHABLE)
+        + build_neighbour_message("fe80::5", sshtools.hints.NUD_REACHABLE)
+        + build_neighbour_message("1.1.1.60", NUD_STALE)
+    )
+    assert sshtools.hints.parse_neighbour_messages(data) == (
+        {"1.1.1.130", "fe80::5"},
+        False,
+    )
+    assert sshtools.hints.parse_neighbour_messages(done) == (set(), True)
+    assert sshtools.hints.parse_neighbour_messages(b"") == (set(), False)
+
+
+def test_read_neighbours():
+    # The neighbour table of the test machine is unknown, but reading it must not fail
+    assert isinstance(sshtools.hints.read_neighbours(), set)
+
+
+def test_decode_address():
+    assert sshtools.hints.decode_address("0100007F:0016") == ("127.0.0.1", 22)
+    assert sshtools.hints.decode_address("00000000000000000000000001000000:0016") == (
+        "::1",
+        22,
+    )
+    assert sshtools.hints.decode_address("0000000000000000FFFF00000100007F:0016") == (
+        "127.0.0.1",
+        22,
+    )
+
+
+def test_parse_tcp_table():
+    assert sshtools.hints.parse_tcp_table(TCP_TABLE) == {("127.0.0.3", 22)}
+    assert sshtools.hints.parse_tcp_table(TCP6_TABLE) == {
+        ("127.0.0.5", 22),
+        ("::1", 22),
+    }
+
+
+def test_hints(kernel_tables):
+    hints = sshtools.hints.get_hints()
+    assert hints.is_alive("1.1.1.130", 22)
+    assert not hints.is_alive("1.1.1.60", 22)
+    assert hints.is_connected("127.0.0.3", 22)
+    assert not hints.is_connected("127.0.0.3", 2222)
+
+
+def test_apply_hints(kernel_tables):
+    ip_address = sshtools.ip.IPAddress("127.0.0.3")
+    ip_list = sshtools.ip.IPAddressList([ip_address])
+    ip_list.apply_hints()
+
+    # Nothing listens on port 22 of 127.0.0.3, the established connection is enough
+    assert ip_address.get_cached_ping().alive is True
+    assert ip_list.get_alive_addresses(only_sshable=True).list == [ip_address]
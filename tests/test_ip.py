@@ -1,11 +1,16 @@
 import datetime as dt
 import socket
+import time
 
 import pytest
 from timtools import log
 
+import sshtools.backoff
+import sshtools.cache
 import sshtools.connection
 import sshtools.ip
+import sshtools.ip_address
+import sshtools.probe
 import sshtools.tools
 from sshtools import ip
 
@@ -126,6 +131,43 @@ def test_sort_ips():
     assert ip_list._is_sorted is True
 
 
+def test_list_unique():
+    localhost = ip.IPAddress("localhost")
+    loopback = ip.IPAddress("127.0.0.1")
+    ip_list = ip.IPAddressList([localhost, loopback, localhost])
+    assert ip_list.list == [localhost, loopback]
+    assert loopback in ip_list
+    assert ip.IPAddress("::1") not in ip_list
+
+    ip_list.sort_ips()
+    assert ip_list._is_sorted is True
+    ip_list.add(loopback)
+    ip_list.add_list(ip.IPAddressList([localhost]))
+    # Adding ip addresses that are already in the collection keeps it sorted
+    assert ip_list._is_sorted is True
+    ip_list.add(ip.IPAddress("::1"))
+    assert ip_list._is_sorted is False
+
+    with pytest.raises(ValueError):
+        ip_list.add_list(["127.0.0.1"])
+
+
+def test_list_set_operations():
+    localhost, loopback, ipv6 = [
+        ip.IPAddress(address) for address in ["localhost", "127.0.0.1", "::1"]
+    ]
+    ip_list = ip.IPAddressList([localhost, loopback])
+    other = ip.IPAddressList([ipv6, loopback])
+
+    assert (ip_list | other).list == [localhost, loopback, ipv6]
+    assert (ip_list & other).list == [loopback]
+    assert (ip_list - other).list == [localhost]
+    assert ip_list.difference([localhost]).list == [loopback]
+    # The operands are not modified
+    assert ip_list.list == [localhost, loopback]
+    assert other.list == [ipv6, loopback]
+
+
 def test_list_alive():
     alive_ips = [ip.IPAddress("127.0.0.1"), ip.IPAddress("localhost")]
     ip_list = ip.IPAddressList(alive_ips + [ip.IPAddress("doesnotexists.local")])
@@ -164,3 +206,114 @@ def test_list_to_list():
     extra_ip = ip.IPAddress("example.com")
     ip_list.add(extra_ip)
     assert ip_list.list == ips + [extra_ip]
+
+
+def test_best_address():
+    ip_list = ip.IPAddressList(
+        [
+            ip.IPAddress("127.0.0.1"),
+            ip.IPAddress("localhost"),
+            ip.IPAddress("doesnotexists.local"),
+        ]
+    )
+
+    start_time = dt.datetime.now()
+    best_ip = ip_list.get_best_address()
+    end_time = dt.datetime.now()
+
+    assert best_ip == ip.IPAddress("localhost")
+    process_time = end_time - start_time
+    assert process_time.total_seconds() < sshtools.tools.IP_PING_TIMEOUT + 1
+
+    assert ip.IPAddressList().get_best_address() is None
+    assert ip.IPAddressList([ip.IPAddress("doesnotexists")]).get_best_address() is None
+
+
+def test_ranked():
+    unreachable = ip.IPAddress("doesnotexists.invalid")
+    localhost = ip.IPAddress("localhost")
+    loopback = ip.IPAddress("127.0.0.1")
+    ip_list = ip.IPAddressList([unreachable, loopback, localhost])
+
+    ranked = list(ip_list.ranked())
+    assert ranked == sorted([loopback, localhost], key=ip.get_sort_value)
+    assert ip_list.get_best_address() == ranked[0]
+
+    ip_list.sort_ips()
+    assert ip_list.list == ranked + [unreachable]
+
+
+def test_backed_off_not_probed(monkeypatch):
+    history = sshtools.backoff.FailureHistory(
+        sshtools.cache.ProbeCache(sshtools.tools.get_tmp_dir() / "failures.json")
+    )
+    monkeypatch.setattr(sshtools.backoff, "get_history", lambda: history)
+    backed_off = ip.IPAddress("127.0.0.9")
+    for _ in range(sshtools.backoff.FAILURE_THRESHOLD):
+        history.record_failure(backed_off.ip_address)
+    ip_list = ip.IPAddressList([backed_off])
+
+    # The backoff window is open, so the address is not probed in the foreground
+    assert ip_list.get_best_address() is None
+    assert list(ip_list.ranked()) == []
+    assert ip_list.get_alive_addresses().list == []
+    assert backed_off.get_cached_ping() is None
+    assert history.get_failures(backed_off.ip_address)[0] == (
+        sshtools.backoff.FAILURE_THRESHOLD
+    )
+
+    # Background refreshes retry it
+    assert ip_list.get_alive_addresses(include_backed_off=True).list == [backed_off]
+    assert history.is_backed_off(backed_off.ip_address) is False
+
+
+def test_backoff_window_expired(monkeypatch):
+    history = sshtools.backoff.FailureHistory(
+        sshtools.cache.ProbeCache(sshtools.tools.get_tmp_dir() / "failures.json")
+    )
+    monkeypatch.setattr(sshtools.backoff, "get_history", lambda: history)
+    retried = ip.IPAddress("127.0.0.10")
+    for _ in range(sshtools.backoff.FAILURE_THRESHOLD):
+        history.record_failure(retried.ip_address)
+    history._cache.put(
+        retried.ip_address,
+        {"failures": sshtools.backoff.FAILURE_THRESHOLD, "last": time.time() - 3600},
+    )
+
+    assert ip.IPAddressList([retried]).get_best_address() == retried
+
+
+def test_unresolvable_not_sshable(monkeypatch):
+    unresolvable = ip.IPAddress("doesnotexists.invalid")
+    monkeypatch.setattr(ip.IPAddress, "is_alive", property(lambda _: True))
+
+    def ssh_banner(*_, **__):
+        raise AssertionError("An unresolvable address must not be connected to")
+
+    monkeypatch.setattr(sshtools.probe, "ssh_banner", ssh_banner)
+    assert unresolvable.is_sshable() is False
+    assert sshtools.cache.get_cache().get(unresolvable.ssh_cache_key) is False
+
+
+def test_sort_value_bound():
+    for ip_str in ["127.0.0.1", "localhost", "doesnotexists.local"]:
+        ip_address = ip.IPAddress(ip_str)
+        assert ip.get_sort_value_bound(ip_address) <= ip.get_sort_value(ip_address)
+
+
+def test_endpoints():
+    localhost = ip.IPAddress("localhost")
+    loopback = ip.IPAddress(localhost.resolved_address)
+    unresolvable = ip.IPAddress("doesnotexists.invalid")
+    ip_list = ip.IPAddressList([loopback, localhost, unresolvable, localhost])
+
+    endpoints = ip_list.get_endpoints()
+    assert endpoints == {
+        (loopback.ip_address, 22): [loopback, localhost],
+        ("doesnotexists.invalid", 22): [unresolvable],
+    }
+    assert localhost.ping_cache_key == loopback.ping_cache_key
+
+    # Aliases share the probe results of their endpoint
+    loopback.cache_ping(sshtools.ip_address.PingResult(True, 0.5), persist=False)
+    assert localhost.get_cached_ping() == loopback.get_cached_ping()
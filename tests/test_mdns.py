@@ -0,0 +1,97 @@
+import socket
+import struct
+import threading
+
+import sshtools.cache
+import sshtools.mdns
+import sshtools.resolver
+import sshtools.tools
+
+
+def build_response(question: bytes, name: str, address: str) -> bytes:
+    """Build a response with a compressed A record for the name"""
+    header = struct.pack("!6H", 0, sshtools.mdns.DNS_FLAG_RESPONSE, 1, 1, 0, 0)
+    # The name of the answer points to the name of the question
+    record = struct.pack("!HHHIH", 0xC000 | 12, 1, 1, 120, 4)
+    return header + question + record + socket.inet_aton(address)
+
+
+def serve_mdns(hosts: dict[str, str]) -> tuple[str, int]:
+    """Start a responder that answers the first query for the known hosts"""
+    responder = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    responder.bind(("127.0.0.1", 0))
+
+    def handle():
+        with responder:
+            data, client = responder.recvfrom(9000)
+            _, _, questions, *_ = struct.unpack_from("!6H", data)
+            offset = sshtools.mdns.DNS_HEADER_SIZE
+            for _ in range(questions):
+                name, end = sshtools.mdns.read_name(data, offset)
+                question = data[offset : end + 4]
+                offset = end + 4
+                if name in hosts:
+                    responder.sendto(
+                        build_response(question, name, hosts[name]), client
+                    )
+
+    threading.Thread(target=handle, daemon=True).start()
+    return responder.getsockname()
+
+
+def test_build_queries():
+    packets = sshtools.mdns.build_queries(["laptop.local", "pi.local"])
+    assert len(packets) == 1
+    assert struct.unpack_from("!6H", packets[0])[2] == 2
+    assert sshtools.mdns.read_name(packets[0], 12) == ("laptop.local", 12 + 14)
+
+    names = [f"device-{i}.local" for i in range(200)]
+    packets = sshtools.mdns.build_queries(names)
+    assert len(packets) > 1
+    assert all(len(packet) <= sshtools.mdns.MDNS_PACKET_SIZE for packet in packets)
+    assert sum(struct.unpack_from("!6H", packet)[2] for packet in packets) == 200
+
+
+def test_parse_response():
+    question = sshtools.mdns.encode_name("Laptop.local") + struct.pack("!HH", 1, 1)
+    response = build_response(question, "Laptop.local", "192.168.1.130")
+    assert sshtools.mdns.parse_response(response) == {"laptop.local": "192.168.1.130"}
+
+    assert (
+        sshtools.mdns.parse_response(sshtools.mdns.build_queries(["a.local"])[0]) == {}
+    )
+    assert sshtools.mdns.parse_response(response[:-2]) == {}
+    assert sshtools.mdns.parse_response(b"\x00") == {}
+
+
+def test_query():
+    target = serve_mdns({"laptop.local": "192.168.1.130", "pi.local": "192.168.1.60"})
+    answers = sshtools.mdns.query(
+        ["laptop.local", "pi.local", "absent.local"], timeout=0.5, target=target
+    )
+    assert answers == {"laptop.local": "192.168.1.130", "pi.local": "192.168.1.60"}
+
+
+def test_resolver(monkeypatch):
+    target = serve_mdns({"laptop.local": "192.168.1.130"})
+    monkeypatch.setattr(sshtools.mdns, "MDNS_ADDRESS", target)
+    cache = sshtools.cache.ProbeCache(sshtools.tools.get_tmp_dir() / "mdns.json")
+    resolver = sshtools.resolver.Resolver(cache)
+
+    looked_up: list[str] = []
+
+    async def getaddrinfo(name: str):
+        looked_up.append(name)
+        return "192.168.1.60" if name == "pi.local" else None
+
+    monkeypatch.setattr(sshtools.resolver, "getaddrinfo", getaddrinfo)
+
+    addresses = resolver.resolve_all(["laptop.local", "pi.local", "absent.local"])
+    assert addresses == {
+        "laptop.local": "192.168.1.130",
+        "pi.local": "192.168.1.60",
+        "absent.local": None,
+    }
+    # Names without an mDNS answer fall back to the system resolver
+    assert sorted(looked_up) == ["absent.local", "pi.local"]
+    assert resolver.get_cached("absent.local") == (True, None)
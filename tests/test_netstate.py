@@ -0,0 +1,36 @@
+import socket
+import struct
+
+import sshtools.netstate
+
+
+def test_snapshot():
+    state = sshtools.netstate.NetworkState(watch=False)
+    assert len(state.interfaces) > 0
+    assert "127.0.0.1" in state.get_addresses(socket.AF_INET)
+
+
+def test_on_change():
+    state = sshtools.netstate.NetworkState(watch=False)
+    changes = []
+    state.on_change(lambda: changes.append(state.generation))
+    generation = state.generation
+
+    state.update(dict(state.snapshot))
+    assert changes == []
+    assert state.generation == generation
+
+    state.update({"eth9": ((socket.AF_INET, "10.9.9.9"),)})
+    assert changes == [generation + 1]
+    assert state.get_addresses() == ["10.9.9.9"]
+    assert state.interfaces == ["eth9"]
+
+
+def test_parse_netlink_messages():
+    new_addr = struct.pack("=IHHII", 16, 20, 0, 0, 0)
+    del_link = struct.pack("=IHHII", 20, 17, 0, 0, 0) + b"\x00" * 4
+    assert sshtools.netstate.parse_netlink_messages(new_addr + del_link) == [
+        "RTM_NEWADDR",
+        "RTM_DELLINK",
+    ]
+    assert sshtools.netstate.parse_netlink_messages(b"") == []
@@ -0,0 +1,135 @@
+import errno
+import socket
+import threading
+
+import pytest
+
+from sshtools import probe
+
+
+def test_checksum():
+    # Example from RFC 1071
+    data = bytes([0x00, 0x01, 0xF2, 0x03, 0xF4, 0xF5, 0xF6, 0xF7])
+    assert probe.checksum(data) == 0x220D
+    assert probe.checksum(b"\x00\x01\x02") == probe.checksum(b"\x00\x01\x02\x00")
+
+
+def test_echo_request():
+    packet = probe.build_echo_request(1234, 42)
+    assert packet[0] == probe.ICMP_ECHO_REQUEST
+    assert probe.checksum(packet) == 0
+    assert packet.endswith(probe.ICMP_PAYLOAD)
+
+    packet_v6 = probe.build_echo_request(1234, 42, family=socket.AF_INET6)
+    assert packet_v6[0] == probe.ICMPV6_ECHO_REQUEST
+
+
+def test_parse_echo_reply():
+    request = probe.build_echo_request(1234, 42)
+    assert probe.parse_echo_reply(request) is None
+
+    reply = bytes([probe.ICMP_ECHO_REPLY]) + request[1:]
+    assert probe.parse_echo_reply(reply) == (1234, 42)
+
+    ip_header = bytes([0x45]) + bytes(19)
+    assert probe.parse_echo_reply(ip_header + reply, has_ip_header=True) == (1234, 42)
+    assert probe.parse_echo_reply(b"\x00") is None
+
+
+def test_resolve_address():
+    family, sockaddr = probe.resolve_address("127.0.0.1")
+    assert family == socket.AF_INET
+    assert sockaddr[0] == "127.0.0.1"
+    assert probe.resolve_address("doesnotexists.invalid") is None
+
+
+def test_ping():
+    try:
+        result = probe.ping("127.0.0.1", timeout=1)
+    except PermissionError:
+        pytest.skip("ICMP sockets are not permitted")
+    assert isinstance(result, probe.PingResult)
+    assert result.alive is True
+    assert 0 <= result.latency < 1000
+
+    result = probe.ping("doesnotexists.invalid", timeout=0.1)
+    assert result.alive is False
+    assert result.latency == float("inf")
+
+
+def serve_banner(lines: list[bytes]) -> int:
+    """Start a TCP server that sends some lines to the first client"""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen(1)
+
+    def handle():
+        with server:
+            client, _ = server.accept()
+            with client:
+                for line in lines:
+                    client.sendall(line)
+
+    threading.Thread(target=handle, daemon=True).start()
+    return server.getsockname()[1]
+
+
+def test_ssh_banner():
+    port = serve_banner([b"Welcome\r\n", b"SSH-2.0-OpenSSH_9.6\r\n"])
+    assert probe.ssh_banner("127.0.0.1", port=port, timeout=1) == "SSH-2.0-OpenSSH_9.6"
+
+    port = serve_banner([b"HTTP/1.1 400 Bad Request\r\n"])
+    assert probe.ssh_banner("127.0.0.1", port=port, timeout=1) is None
+
+
+def test_ssh_banner_closed_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as unused:
+        unused.bind(("127.0.0.1", 0))
+        port = unused.getsockname()[1]
+    assert probe.ssh_banner("127.0.0.1", port=port, timeout=1) is None
+    assert probe.ssh_banner("doesnotexists.invalid", timeout=1) is None
+
+
+def test_ping_many():
+    addresses = ["127.0.0.1", "localhost", "doesnotexists.invalid"]
+    try:
+        results = probe.ping_many(addresses, timeout=1)
+    except PermissionError:
+        pytest.skip("ICMP sockets are not permitted")
+    assert sorted(results.keys()) == sorted(addresses)
+    assert results["127.0.0.1"].alive is True
+    assert results["localhost"].alive is True
+    assert results["doesnotexists.invalid"].alive is False
+    assert results["doesnotexists.invalid"].latency == float("inf")
+
+    assert probe.ping_many([]) == {}
+
+
+def test_ping_many_resolves_concurrently(monkeypatch):
+    lookups: list[str] = []
+    resolve_address = probe.resolve_address
+
+    def record_lookup(address: str):
+        lookups.append(address)
+        return resolve_address(address)
+
+    monkeypatch.setattr(probe, "resolve_address", record_lookup)
+    try:
+        probe.ping_many(["localhost", "doesnotexists.invalid"], timeout=0.1)
+    except PermissionError:
+        pytest.skip("ICMP sockets are not permitted")
+    # Only the addresses found by the resolver are parsed into socket addresses
+    assert "localhost" not in lookups
+    assert "doesnotexists.invalid" not in lookups
+
+
+def test_icmp_unsupported(monkeypatch):
+    def open_socket(family: int):
+        raise OSError(errno.EAFNOSUPPORT, "Address family not supported by protocol")
+
+    monkeypatch.setattr(probe.IcmpSocket, "_open_socket", staticmethod(open_socket))
+    assert probe.ping("::1", timeout=0.1) == probe.PingResult(False, float("inf"))
+    assert probe.ping_many(["::1", "127.0.0.1"], timeout=0.1) == {
+        "::1": probe.PingResult(False, float("inf")),
+        "127.0.0.1": probe.PingResult(False, float("inf")),
+    }
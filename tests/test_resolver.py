@@ -0,0 +1,54 @@
+import asyncio
+
+import sshtools.cache
+import sshtools.resolver
+import sshtools.tools
+
+
+def create_resolver() -> sshtools.resolver.Resolver:
+    cache = sshtools.cache.ProbeCache(sshtools.tools.get_tmp_dir() / "resolver.json")
+    return sshtools.resolver.Resolver(cache)
+
+
+def test_is_numeric():
+    assert sshtools.resolver.is_numeric("127.0.0.1")
+    assert sshtools.resolver.is_numeric("fe80::1%eth0")
+    assert not sshtools.resolver.is_numeric("localhost")
+
+
+def test_resolve_all():
+    resolver = create_resolver()
+    addresses = resolver.resolve_all(
+        ["127.0.0.1", "localhost", "doesnotexists.invalid"]
+    )
+    assert addresses["127.0.0.1"] == "127.0.0.1"
+    assert addresses["localhost"] in ("127.0.0.1", "::1")
+    assert addresses["doesnotexists.invalid"] is None
+
+
+def test_cache():
+    resolver = create_resolver()
+    assert resolver.get_cached("laptop-hostname") == (False, None)
+
+    resolver.store("laptop-hostname", "1.1.1.130")
+    assert resolver.get_cached("laptop-hostname") == (True, "1.1.1.130")
+    assert resolver.resolve("laptop-hostname") == "1.1.1.130"
+
+    resolver.store("pi-hostname", None)
+    assert resolver.get_cached("pi-hostname") == (True, None)
+    assert resolver.resolve("pi-hostname") is None
+
+    resolver.store("pi-hostname", "4.4.4.60", ttl=-1)
+    assert resolver.get_cached("pi-hostname") == (False, None)
+
+
+def test_timeout_not_cached(monkeypatch):
+    async def hanging_getaddrinfo(_):
+        await asyncio.sleep(1)
+
+    monkeypatch.setattr(sshtools.resolver, "getaddrinfo", hanging_getaddrinfo)
+    resolver = create_resolver()
+    assert resolver.resolve_all(["laptop-hostname"], timeout=0.01) == {
+        "laptop-hostname": None
+    }
+    assert resolver.get_cached("laptop-hostname") == (False, None)
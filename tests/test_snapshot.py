@@ -0,0 +1,50 @@
+import os
+import shutil
+
+import sshtools.connection
+import sshtools.device
+import sshtools.snapshot
+import sshtools.tools
+
+
+def copy_config() -> tuple:
+    """Copy the test configuration, so it can be modified"""
+    config_dir = sshtools.tools.get_tmp_dir() / "config"
+    shutil.rmtree(config_dir, ignore_errors=True)
+    shutil.copytree(sshtools.tools.CONFIG_DIR, config_dir)
+    return config_dir / "devices", config_dir / "networks"
+
+
+def test_snapshot():
+    devices_dir, networks_dir = copy_config()
+    path = sshtools.tools.get_tmp_dir() / "snapshot.json"
+    path.unlink(missing_ok=True)
+
+    snapshot = sshtools.snapshot.ConfigSnapshot(path, devices_dir, networks_dir)
+    assert snapshot.devices["laptop"]["hostname"] == "laptop-hostname"
+    assert "home" in snapshot.networks
+    snapshot.set_compiled("laptop", {"interfaces": [], "connections": []})
+    snapshot.save()
+
+    warm_snapshot = sshtools.snapshot.ConfigSnapshot(path, devices_dir, networks_dir)
+    assert warm_snapshot.devices == snapshot.devices
+    assert warm_snapshot.get_compiled("laptop") == snapshot.get_compiled("laptop")
+
+    # Changing a configuration file invalidates the snapshot
+    laptop_path = devices_dir / "laptop.json"
+    stat = laptop_path.stat()
+    os.utime(laptop_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    changed_snapshot = sshtools.snapshot.ConfigSnapshot(path, devices_dir, networks_dir)
+    assert changed_snapshot.get_compiled("laptop") is None
+    assert changed_snapshot.devices == snapshot.devices
+
+
+def test_compiled_device():
+    laptop = sshtools.device.Device("laptop")
+    compiled = sshtools.snapshot.get_snapshot().get_compiled("laptop")
+    assert [connection["ip_address"] for connection in compiled["connections"]] == [
+        str(ip_address) for ip_address in laptop.ip_address_list_all
+    ]
+    assert [iface["name"] for iface in compiled["interfaces"]] == [
+        iface.name for iface in laptop.interfaces
+    ]
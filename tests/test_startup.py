@@ -0,0 +1,65 @@
+import json
+import os
+import re
+import subprocess
+import sys
+
+import sshtools.profiling
+import sshtools.tools
+
+# The maximum number of milliseconds from importing sshtools until the first probe
+STARTUP_BUDGET: float = 1500
+
+SETUP = f"""
+import sys
+import timtools.bash, timtools.locations, timtools.log, timtools.multithreading
+before = set(sys.modules)
+import sshtools.tools
+sshtools.tools.CONFIG_DIR = sshtools.tools.PROJECT_DIR.parent / "config_test"
+sshtools.tools.CACHE_DIR = sshtools.tools.Path({str(sshtools.tools.get_tmp_dir())!r})
+"""
+
+
+def run_python(code: str, profile: bool = False) -> subprocess.CompletedProcess:
+    """Run python code in a fresh interpreter"""
+    env = dict(os.environ, SSHTOOLS_NO_DAEMON="1")
+    if profile:
+        env[sshtools.profiling.PROFILE_ENV] = "1"
+    return subprocess.run(
+        [sys.executable, "-c", SETUP + code],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+        timeout=60,
+    )
+
+
+def test_lazy_imports():
+    result = run_python(
+        "import json, sshtools.getip\n"
+        "print(json.dumps(sorted(set(sys.modules) - before)))"
+    )
+    loaded = json.loads(result.stdout.splitlines()[-1])
+    assert "sshtools.getip" in loaded
+    for module in ["tabulate", "psutil", "sshtools.pathfinder", "sshtools.sshin"]:
+        assert module not in loaded
+
+
+def test_startup_budget():
+    result = run_python(
+        "import sshtools.getip, sshtools.device, sshtools.probe\n"
+        "sshtools.device.Device('pi').get_possible_ips()\n"
+        "try:\n"
+        "    sshtools.probe.ping('127.0.0.1', timeout=0.5)\n"
+        "except PermissionError:\n"
+        "    pass\n"
+        # Report every module, which ones are the slowest depends on the machine
+        "sshtools.profiling.PROFILE_TOP = len(sys.modules)\n",
+        profile=True,
+    )
+    assert "Slowest imports" in result.stderr
+    assert "sshtools.getip" in result.stderr.split("Slowest imports")[1]
+    first_probe = re.search(r"first probe: ([\d.]+) ms", result.stderr)
+    assert first_probe is not None
+    assert float(first_probe.group(1)) < STARTUP_BUDGET
@@ -0,0 +1,48 @@
+import pytest
+
+import sshtools.connection
+import sshtools.device
+import sshtools.errors
+import sshtools.store
+import sshtools.tools
+
+
+def create_store() -> sshtools.store.ConfigStore:
+    path = sshtools.tools.get_tmp_dir() / sshtools.store.STORE_NAME
+    count = sshtools.store.import_directories(
+        path, sshtools.device.DEVICES_DIR, sshtools.connection.NETWORK_DIR
+    )
+    assert count == len(list(sshtools.device.DEVICES_DIR.iterdir()))
+    return sshtools.store.ConfigStore(path)
+
+
+def test_store():
+    store = create_store()
+    snapshot_devices = sshtools.device.DeviceConfig._get_config_all()
+    assert store.get_devices() == snapshot_devices
+    assert store.get_networks() == sshtools.connection.Network._get_config_all()
+    assert store.get_device("laptop") == snapshot_devices["laptop"]
+    assert store.get_device("doesnotexist") is None
+
+    assert store.get_name("laptop") == "laptop"
+    assert store.get_name("laptop-hostname") == "laptop"
+    assert store.get_name("desktop-container") == "desktop"
+    assert store.get_name("doesnotexist") is None
+    # The store matches the index built from the configuration directories
+    for hostname, name in sshtools.device.DeviceConfig._get_name_index().items():
+        assert store.get_name(hostname) == name
+
+
+def test_device_config(monkeypatch):
+    store = create_store()
+    monkeypatch.setattr(sshtools.store, "get_store", lambda: store)
+    monkeypatch.setattr(sshtools.device.DeviceConfig, "_DeviceConfig__config_all", None)
+
+    config = sshtools.device.DeviceConfig.get_config("laptop")
+    assert config["hostname"] == "laptop-hostname"
+    assert sshtools.device.DeviceConfig.get_name_from_hostname("laptop-hostname") == (
+        "laptop"
+    )
+    assert sshtools.device.DeviceConfig.get_name_from_hostname("unknown") == "unknown"
+    with pytest.raises(sshtools.errors.DeviceNotFoundError):
+        sshtools.device.DeviceConfig.get_config("doesnotexist")
@@ -0,0 +1,113 @@
+import datetime as dt
+import json
+
+import pytest
+
+import sshtools.cache
+import sshtools.connection
+import sshtools.hints
+import sshtools.ip
+import sshtools.probe
+import sshtools.resolver
+import sshtools.tailscale
+import sshtools.tools
+
+STATUS = {
+    "Self": {"DNSName": "self.tailf057c.ts.net.", "Online": True},
+    "MagicDNSSuffix": "tailf057c.ts.net",
+    "Peer": {
+        "nodekey:1": {
+            "DNSName": "laptop.tailf057c.ts.net.",
+            "HostName": "laptop",
+            "TailscaleIPs": ["fd7a:115c:a1e0::1", "100.64.0.130"],
+            "Online": True,
+            "LastSeen": "0001-01-01T00:00:00Z",
+        },
+        "nodekey:2": {
+            "DNSName": "pi.tailf057c.ts.net.",
+            "HostName": "pi",
+            "TailscaleIPs": ["100.64.0.60"],
+            "Online": False,
+            "LastSeen": "2024-03-01T12:30:45.123456789Z",
+        },
+    },
+}
+
+
+@pytest.fixture
+def tailscale_status(monkeypatch):
+    status_path = sshtools.tools.get_tmp_dir() / "tailscale.json"
+    with open(status_path, "w", encoding="utf-8") as status_file:
+        json.dump(STATUS, status_file)
+    monkeypatch.setenv(sshtools.tailscale.TAILSCALE_STATUS_ENV, str(status_path))
+    sshtools.tailscale.get_peers.cache_clear()
+    yield
+    sshtools.tailscale.get_peers.cache_clear()
+
+
+def test_parse_status():
+    peers = sshtools.tailscale.parse_status(STATUS)
+    assert set(peers) == {"laptop.tailf057c.ts.net", "pi.tailf057c.ts.net"}
+
+    laptop = peers["laptop.tailf057c.ts.net"]
+    assert laptop.online is True
+    assert laptop.last_seen is None
+    assert laptop.address == "100.64.0.130"
+
+    pi = peers["pi.tailf057c.ts.net"]
+    assert pi.online is False
+    assert pi.last_seen == dt.datetime(2024, 3, 1, 12, 30, 45, tzinfo=dt.timezone.utc)
+
+    assert sshtools.tailscale.parse_status({}) == {}
+
+
+def test_get_peer(tailscale_status):
+    assert sshtools.tailscale.get_peer("laptop.tailf057c.ts.net").online is True
+    beta_name = "pi.tim-mees83.gmail.com.beta.tailscale.net"
+    assert sshtools.tailscale.get_peer(beta_name).online is False
+    assert sshtools.tailscale.get_peer("unknown.tailf057c.ts.net") is None
+    assert sshtools.tailscale.get_peer("laptop.local") is None
+
+
+def test_known_ping(tailscale_status):
+    pi = sshtools.ip.IPAddress("pi.tailf057c.ts.net")
+    assert sshtools.tailscale.get_known_ping(str(pi)) == sshtools.probe.PingResult(
+        False, float("inf")
+    )
+    # Offline peers are not probed
+    assert pi.is_alive is False
+
+    # Online peers are not probed either, without a known round trip time
+    # a nominal latency is assumed
+    laptop = sshtools.ip.IPAddress("laptop.tailf057c.ts.net")
+    assert sshtools.tailscale.get_known_ping(str(laptop)) == sshtools.probe.PingResult(
+        True, sshtools.hints.HINT_LATENCY
+    )
+    assert laptop.is_alive is True
+    assert sshtools.tailscale.get_known_ping("unknown.tailf057c.ts.net") is None
+
+
+def test_known_ping_latency(tailscale_status, monkeypatch):
+    monkeypatch.setattr(sshtools.connection.Network, "_Network__rtt_estimators", {})
+    sshtools.connection.Network.update_configs(
+        {"tailnet": {"name": "tailnet", "prefix": "100.64.0.0/10", "vpn": True}}
+    )
+    try:
+        sshtools.connection.Network("tailnet").rtt.add_sample(0.02)
+        # The round trip time of the network of the Tailscale address is used
+        assert sshtools.tailscale.get_known_ping(
+            "laptop.tailf057c.ts.net"
+        ) == sshtools.probe.PingResult(True, 20)
+    finally:
+        sshtools.connection.Network.update_configs({"tailnet": None})
+
+
+def test_resolver(tailscale_status):
+    cache = sshtools.cache.ProbeCache(
+        sshtools.tools.get_tmp_dir() / "tailscale_resolver.json"
+    )
+    resolver = sshtools.resolver.Resolver(cache)
+    assert resolver.resolve_all(["laptop.tailf057c.ts.net", "pi.tailf057c.ts.net"]) == {
+        "laptop.tailf057c.ts.net": "100.64.0.130",
+        "pi.tailf057c.ts.net": "100.64.0.60",
+    }
@@ -0,0 +1,150 @@
+import json
+import queue
+import shutil
+import threading
+
+import pytest
+
+import sshtools.cache
+import sshtools.config
+import sshtools.device
+import sshtools.tools
+import sshtools.watcher
+
+
+def test_parse_events():
+    data = b"".join(
+        [
+            sshtools.watcher.EVENT_HEADER.pack(
+                1, sshtools.watcher.IN_CLOSE_WRITE, 0, 16
+            ),
+            b"laptop.json".ljust(16, b"\0"),
+            sshtools.watcher.EVENT_HEADER.pack(2, sshtools.watcher.IN_DELETE, 0, 0),
+        ]
+    )
+    assert sshtools.watcher.parse_events(data) == [
+        (1, sshtools.watcher.IN_CLOSE_WRITE, "laptop.json"),
+        (2, sshtools.watcher.IN_DELETE, ""),
+    ]
+
+
+def test_apply_changes():
+    laptop = sshtools.device.Device("laptop")
+    original = sshtools.device.DeviceConfig.get_config("laptop")
+    fleet = sshtools.device.DeviceConfig.get_fleet()
+    ip_address = laptop.ip_address_list_all.list[0]
+    sshtools.cache.get_cache().put(ip_address.ping_cache_key, [True, 1])
+
+    changed = {**original, "ssh_port": 2222, "container_hostnames": ["laptop-box"]}
+    try:
+        affected = sshtools.watcher.apply_changes({"laptop": changed}, {})
+        assert affected == {"laptop"}
+        # The device is rebuilt in place and its probe results are forgotten
+        assert laptop.config.ssh_port == 2222
+        assert all(address.ssh_port == 2222 for address in laptop.ip_address_list_all)
+        assert sshtools.cache.get_cache().get(ip_address.ping_cache_key) is None
+        # The indexes and the fleet are rebuilt
+        assert sshtools.device.DeviceConfig.get_fleet() is not fleet
+        assert sshtools.device.DeviceConfig.get_name_from_hostname("laptop-box") == (
+            "laptop"
+        )
+    finally:
+        sshtools.watcher.apply_changes({"laptop": original}, {})
+    assert laptop.config.ssh_port == original.get("ssh_port", "22")
+
+
+def test_invalid_changes():
+    laptop = sshtools.device.Device("laptop")
+    pi = sshtools.device.Device("pi")
+    laptop_config = sshtools.device.DeviceConfig.get_config("laptop")
+    pi_config = sshtools.device.DeviceConfig.get_config("pi")
+
+    # An unknown network breaks the laptop, the pi is still rebuilt
+    broken = {**laptop_config, "connections": [{"network": "unknown"}]}
+    changed = {**pi_config, "ssh_port": 2222}
+    try:
+        affected = sshtools.watcher.apply_changes({"laptop": broken, "pi": changed}, {})
+        assert affected == {"laptop", "pi"}
+        assert pi.config.ssh_port == 2222
+    finally:
+        sshtools.watcher.apply_changes({"laptop": laptop_config, "pi": pi_config}, {})
+    assert sshtools.device.Device("laptop") is not laptop
+    assert sshtools.device.Device("laptop").config.ssh_port == laptop.config.ssh_port
+
+
+def test_reload_waits_for_readers():
+    pi_config = sshtools.device.DeviceConfig.get_config("pi")
+    applied = threading.Event()
+
+    def apply():
+        sshtools.watcher.apply_changes({"pi": {**pi_config, "ssh_port": 2222}}, {})
+        applied.set()
+
+    thread = threading.Thread(target=apply)
+    try:
+        with sshtools.config.CONFIG_LOCK:
+            thread.start()
+            # A reader holding the lock never sees a partially applied change
+            assert not applied.wait(0.1)
+            assert sshtools.device.DeviceConfig.get_config("pi") == pi_config
+        thread.join(5)
+        assert applied.is_set()
+    finally:
+        sshtools.watcher.apply_changes({"pi": pi_config}, {})
+
+
+def test_reload_invalid_file():
+    config_dir = sshtools.tools.get_tmp_dir() / "invalid_config"
+    shutil.copytree(sshtools.tools.CONFIG_DIR, config_dir)
+    pi_path = config_dir / "devices" / "pi.json"
+    original = json.loads(pi_path.read_text(encoding="utf-8"))
+    watcher = sshtools.watcher.ConfigWatcher(
+        devices_dir=config_dir / "devices",
+        networks_dir=config_dir / "networks",
+        store_path=config_dir / "fleet.sqlite",
+    )
+
+    (config_dir / "devices" / "laptop.json").write_text("{", encoding="utf-8")
+    pi_path.write_text(json.dumps({**original, "mosh": False}), encoding="utf-8")
+    try:
+        assert watcher.reload(list((config_dir / "devices").iterdir())) == {"pi"}
+        assert sshtools.device.Device("pi").config.mosh is False
+    finally:
+        sshtools.watcher.apply_changes({"pi": original}, {})
+
+
+def test_watcher():
+    config_dir = sshtools.tools.get_tmp_dir() / "watched_config"
+    shutil.rmtree(config_dir, ignore_errors=True)
+    shutil.copytree(sshtools.tools.CONFIG_DIR, config_dir)
+    laptop_path = config_dir / "devices" / "laptop.json"
+    original = json.loads(laptop_path.read_text(encoding="utf-8"))
+
+    reloads: queue.Queue = queue.Queue()
+    watcher = sshtools.watcher.ConfigWatcher(
+        on_reload=reloads.put,
+        devices_dir=config_dir / "devices",
+        networks_dir=config_dir / "networks",
+        store_path=config_dir / "fleet.sqlite",
+    )
+    try:
+        watcher.start()
+    except OSError as error:
+        pytest.skip(f"inotify is not available: {error}")
+
+    try:
+        laptop_path.write_text(
+            json.dumps({**original, "mosh": False}), encoding="utf-8"
+        )
+        assert reloads.get(timeout=5) == {"laptop"}
+        assert sshtools.device.Device("laptop").config.mosh is False
+
+        # Files that do not change the configuration are ignored
+        (config_dir / "devices" / "pi.json").touch()
+        laptop_path.write_text(json.dumps(original), encoding="utf-8")
+        assert reloads.get(timeout=5) == {"laptop"}
+        assert sshtools.device.Device("laptop").config.mosh == original.get(
+            "mosh", True
+        )
+    finally:
+        watcher.stop()